@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-# import os
+import os
 import json
 
 
@@ -71,7 +71,10 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 MIDDLEWARE = [
+    'books.middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # 要在 SessionMiddleware 之前，保存会话也算作写入
+    'books.replicas.StickyPrimaryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,8 +89,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # 模板编译一次后缓存在进程内；DEBUG 下修改模板文件时自动重新加载
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -105,6 +114,10 @@ LOGOUT_REDIRECT_URL = '/login/' #redirect to login page after quit
 
 WSGI_APPLICATION = 'LibMange.wsgi.application'
 
+# 用 ASGI 服务器部署时设置 LIBMANGE_ASYNC_VIEWS=1，图书列表、详情、首页、通知、
+# 我的借阅改用 books.async_views 中的异步视图；WSGI 部署保持关闭
+ASYNC_VIEWS = os.environ.get('LIBMANGE_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -120,6 +133,128 @@ DATABASES = {
     }
 }
 
+# 只读副本：LIBMANGE_DB_REPLICAS=10.0.0.2,10.0.0.3，账号与主库相同
+REPLICA_ALIASES = []
+for i, host in enumerate(filter(None, os.environ.get('LIBMANGE_DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{i}'] = dict(DATABASES['default'], HOST=host)
+    REPLICA_ALIASES.append(f'replica{i}')
+
+# 本地性能测试可以切换到 SQLite：LIBMANGE_DB=sqlite LIBMANGE_SQLITE_PATH=bench.sqlite3
+# 设置 LIBMANGE_SQLITE_REPLICA_PATH 时另一个 SQLite 文件充当副本；测试中主库和副本是两个文件
+if os.environ.get('LIBMANGE_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('LIBMANGE_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'TEST': {'NAME': BASE_DIR / 'test_primary.sqlite3'},
+        },
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('LIBMANGE_SQLITE_REPLICA_PATH', BASE_DIR / 'db-replica.sqlite3'),
+            'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+        },
+    }
+    REPLICA_ALIASES = ['replica'] if os.environ.get('LIBMANGE_SQLITE_REPLICA_PATH') else []
+
+# 数据库路由（books.replicas）：只读视图的读取发往副本，写入后 STICKY_SECONDS 秒内
+# 该浏览器的读取留在主库；副本每 HEALTH_CHECK_SECONDS 秒检查一次，
+# 连不上或复制延迟超过 MAX_LAG_SECONDS 秒时暂停使用
+DATABASE_ROUTERS = ['books.replicas.PrimaryReplicaRouter']
+DATABASE_REPLICATION = {
+    'REPLICAS': REPLICA_ALIASES,
+    'STICKY_SECONDS': 15,
+    'HEALTH_CHECK_SECONDS': 10,
+    'MAX_LAG_SECONDS': 5,
+}
+
+
+# Cache
+# 未读通知计数等数据缓存在这里。多进程部署时请换成 Redis/Memcached 等
+# 进程间共享的缓存，否则各进程的未读数缓存只能等超时后才会刷新。
+# 按模型版本缓存的视图数据（books.caching）的版本号在数据库中，不受此影响
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'libmange',
+    }
+}
+
+
+# 请求性能统计（books.middleware.RequestProfilingMiddleware）
+# QUERY_BUDGETS 按 URL 名称设置每个请求允许的 SQL 数量，超出时记录警告日志，
+# 测试中可以用 books.testing.QueryBudgetMixin 断言。
+# 统计只在 DEBUG 下启用；生产环境需要排查时设置 LIBMANGE_REQUEST_PROFILING=1，
+# 此时所有响应都会带上 Server-Timing 头
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('LIBMANGE_REQUEST_PROFILING') == '1',
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+    'QUERY_BUDGETS': {
+        'index': 8,
+        'library_status': 8,
+        'book_list': 8,
+        'book_detail': 8,
+        'my_borrowings': 6,
+        'notification_list': 6,
+        'statistics': 12,
+        # 个人中心：会话、用户各一条，面板缓存未命中时再四条（见 books.dashboard）
+        'profile': 6,
+        # 目录接口：会话、用户、缓存版本号（ETag）各一条，数据一条；按检索词查询时
+        # 另有两条倒排索引查询
+        'api_books': 6,
+        'api_book_detail': 4,
+        'api_categories': 4,
+        'api_availability': 4,
+    },
+}
+
+# 通知发件箱（books.outbox）：业务事务里只写发件箱，由常驻的投递进程投递：
+#     python manage.py run_notification_worker --watch
+# CHANNELS 为 渠道名 -> 渠道类，新写入的通知会为每个渠道各生成一条待投递消息；
+# 失败后等待 BACKOFF_SECONDS × 2^(n-1) 秒（不超过 MAX_BACKOFF_SECONDS）重试。
+# 开发环境没有运行投递进程时，设置 LIBMANGE_OUTBOX_DELIVER_ON_COMMIT=1 在事务提交后立即投递
+NOTIFICATION_OUTBOX = {
+    'CHANNELS': {
+        'in_app': 'books.outbox.InAppChannel',
+        # 'email': 'books.outbox.EmailChannel',
+    },
+    'DELIVER_ON_COMMIT': os.environ.get('LIBMANGE_OUTBOX_DELIVER_ON_COMMIT') == '1',
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_SECONDS': 30,
+    'MAX_BACKOFF_SECONDS': 3600,
+    'LEASE_SECONDS': 300,
+}
+
+# 实时通知（books.live）：本进程的通知即时推送，其他进程的通知每 POLL_SECONDS 秒轮询发现。
+# 页面只在 ASGI 下打开实时连接；WSGI 下每 FALLBACK_POLL_SECONDS 秒轮询一次未读数
+NOTIFICATION_STREAM = {
+    'POLL_SECONDS': 5,
+    'HEARTBEAT_SECONDS': 15,
+    'MAX_STREAM_SECONDS': 60,
+    'FALLBACK_POLL_SECONDS': 30,
+}
+
+# 邮件：默认输出到控制台；本地演练重试可以用会随机失败的 books.testing.FlakyEmailBackend
+EMAIL_BACKEND = os.environ.get('LIBMANGE_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'library@example.com'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'books.performance': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -161,6 +296,10 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
 
+# 用户上传的文件（头像）；头像缩略图由 /avatars/ 提供，见 books.avatars
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.environ.get('LIBMANGE_MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
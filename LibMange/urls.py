@@ -14,12 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
-from books import views
+from books import views, async_views, api
+
+# 读多写少的页面在 ASGI 下使用异步实现（settings.ASYNC_VIEWS）
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
+    # 自定义的后台页面需要放在 admin.site.urls 之前，否则会被后台的兜底路由拦截
+    path('admin/messages/', views.admin_message_list, name='admin_message_list'),
+    path('admin/messages/users/', views.admin_user_search, name='admin_user_search'),
+    path('admin/messages/progress/', views.admin_broadcast_progress, name='admin_broadcast_progress'),
     path('admin/', admin.site.urls),
     path('books/', include('books.urls')),
     path('login/', auth_views.LoginView.as_view(template_name='accounts/login.html'), name='login'),
@@ -27,12 +35,23 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('avatars/<slug:digest>/<str:name>', views.avatar, name='avatar'),
     path('library-status/', views.library_status, name='library_status'),
     path('statistics/', views.statistics_view, name='statistics'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
+    path('request-stats/', views.request_stats, name='request_stats'),
+    path('exports/borrowings/', views.export_borrowings, name='export_borrowings'),
+    path('exports/catalog/', views.export_catalog, name='export_catalog'),
     path('passwordReset/', auth_views.PasswordResetView.as_view(), name='password_reset'),
-    path('notifications/', views.notification_list, name='notification_list'),
+    path('notifications/', read_views.notification_list, name='notification_list'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
+    path('notifications/unread/', views.unread_notification_count, name='unread_notification_count'),
     path('notifications/mark-read/<int:pk>/', views.mark_notification_read, name='mark_notification_read'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
     path('admin/permissions/', views.manage_permissions, name='manage_permissions'),
-    path('', views.index, name='index'), 
+    path('api/books/', api.book_list, name='api_books'),
+    path('api/books/<int:pk>/', api.book_detail, name='api_book_detail'),
+    path('api/categories/', api.category_list, name='api_categories'),
+    path('api/availability/', api.availability, name='api_availability'),
+    path('', read_views.index, name='index'), 
 ]
@@ -5,8 +5,10 @@ from django.contrib.auth.models import User, Group, Permission
 from .models import (
     Book, Category, BookBorrowing, BookReturn, 
     BookReservation, BookComment, BookRecommendation, 
-    UserProfile, Notification, 
+    UserProfile, Notification, BroadcastMessage, NotificationOutbox,
 )
+from .notifications import set_read_state, reset_unread_counts
+from . import outbox
 
 # 注册通知模型
 @admin.register(Notification)
@@ -20,15 +22,30 @@ class NotificationAdmin(admin.ModelAdmin):
     actions = ['mark_as_read', 'mark_as_unread']
     
     def mark_as_read(self, request, queryset):
-        queryset.update(is_read=True)
-        self.message_user(request, f'已将 {queryset.count()} 条通知标记为已读')
+        updated = set_read_state(queryset, is_read=True)
+        self.message_user(request, f'已将 {updated} 条通知标记为已读')
     mark_as_read.short_description = '标记为已读'
     
     def mark_as_unread(self, request, queryset):
-        queryset.update(is_read=False)
-        self.message_user(request, f'已将 {queryset.count()} 条通知标记为未读')
+        updated = set_read_state(queryset, is_read=False)
+        self.message_user(request, f'已将 {updated} 条通知标记为未读')
     mark_as_unread.short_description = '标记为未读'
     
+    # 后台直接增删改通知后，重建相关用户的未读计数
+    def save_model(self, request, obj, form, change):
+        previous_recipient = form.initial.get('recipient') if change else None
+        super().save_model(request, obj, form, change)
+        reset_unread_counts({obj.recipient_id, previous_recipient} - {None})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        reset_unread_counts([obj.recipient_id])
+
+    def delete_queryset(self, request, queryset):
+        user_ids = set(queryset.values_list('recipient_id', flat=True))
+        super().delete_queryset(request, queryset)
+        reset_unread_counts(user_ids)
+
     def has_add_permission(self, request):
         # 允许添加通知
         return True
@@ -37,6 +54,38 @@ class NotificationAdmin(admin.ModelAdmin):
         # 允许修改通知
         return True
 
+@admin.register(BroadcastMessage)
+class BroadcastMessageAdmin(admin.ModelAdmin):
+    list_display = ('title', 'target', 'group', 'sender', 'status', 'sent_count', 'total_recipients', 'progress_display', 'created_at')
+    list_filter = ('status', 'target', 'created_at')
+    search_fields = ('title', 'message')
+    readonly_fields = ('sender', 'status', 'total_recipients', 'sent_count', 'last_user_id', 'started_at', 'finished_at')
+    autocomplete_fields = ('recipients',)
+
+    def progress_display(self, obj):
+        return f'{obj.progress}%'
+    progress_display.short_description = '发送进度'
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.sender = request.user
+        super().save_model(request, obj, form, change)
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('title', 'recipient', 'channel', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'channel')
+    search_fields = ('recipient__username', 'title')
+    list_select_related = ('recipient',)
+    raw_id_fields = ('recipient', 'related_book')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    actions = ['retry_failed']
+
+    def retry_failed(self, request, queryset):
+        updated = outbox.retry_failed(queryset)
+        self.message_user(request, f'已将 {updated} 条投递失败的消息重新排队')
+    retry_failed.short_description = '重新投递失败的消息'
+
 # 注册权限模型
 @admin.register(Permission)
 class PermissionAdmin(admin.ModelAdmin):
@@ -76,11 +125,32 @@ class CategoryAdmin(admin.ModelAdmin):
     list_filter = ('parent',)
     search_fields = ('name', 'code')
 
+class EffectiveStatusFilter(admin.SimpleListFilter):
+    """按实际状态过滤，逾期按应还时间实时判断"""
+    title = '借阅状态'
+    parameter_name = 'effective_status'
+
+    def lookups(self, request, model_admin):
+        return BookBorrowing.STATUS_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.with_status(self.value())
+        return queryset
+
 @admin.register(BookBorrowing)
 class BookBorrowingAdmin(admin.ModelAdmin):
-    list_display = ('book', 'borrower', 'borrowed_date', 'due_date', 'status', 'returned')
-    list_filter = ('status', 'returned', 'borrowed_date')
+    list_display = ('book', 'borrower', 'borrowed_date', 'due_date', 'effective_status_display', 'returned')
+    list_filter = (EffectiveStatusFilter, 'returned', 'borrowed_date')
     search_fields = ('book__title', 'borrower__username')
+    list_select_related = ('book', 'borrower')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_effective_status()
+
+    @admin.display(description='借阅状态', ordering='effective_status')
+    def effective_status_display(self, obj):
+        return obj.get_effective_status_display()
 
 @admin.register(BookReturn)
 class BookReturnAdmin(admin.ModelAdmin):
@@ -90,9 +160,11 @@ class BookReturnAdmin(admin.ModelAdmin):
 
 @admin.register(BookReservation)
 class BookReservationAdmin(admin.ModelAdmin):
-    list_display = ('book', 'reservationer', 'reservation_date', 'returned')
-    list_filter = ('returned', 'reservation_date')
+    list_display = ('book', 'reservationer', 'position', 'status', 'reservation_date', 'hold_expires_at')
+    list_filter = ('status', 'reservation_date')
     search_fields = ('book__title', 'reservationer__username')
+    list_select_related = ('book', 'reservationer')
+    raw_id_fields = ('book', 'reservationer')
 
 @admin.register(BookComment)
 class BookCommentAdmin(admin.ModelAdmin):
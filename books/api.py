@@ -0,0 +1,209 @@
+"""
+只读的 JSON 目录接口
+
+供自助借还机和移动端使用，代替抓取图书列表、详情页面的 HTML：
+
+- /api/books/：图书列表，与图书列表页相同的检索和过滤（q、category、available），
+  游标分页（cursor、page_size）；带 ids 或 isbn 参数时按主键或 ISBN 批量读取，
+  一次请求最多 MAX_BATCH 本；
+- /api/books/<id>/：单本图书；
+- /api/categories/：全部分类；
+- /api/availability/：按 ids 或 isbn 批量查询可借数量。
+
+查询只用 values() 取需要的列，不构造模型实例，分类名称在同一条 SQL 里 JOIN 出来；
+每个接口的数据查询都只有一条，批量读取的本数不影响查询次数。
+?fields=title,isbn 选择返回的字段，可选字段见各 *_FIELDS。
+
+只读接口，查询发往只读副本（见 replicas）。
+ETag 由 Book、Category 的缓存版本号生成（见 caching），数据未变化时带
+If-None-Match 的请求直接返回 304，不查询目录数据。
+"""
+import functools
+import hashlib
+
+from django.core import exceptions
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+
+from .forms import BookSearchForm
+from .models import Book, Category
+from .pagination import paginate
+from .views import filter_books
+from . import caching, replicas
+
+# 返回格式变化时修改，让客户端缓存的旧 ETag 失效
+API_VERSION = 1
+
+MAX_BATCH = 100
+
+# 对外字段名 -> values() 的列
+BOOK_FIELDS = {
+    'id': 'id',
+    'isbn': 'isbn',
+    'title': 'title',
+    'author': 'author',
+    'category_id': 'category_id',
+    'category': 'category__name',
+    'quantity': 'quantity',
+    'available': 'available',
+    'description': 'description',
+    'created_at': 'created_at',
+    'updated_at': 'update_at',
+}
+DEFAULT_BOOK_FIELDS = ('id', 'isbn', 'title', 'author', 'category', 'available')
+
+CATEGORY_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'code': 'code',
+    'parent_id': 'parent_id',
+    'path': 'path',
+    'depth': 'depth',
+    'description': 'description',
+}
+DEFAULT_CATEGORY_FIELDS = ('id', 'name', 'code', 'parent_id', 'depth')
+
+AVAILABILITY_FIELDS = ('id', 'isbn', 'quantity', 'available')
+
+
+class BadRequest(exceptions.BadRequest):
+    pass
+
+
+def error_response(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def api_response(data):
+    return JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(models):
+    """接口视图装饰器：要求登录，只允许 GET，读取走副本，按模型版本号生成 ETag
+
+    参数错误抛出 BadRequest，返回 400 和错误信息。
+    """
+    def etag(request, *args, **kwargs):
+        # 版本号与接口数据读自同一个库（副本或主库），ETag 不会比返回的数据新
+        parts = [str(API_VERSION)] + [str(version) for version in caching.get_versions(models)]
+        return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag)(view_func)
+
+        @require_GET
+        @replicas.read_replica
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return error_response('请先登录', status=401)
+            try:
+                response = conditional_view(request, *args, **kwargs)
+            # 包括分页游标无效（books.pagination 抛出的 django BadRequest）
+            except exceptions.BadRequest as e:
+                return error_response(str(e))
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+
+    return decorator
+
+
+def parse_fields(request, allowed, default):
+    """?fields= 中的字段名，未指定时返回 default"""
+    value = request.GET.get('fields', '').strip()
+    if not value:
+        return list(default)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise BadRequest(f'未知字段：{", ".join(unknown)}，可选字段：{", ".join(allowed)}')
+    return list(dict.fromkeys(fields))
+
+
+def parse_batch(request):
+    """ids / isbn 参数（逗号分隔或重复给出），返回 (查找列, 值列表)，没有给出时返回 (None, None)"""
+    for param, column in (('ids', 'id'), ('isbn', 'isbn')):
+        values = [
+            value.strip()
+            for raw in request.GET.getlist(param)
+            for value in raw.split(',') if value.strip()
+        ]
+        if not values:
+            continue
+        if len(values) > MAX_BATCH:
+            raise BadRequest(f'一次最多查询 {MAX_BATCH} 本图书')
+        if column == 'id':
+            if not all(value.isdigit() for value in values):
+                raise BadRequest('ids 必须是整数')
+            values = [int(value) for value in values]
+        return column, list(dict.fromkeys(values))
+    return None, None
+
+
+def project(rows, fields, columns):
+    return [{name: row[columns[name]] for name in fields} for row in rows]
+
+
+def batch_response(queryset, column, keys, fields, columns):
+    """按请求的顺序返回批量读取的结果，找不到的键放在 missing 中"""
+    selected = {columns[name] for name in fields} | {column}
+    rows = {row[column]: row for row in queryset.filter(**{f'{column}__in': keys}).values(*selected)}
+    return api_response({
+        'results': project([rows[key] for key in keys if key in rows], fields, columns),
+        'missing': [key for key in keys if key not in rows],
+    })
+
+
+@api_view([Book, Category])
+def book_list(request):
+    """图书列表或批量读取"""
+    fields = parse_fields(request, BOOK_FIELDS, DEFAULT_BOOK_FIELDS)
+    column, keys = parse_batch(request)
+    if column is not None:
+        return batch_response(Book.objects.all(), column, keys, fields, BOOK_FIELDS)
+
+    form = BookSearchForm({
+        'search_query': request.GET.get('q', ''),
+        'category': request.GET.get('category', ''),
+        'available_only': request.GET.get('available') in ('1', 'true'),
+    })
+    if not form.is_valid():
+        raise BadRequest('; '.join(f'{field}: {", ".join(errors)}' for field, errors in form.errors.items()))
+    books, ordering = filter_books(form)
+
+    # 游标需要排序字段的值，即使没有被选中也要取出来
+    selected = {BOOK_FIELDS[name] for name in fields} | {name.lstrip('-') for name in ordering}
+    page = paginate(request, books.values(*selected), ordering)
+    return api_response({
+        'results': project(page, fields, BOOK_FIELDS),
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
+
+
+@api_view([Book, Category])
+def book_detail(request, pk):
+    fields = parse_fields(request, BOOK_FIELDS, BOOK_FIELDS)
+    row = Book.objects.filter(pk=pk).values(*{BOOK_FIELDS[name] for name in fields}).first()
+    if row is None:
+        return error_response('图书不存在', status=404)
+    return api_response(project([row], fields, BOOK_FIELDS)[0])
+
+
+@api_view([Category])
+def category_list(request):
+    fields = parse_fields(request, CATEGORY_FIELDS, DEFAULT_CATEGORY_FIELDS)
+    # 按物化路径排序，父分类在子分类之前
+    rows = Category.objects.order_by('path').values(*{CATEGORY_FIELDS[name] for name in fields})
+    return api_response({'results': project(rows, fields, CATEGORY_FIELDS)})
+
+
+@api_view([Book])
+def availability(request):
+    """按主键或 ISBN 批量查询可借数量"""
+    column, keys = parse_batch(request)
+    if column is None:
+        raise BadRequest('需要 ids 或 isbn 参数')
+    columns = {name: name for name in AVAILABILITY_FIELDS}
+    return batch_response(Book.objects.all(), column, keys, AVAILABILITY_FIELDS, columns)
@@ -5,3 +5,6 @@ class BooksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'books'
     verbose_name = '图书管理系统'
+
+    def ready(self):
+        from . import signals  # noqa: F401 注册信号处理函数
@@ -0,0 +1,142 @@
+"""
+读多写少页面的异步视图
+
+在 ASGI 下由 URL 配置启用（settings.ASYNC_VIEWS），与 books.views 中的同名视图
+输出相同。查询使用 Django 的异步 ORM（aget、acount、async for），互不依赖的查询
+用 asyncio.gather 一起发出。
+
+Django 的数据库驱动仍是同步的，异步 ORM 在同一个线程里依次执行 SQL，gather
+并不会让查询真正并行；收益在于等待数据库时事件循环可以处理其他请求。
+表单校验、检索、模板渲染（上下文处理器会读会话和未读计数）是同步代码，
+放在 sync_to_async 中执行。WSGI 下请使用同步视图：异步视图在 WSGI 中每个
+请求都要额外建立一次事件循环。
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required as _login_required
+from django.db.models import Count
+from django.http import Http404
+from django.shortcuts import render
+
+from .forms import BookSearchForm
+from .models import Book, BookBorrowing, BookReservation, Category, Notification
+from .notifications import get_unread_count
+from .pagination import apaginate, wants_json, load_more_response
+from .views import SUMMARY_MODELS, card_queryset, filter_books
+from . import caching, category_tree, recommendations, replicas, reservations
+
+arender = sync_to_async(render)
+aload_more_response = sync_to_async(load_more_response)
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def login_required(view):
+    """login_required 已经异步读取过用户，让 request.user 复用这个对象，
+    否则模板渲染时访问 request.user 会再查一次用户"""
+    @_login_required
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@replicas.read_replica
+@login_required
+async def book_list(request):
+    """图书列表视图"""
+    form = BookSearchForm(request.GET)
+    books, ordering = await sync_to_async(filter_books)(form)
+    page = await apaginate(request, card_queryset(books), ordering)
+    context = {
+        'books': page,
+        'page': page,
+        'form': form,
+        'category_version': (await sync_to_async(category_tree.get_tree)()).version,
+    }
+    if wants_json(request):
+        return await aload_more_response(request, page, 'books/_book_cards.html', context)
+    return await arender(request, 'books/book_list.html', context)
+
+
+@replicas.read_replica
+@login_required
+async def book_detail(request, pk):
+    try:
+        book = await Book.objects.select_related('category').aget(pk=pk)
+    except Book.DoesNotExist:
+        raise Http404('图书不存在')
+    context = {
+        'book': book,
+        'related_books': await alist(recommendations.related_books(book)),
+    }
+    if book.available == 0:
+        # 没有可借副本时显示预约队列
+        user = request.user
+        context['reservation'], context['queue_length'] = await asyncio.gather(
+            BookReservation.objects.filter(
+                book=book, reservationer=user, status__in=BookReservation.ACTIVE_STATUSES
+            ).afirst(),
+            reservations.aqueue_length(book),
+        )
+    return await arender(request, 'books/book_detail.html', context)
+
+
+@login_required
+async def my_borrowings(request):
+    borrowings = BookBorrowing.objects.filter(borrower=request.user).select_related('book')
+    page = await apaginate(request, borrowings, ('-borrowed_date', '-id'))
+    context = {'borrowings': page, 'page': page}
+    if wants_json(request):
+        return await aload_more_response(request, page, 'accounts/_borrowing_rows.html', context)
+    return await arender(request, 'accounts/my_borrowings.html', context)
+
+
+async def index_data():
+    total_books, total_categories, recent_books, popular_categories = await asyncio.gather(
+        Book.objects.acount(),
+        Category.objects.acount(),
+        alist(Book.objects.select_related('category').order_by('-id')[:6]),
+        alist(Category.objects.annotate(book_count=Count('book')).order_by('-book_count')[:5]),
+    )
+    return {
+        'total_books': total_books,
+        'total_categories': total_categories,
+        'recent_books': recent_books,
+        'popular_categories': popular_categories,
+    }
+
+
+@replicas.read_replica
+@caching.cached_view('index', SUMMARY_MODELS)
+async def index(request):
+    # 与同步视图共用缓存键，两种视图的缓存数据可以互相使用
+    context = await caching.acached_data('index', SUMMARY_MODELS, index_data)
+    return await arender(request, 'index.html', context)
+
+
+@login_required
+async def notification_list(request):
+    """通知列表视图"""
+    user = request.user
+    notifications = Notification.objects.filter(recipient=user)
+    if wants_json(request):
+        page = await apaginate(request, notifications, ('-created_at', '-id'))
+        context = {'notifications': page, 'page': page}
+        return await aload_more_response(request, page, 'notifications/_notification_items.html', context)
+
+    page, unread_count = await asyncio.gather(
+        apaginate(request, notifications, ('-created_at', '-id')),
+        sync_to_async(get_unread_count)(user),
+    )
+    context = {
+        'notifications': page,
+        'page': page,
+        'unread_count': unread_count,
+    }
+    return await arender(request, 'notifications/notification_list.html', context)
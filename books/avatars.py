@@ -0,0 +1,196 @@
+"""
+头像缩略图
+
+上传的头像（常见的是几 MB 的手机照片）不直接展示，而是处理成固定尺寸的
+正方形缩略图，每个尺寸各一份 WebP 和 JPEG：
+
+    avatar/<digest>/master.jpg      按 EXIF 方向摆正后的原图，最长边不超过 MASTER_SIZE
+    avatar/<digest>/<size>.webp
+    avatar/<digest>/<size>.jpg
+
+digest 是上传文件内容的哈希，文件名随内容变化，/avatars/ 下的缩略图可以带
+一年的 immutable 缓存头。重新编码时不写入 EXIF 等元数据（拍摄位置、设备信息）。
+
+通过 UserProfileForm 保存时立即生成。之前上传、还没有 avatar_digest 的头像由
+process_avatars 命令批量生成，处理成功并写入数据库后才删除原始文件；处理之前
+页面照常显示原始文件，显示头像时不做图片处理，也不修改数据。
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from .models import UserProfile
+from . import dashboard
+
+logger = logging.getLogger(__name__)
+
+SIZES = (32, 96, 256)
+MASTER_SIZE = 1024
+FORMATS = {
+    # 扩展名: (Pillow 格式, Content-Type, 编码参数)
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+DIRECTORY = 'avatar/{digest}/'
+
+# 上传文件的上限，超过的在表单校验时拒绝
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+
+
+class InvalidAvatar(ValueError):
+    pass
+
+
+def variant_name(digest, size, extension):
+    return f'{DIRECTORY.format(digest=digest)}{size}.{extension}'
+
+
+def variant_url(digest, size, extension):
+    return reverse('avatar', args=[digest, f'{size}.{extension}'])
+
+
+def open_image(data):
+    """打开并校验图片，返回已按 EXIF 方向摆正的 RGB 图像"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PIXELS:
+            raise InvalidAvatar('图片尺寸过大')
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidAvatar('无法识别的图片文件') from e
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG 不支持透明，铺在白色背景上
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, extension):
+    pillow_format, _, options = FORMATS[extension]
+    output = io.BytesIO()
+    # 不传 exif / icc_profile，输出不带元数据
+    image.save(output, pillow_format, **options)
+    return output.getvalue()
+
+
+def render_variants(data):
+    """返回 (digest, {存储路径: 内容})"""
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    image = open_image(data)
+    files = {}
+    master = image.copy()
+    master.thumbnail((MASTER_SIZE, MASTER_SIZE), Image.LANCZOS)
+    files[f'{DIRECTORY.format(digest=digest)}master.jpg'] = encode(master, 'jpg')
+    for size in SIZES:
+        # 居中裁成正方形
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for extension in FORMATS:
+            files[variant_name(digest, size, extension)] = encode(thumb, extension)
+    return digest, files
+
+
+def save_files(files):
+    for name, content in files.items():
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('删除头像文件 %s 失败', name, exc_info=True)
+
+
+def old_files(name, digest):
+    """头像更换后不再使用的文件：旧的缩略图目录，或者未处理过的原始文件"""
+    if not name:
+        return []
+    if not digest:
+        return [name]
+    directory = DIRECTORY.format(digest=digest)
+    try:
+        _, filenames = default_storage.listdir(directory)
+    except OSError:
+        return []
+    return [directory + filename for filename in filenames]
+
+
+def read_upload(uploaded_file):
+    uploaded_file.seek(0)
+    return b''.join(uploaded_file.chunks())
+
+
+def store(profile, rendered):
+    """写入 render_variants 生成的文件并更新 profile（不保存），返回不再使用的旧文件"""
+    digest, files = rendered
+    stale = old_files(profile.avatar.name, profile.avatar_digest) if profile.avatar_digest != digest else []
+    save_files(files)
+    profile.avatar.name = f'{DIRECTORY.format(digest=digest)}master.jpg'
+    profile.avatar_digest = digest
+    return stale
+
+
+def save_profile(profile, rendered):
+    """UserProfileForm 保存新头像时调用；事务提交后再删除旧文件"""
+    stale = store(profile, rendered)
+    profile.save()
+    dashboard.invalidate(profile.user_id)
+    if stale:
+        transaction.on_commit(lambda: delete_files(stale))
+
+
+def backfill(profile, delete_original=True):
+    """为之前上传、没有缩略图的头像生成缩略图，成功返回 True
+
+    缩略图写入并更新 avatar_digest 之后才删除原始文件，任何一步失败都保留原始文件。
+    """
+    if profile.avatar_digest or not profile.avatar:
+        return False
+    original = profile.avatar.name
+    try:
+        with profile.avatar.open('rb') as f:
+            data = f.read()
+        store(profile, render_variants(data))
+    except (OSError, InvalidAvatar):
+        logger.warning('头像 %s 处理失败', original, exc_info=True)
+        return False
+    # 只处理仍指向这个原始文件的记录，处理期间读者换了头像则放弃
+    claimed = UserProfile.objects.filter(pk=profile.pk, avatar=original, avatar_digest='').update(
+        avatar=profile.avatar.name, avatar_digest=profile.avatar_digest,
+    )
+    if not claimed:
+        return False
+    dashboard.invalidate(profile.user_id)
+    if delete_original:
+        transaction.on_commit(lambda: delete_files([original]))
+    return True
+
+
+def pending_profiles():
+    """还没有生成缩略图的头像"""
+    return UserProfile.objects.exclude(avatar='').filter(avatar_digest='')
+
+
+def avatar_urls(profile, size):
+    """头像指定尺寸的地址 {'webp': ..., 'jpg': ...}，没有头像时返回 None
+
+    还没有缩略图的旧头像只返回原始文件的地址（'jpg'），等 process_avatars 处理。
+    """
+    if profile is None or not profile.avatar:
+        return None
+    if not profile.avatar_digest:
+        return {'jpg': profile.avatar.url}
+    size = min((s for s in SIZES if s >= size), default=SIZES[-1])
+    return {extension: variant_url(profile.avatar_digest, size, extension) for extension in FORMATS}
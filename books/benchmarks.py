@@ -0,0 +1,18 @@
+"""
+基准测试命令共用的统计函数
+
+run_benchmarks、benchmark_asgi、benchmark_search、benchmark_category_tree、
+stress_circulation 都用 percentile() 计算延迟分位数，结果可以互相比较。
+"""
+import math
+
+
+def percentile(values, fraction):
+    """最近秩（nearest-rank）分位数：不小于 fraction 比例样本的最小值
+
+    样本很少时也是样本中的真实值，例如 10 个样本的 p95 是最大值，
+    20 个样本的 p95 是第 19 个。values 不需要预先排序，不能为空。
+    """
+    values = sorted(values)
+    rank = math.ceil(fraction * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
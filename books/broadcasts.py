@@ -0,0 +1,102 @@
+"""
+群发系统消息
+
+管理员提交的消息只写一条 BroadcastMessage，请求立即返回；send_broadcasts
+命令在后台按用户主键分批把通知写入发件箱（books.outbox），与其他通知一样由
+run_notification_worker 按渠道投递、失败重试。每一批在一个事务里锁住群发记录、
+写入发件箱并推进 last_user_id，进程中断后重新运行会从断点继续，多个进程同时
+运行也不会重复发送。
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import BroadcastMessage, Notification
+from . import outbox
+
+CHUNK_SIZE = 1000
+
+
+def target_users(broadcast):
+    """群发对象对应的用户查询集（仅限已激活用户）"""
+    users = User.objects.filter(is_active=True)
+    if broadcast.target == 'staff':
+        users = users.filter(is_staff=True)
+    elif broadcast.target == 'group':
+        users = users.filter(groups=broadcast.group_id)
+    elif broadcast.target == 'users':
+        users = users.filter(targeted_broadcasts=broadcast)
+    return users
+
+
+def send_chunk(broadcast_id, chunk_size=CHUNK_SIZE):
+    """把下一批通知写入发件箱，返回 (群发记录, 本批数量)；全部写入完毕时数量为 0"""
+    with transaction.atomic():
+        broadcast = BroadcastMessage.objects.select_for_update().get(pk=broadcast_id)
+        if broadcast.status == 'done':
+            return broadcast, 0
+
+        now = timezone.now()
+        if broadcast.status == 'pending':
+            broadcast.status = 'sending'
+            broadcast.started_at = now
+            broadcast.total_recipients = target_users(broadcast).count()
+
+        user_ids = list(
+            target_users(broadcast)
+            .filter(id__gt=broadcast.last_user_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if user_ids:
+            outbox.enqueue_many([
+                {
+                    'recipient_id': user_id,
+                    'notification_type': 'system',
+                    'title': broadcast.title,
+                    'message': broadcast.message,
+                    'broadcast_id': broadcast.pk,
+                }
+                for user_id in user_ids
+            ])
+            broadcast.last_user_id = user_ids[-1]
+            broadcast.sent_count += len(user_ids)
+        if len(user_ids) < chunk_size:
+            broadcast.status = 'done'
+            broadcast.finished_at = now
+            # 发送期间新注册的用户也会收到，以实际发送数量为准
+            broadcast.total_recipients = broadcast.sent_count
+        broadcast.save(update_fields=[
+            'status', 'started_at', 'finished_at', 'total_recipients', 'sent_count', 'last_user_id',
+        ])
+    return broadcast, len(user_ids)
+
+
+def send_broadcast(broadcast_id, chunk_size=CHUNK_SIZE, progress=None):
+    """发送一条群发消息的全部通知，progress(broadcast) 在每批完成后回调"""
+    while True:
+        broadcast, sent = send_chunk(broadcast_id, chunk_size)
+        if progress is not None:
+            progress(broadcast)
+        if broadcast.status == 'done':
+            return broadcast
+
+
+def pending_broadcasts():
+    return BroadcastMessage.objects.exclude(status='done').order_by('id')
+
+
+def read_counts(broadcasts):
+    """{群发ID: 已读人数}"""
+    ids = [broadcast.pk for broadcast in broadcasts]
+    if not ids:
+        return {}
+    rows = (
+        Notification.objects.filter(broadcast_id__in=ids, is_read=True)
+        .order_by()
+        .values('broadcast_id')
+        .annotate(n=Count('id'))
+        .values_list('broadcast_id', 'n')
+    )
+    return dict(rows)
@@ -0,0 +1,287 @@
+"""
+按模型版本失效的视图数据缓存
+
+每个模型有一个版本号（写入时的 time_ns），保存在数据库的 CacheVersion 表中，
+所有进程读到的都是同一个值。Book、Category、BookBorrowing 保存或删除后由信号
+在事务提交时更新版本；用 queryset.update() 直接改表的地方需要自己调用 touch()。
+视图数据的缓存键包含所依赖模型的版本号，版本变化后旧键自然失效，不需要逐个
+删除；即使每个进程各用一份本地缓存（LocMemCache），某个进程处理的写入也会让
+所有进程的缓存和 ETag 失效。读取版本号每个请求一条按主键的查询。
+
+使用只读副本的请求从同一个副本读取版本号和数据：版本号在数据提交之后才
+更新，副本上看到的版本号所对应的数据一定也已经复制过去，ETag 与返回的数据
+一致，最多落后副本的复制延迟。缓存未命中时的重新计算总是读主库，按版本号
+缓存的数据不会比它的版本号旧。初始化和更新版本号直接写主库，不会让请求粘在
+主库（见 books.replicas）。
+
+缓存未命中时只有拿到锁的请求重新计算，其他请求返回上一版本的数据（如果有），
+没有旧数据时短暂等待计算结果，避免大量请求同时穿透到数据库。
+异步视图使用 acached_data，逻辑相同，builder 为协程函数。
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import CacheVersion
+from .notifications import get_unread_count
+from . import replicas
+
+DATA_KEY = 'view_data:{name}:{versions}'
+STALE_KEY = 'view_data:{name}:stale'
+LOCK_KEY = 'view_data:{name}:lock'
+STATS_KEY = 'view_stats:{name}:{outcome}'
+
+DATA_TIMEOUT = 600
+STALE_TIMEOUT = 3600
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+OUTCOMES = ('hit', 'miss', 'stale', 'wait')
+
+# cached_view 处理的请求中已经读过的版本号，ETag、Last-Modified 和 cached_data 共用一次查询
+_request_versions = contextvars.ContextVar('cache_request_versions', default=None)
+
+
+def model_label(model):
+    return model if isinstance(model, str) else model._meta.label_lower
+
+
+def primary_versions():
+    return CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+
+
+def get_versions(models):
+    """返回各模型当前的版本号，没有版本号的模型以当前时间初始化"""
+    labels = [model_label(model) for model in models]
+    known = _request_versions.get()
+    if known is not None and all(label in known for label in labels):
+        return [known[label] for label in labels]
+    # 与请求中的其他数据读同一个库
+    versions = dict(CacheVersion.objects.filter(label__in=labels).values_list('label', 'version'))
+    missing = [label for label in labels if label not in versions]
+    if missing:
+        create_versions(missing)
+        versions.update(primary_versions().filter(label__in=missing).values_list('label', 'version'))
+    if known is not None:
+        known.update(versions)
+    return [versions[label] for label in labels]
+
+
+async def aget_versions(models):
+    labels = [model_label(model) for model in models]
+    known = _request_versions.get()
+    if known is not None and all(label in known for label in labels):
+        return [known[label] for label in labels]
+    rows = CacheVersion.objects.filter(label__in=labels).values_list('label', 'version')
+    versions = {label: version async for label, version in rows}
+    missing = [label for label in labels if label not in versions]
+    if missing:
+        await sync_to_async(create_versions)(missing)
+        rows = primary_versions().filter(label__in=missing).values_list('label', 'version')
+        versions.update([row async for row in rows])
+    if known is not None:
+        known.update(versions)
+    return [versions[label] for label in labels]
+
+
+def create_versions(labels):
+    # 并发初始化时以先写入的为准
+    now = time.time_ns()
+    primary_versions().bulk_create(
+        [CacheVersion(label=label, version=now) for label in labels], ignore_conflicts=True,
+    )
+
+
+def touch(*models):
+    """模型数据变化后调用，事务提交时更新版本号"""
+    labels = [model_label(model) for model in models]
+
+    def bump():
+        known = _request_versions.get()
+        if known is not None:
+            known.clear()
+        # 各进程的时钟可能不一致，取 max(旧版本 + 1, 当前时间) 保证版本号只增不减
+        now = time.time_ns()
+        updated = primary_versions().filter(label__in=labels).update(
+            version=Greatest(F('version') + 1, Value(now)),
+        )
+        if updated < len(labels):
+            create_versions(labels)
+
+    transaction.on_commit(bump)
+
+
+def count(name, outcome):
+    key = STATS_KEY.format(name=name, outcome=outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_stats(names):
+    """{名称: {'hit': n, 'miss': n, 'stale': n, 'wait': n}}"""
+    keys = {
+        (name, outcome): STATS_KEY.format(name=name, outcome=outcome)
+        for name in names for outcome in OUTCOMES
+    }
+    values = cache.get_many(keys.values())
+    stats = {name: {} for name in names}
+    for (name, outcome), key in keys.items():
+        stats[name][outcome] = values.get(key, 0)
+    return stats
+
+
+def cached_data(name, models, builder, timeout=DATA_TIMEOUT):
+    """返回 builder() 的结果，按 models 的版本号缓存
+
+    builder 的返回值需要可以被 pickle，查询集要先转成列表。
+    """
+    versions = get_versions(models)
+    key = DATA_KEY.format(name=name, versions='.'.join(map(str, versions)))
+    data = cache.get(key)
+    if data is not None:
+        count(name, 'hit')
+        return data
+
+    lock_key = LOCK_KEY.format(name=name)
+    stale_key = STALE_KEY.format(name=name)
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # 其他请求正在重新计算
+        data = cache.get(stale_key)
+        if data is not None:
+            count(name, 'stale')
+            return data
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            data = cache.get(key)
+            if data is not None:
+                count(name, 'wait')
+                return data
+        count(name, 'miss')
+        with replicas.use_primary():
+            return builder()
+
+    try:
+        count(name, 'miss')
+        # 不用副本上可能落后的数据填充当前版本的缓存
+        with replicas.use_primary():
+            data = builder()
+        cache.set(key, data, timeout)
+        cache.set(stale_key, data, STALE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    return data
+
+
+async def acached_data(name, models, builder, timeout=DATA_TIMEOUT):
+    """cached_data 的异步版本，builder 为协程函数"""
+    versions = await aget_versions(models)
+    key = DATA_KEY.format(name=name, versions='.'.join(map(str, versions)))
+    data = await cache.aget(key)
+    if data is not None:
+        count(name, 'hit')
+        return data
+
+    lock_key = LOCK_KEY.format(name=name)
+    stale_key = STALE_KEY.format(name=name)
+    if not await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        data = await cache.aget(stale_key)
+        if data is not None:
+            count(name, 'stale')
+            return data
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            data = await cache.aget(key)
+            if data is not None:
+                count(name, 'wait')
+                return data
+        count(name, 'miss')
+        with replicas.use_primary():
+            return await builder()
+
+    try:
+        count(name, 'miss')
+        with replicas.use_primary():
+            data = await builder()
+        await cache.aset(key, data, timeout)
+        await cache.aset(stale_key, data, STALE_TIMEOUT)
+    finally:
+        await cache.adelete(lock_key)
+    return data
+
+
+def cached_view(name, models):
+    """视图装饰器：根据模型版本生成 ETag / Last-Modified，未变化时返回 304
+
+    页面里有当前用户和未读通知数，ETag 中包含用户 ID 和未读数；
+    有待显示的提示消息时不做条件响应，避免消息被 304 吞掉。
+    """
+    def has_pending_messages(request):
+        return len(get_messages(request)) > 0
+
+    def etag(request, *args, **kwargs):
+        if has_pending_messages(request):
+            return None
+        parts = [name] + [str(version) for version in get_versions(models)]
+        if request.user.is_authenticated:
+            parts += [str(request.user.pk), str(get_unread_count(request.user))]
+        return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if has_pending_messages(request):
+            return None
+        latest = max(get_versions(models))
+        return datetime.fromtimestamp(latest / 1e9, tz=dt_timezone.utc)
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                token = _request_versions.set({})
+                try:
+                    # 读取提示消息和未读数会访问会话、数据库，先在线程中算好
+                    validators = await sync_to_async(
+                        lambda: (etag(request), last_modified(request))
+                    )()
+                    response = await condition(
+                        etag_func=lambda *args, **kwargs: validators[0],
+                        last_modified_func=lambda *args, **kwargs: validators[1],
+                    )(view_func)(request, *args, **kwargs)
+                finally:
+                    _request_versions.reset(token)
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+            return async_wrapper
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            token = _request_versions.set({})
+            try:
+                response = conditional_view(request, *args, **kwargs)
+            finally:
+                _request_versions.reset(token)
+            # 每次都向服务器确认，不允许共享缓存保存带用户信息的页面
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+
+    return decorator
@@ -0,0 +1,112 @@
+"""
+进程内缓存的分类树
+
+整棵分类树（id、名称、父级、物化路径）加载到内存，完整路径名预先算好，
+get_full_path 为 O(1) 字典查找。
+
+分类树的版本就是 Category 在 books.caching 中的版本号（数据库 CacheVersion 表），
+分类保存或删除后由信号在事务提交时更新，所有进程共享。每个进程最多每
+VERSION_CHECK_INTERVAL 秒读一次版本号，发现变化再从主库重新加载，其他进程
+中的修改最迟在这个间隔后生效；本进程中的修改立即生效。
+"""
+import threading
+import time
+
+from .models import Category
+from . import caching, replicas
+
+# 两次读取版本号的最小间隔（秒），一个请求中多次访问分类树只读一次
+VERSION_CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_tree = None
+_checked_at = None
+_checked_version = None
+
+
+def subtree_lookup(path, field='path'):
+    """path 及其全部子孙的范围查询条件
+
+    物化路径只包含数字和 "/"，"/1/5/" 的子树即 ["/1/5/", "/1/50") 区间，
+    用范围比较代替 LIKE 前缀匹配，SQLite 和 MySQL 都能走索引。
+    """
+    return {f'{field}__gte': path, f'{field}__lt': path[:-1] + '0'}
+
+
+class CategoryTree:
+    def __init__(self, version, rows):
+        self.version = version
+        self.nodes = {}
+        self.children = {}
+        for pk, name, parent_id, path in rows:
+            self.nodes[pk] = (name, parent_id, path)
+            self.children.setdefault(parent_id, []).append(pk)
+
+        # 按路径排序后父级总在子级之前，可以一次遍历算出全部完整路径名
+        self.full_paths = {}
+        for pk, (name, parent_id, path) in sorted(self.nodes.items(), key=lambda item: item[1][2]):
+            parent_full_path = self.full_paths.get(parent_id)
+            self.full_paths[pk] = f'{parent_full_path} > {name}' if parent_full_path else name
+
+    def full_path(self, pk):
+        return self.full_paths.get(pk)
+
+    def path(self, pk):
+        node = self.nodes.get(pk)
+        return node[2] if node else None
+
+    def descendant_ids(self, pk):
+        """pk 及其全部子孙分类的主键"""
+        result = []
+        stack = [pk]
+        while stack:
+            current = stack.pop()
+            if current in self.nodes:
+                result.append(current)
+                stack.extend(self.children.get(current, ()))
+        return result
+
+    def choices(self):
+        """按树的顺序列出 (id, 完整路径名)，用于下拉选择框"""
+        ordered = sorted(self.nodes.items(), key=lambda item: self.full_paths[item[0]])
+        return [(pk, self.full_paths[pk]) for pk, _ in ordered]
+
+
+def _current_version():
+    global _checked_at, _checked_version
+    now = time.monotonic()
+    if _checked_at is None or now - _checked_at >= VERSION_CHECK_INTERVAL:
+        _checked_version = caching.get_versions([Category])[0]
+        _checked_at = now
+    return _checked_version
+
+
+def get_tree():
+    """返回当前的分类树，版本变化时重新加载"""
+    global _tree
+    version = _current_version()
+    tree = _tree
+    if tree is not None and tree.version == version:
+        return tree
+    with _lock:
+        if _tree is None or _tree.version != version:
+            # 与 cached_data 一样，按版本号缓存的数据从主库加载
+            with replicas.use_primary():
+                rows = list(Category.objects.values_list('id', 'name', 'parent_id', 'path'))
+            _tree = CategoryTree(version, rows)
+        return _tree
+
+
+def invalidate():
+    """用 update() 等绕过信号的方式修改分类后调用，使所有进程的分类树失效
+
+    版本号在事务提交时更新；本进程丢弃已加载的树，之后的访问立即重新加载。
+    """
+    global _tree, _checked_at
+    caching.touch(Category)
+    _tree = None
+    _checked_at = None
+
+
+def category_choices():
+    return [('', '所有类别')] + get_tree().choices()
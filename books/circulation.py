@@ -0,0 +1,109 @@
+"""
+借还书业务逻辑
+
+库存变更使用带条件的原子 UPDATE（available = available - 1 WHERE available > 0），
+与借阅记录、通知写在同一个事务里。并发借阅同一本书时不会丢失更新，
+库存也不会变成负数；只更新 available 一列，不再整行回写。
+有人预约的图书归还后副本留给队首读者，见 books.reservations。
+通知写入发件箱（books.outbox），由 run_notification_worker 在请求之外投递。
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Book, BookBorrowing
+from . import caching, dashboard, outbox, reservations, rollups
+
+# 默认借期（天）
+LOAN_DAYS = 30
+
+
+class CirculationError(Exception):
+    pass
+
+
+class BookUnavailable(CirculationError):
+    """没有可借的副本"""
+
+
+class NotBorrowed(CirculationError):
+    """没有可归还的借阅记录"""
+
+
+def borrow_book(user, book, days=LOAN_DAYS):
+    """借出一本图书，返回借阅记录"""
+    due_date = timezone.now() + timedelta(days=days)
+    with transaction.atomic():
+        # 借走为自己保留的副本时，该副本不计入可借数量，不需要再扣减
+        if not reservations.fulfil(user, book):
+            updated = Book.objects.filter(
+                pk=book.pk, available__gt=0
+            ).update(available=F('available') - 1)
+            if not updated:
+                raise BookUnavailable(book.pk)
+
+        borrowing = BookBorrowing.objects.create(
+            book=book,
+            borrower=user,
+            due_date=due_date,
+            status='borrowed',
+        )
+        rollups.record_borrow(borrowing, book)
+        # 库存用 update() 修改，不会触发信号
+        caching.touch(Book)
+        outbox.enqueue(
+            recipient_id=user.pk,
+            notification_type='borrow',
+            title=f'成功借阅《{book.title}》',
+            message=f'您已成功借阅《{book.title}》，请在 {due_date.strftime("%Y-%m-%d")} 前归还。',
+            related_book_id=book.pk,
+        )
+    return borrowing
+
+
+def return_book(user, book):
+    """归还用户借阅的一本图书，返回借阅记录"""
+    now = timezone.now()
+    with transaction.atomic():
+        borrowing = BookBorrowing.objects.filter(
+            book=book, borrower=user, returned=False
+        ).order_by('borrowed_date').first()
+        if borrowing is None:
+            raise NotBorrowed(book.pk)
+
+        # 条件更新，重复提交的归还请求只有一个会生效
+        updated = BookBorrowing.objects.filter(
+            pk=borrowing.pk, returned=False
+        ).update(returned=True, return_date=now, status='returned')
+        if not updated:
+            raise NotBorrowed(book.pk)
+        borrowing.returned = True
+        borrowing.return_date = now
+        borrowing.status = 'returned'
+
+        # 有人排队时副本留给队首读者，否则可借数量加一
+        reservations.release_copy(book, now)
+        rollups.record_return(borrowing)
+        caching.touch(Book, BookBorrowing)
+        dashboard.invalidate(user.pk)
+
+        # 检查是否逾期
+        if borrowing.due_date and borrowing.due_date < now:
+            outbox.enqueue(
+                recipient_id=user.pk,
+                notification_type='overdue',
+                title='图书逾期提醒',
+                message=f'您归还的《{book.title}》已逾期，请注意按时还书。',
+                related_book_id=book.pk,
+            )
+        else:
+            outbox.enqueue(
+                recipient_id=user.pk,
+                notification_type='return',
+                title='图书归还成功',
+                message=f'您已成功归还《{book.title}》，欢迎下次借阅。',
+                related_book_id=book.pk,
+            )
+    return borrowing
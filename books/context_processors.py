@@ -1,10 +1,22 @@
-from .models import Notification
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import get_unread_count
+from . import live
 
 def notifications(request):
-    if request.user.is_authenticated:
-        unread_count = Notification.objects.filter(
-            recipient=request.user,
-            is_read=False
-        ).count()
-        return {'unread_notifications_count': unread_count}
-    return {'unread_notifications_count': 0} 
\ No newline at end of file
+    """未读通知数，模板实际用到时才读取
+
+    live_notifications：是否打开实时通知连接。WSGI 下每个连接占用一个工作线程，
+    几个标签页就能占满全部线程，只在 ASGI 下使用；WSGI 下页面每
+    unread_poll_seconds 秒请求一次未读数。
+    """
+    def unread_count():
+        if request.user.is_authenticated:
+            return get_unread_count(request.user)
+        return 0
+    return {
+        'unread_notifications_count': SimpleLazyObject(unread_count),
+        'live_notifications': isinstance(request, ASGIRequest),
+        'unread_poll_seconds': live.get_setting('FALLBACK_POLL_SECONDS'),
+    }
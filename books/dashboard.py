@@ -0,0 +1,113 @@
+"""
+个人中心的借阅面板
+
+统计、当前借阅、最近预约和个人资料按用户缓存，缓存未命中时共四条查询：
+
+- 借阅统计用一条条件聚合（Count(filter=...)）算出总借阅、借阅中、逾期数，
+  同时取出最近一本未到期借阅的应还时间；
+- 当前借阅和预约各一条，select_related('book') 并用 only() 只取页面用到的列；
+  预约的排队位次用子查询注解，不再每行 COUNT 一次；
+- 个人资料（头像、电话）一条。
+
+逾期是按当前时间判断的，缓存最多保留到下一本书到期，到期后重新统计。
+借阅、归还、预约及预约状态变化、修改个人资料时在事务提交后删除相关用户的
+缓存，见 circulation、reservations、signals 和 views.edit_profile。
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BookBorrowing, BookReservation, UserProfile
+
+DASHBOARD_KEY = 'dashboard:{user_id}'
+DASHBOARD_TIMEOUT = 300
+
+# 个人中心显示的预约条数
+RESERVATION_LIMIT = 5
+
+
+def dashboard_key(user_id):
+    return DASHBOARD_KEY.format(user_id=user_id)
+
+
+def invalidate(*user_ids):
+    """事务提交后删除这些用户的面板缓存"""
+    keys = [dashboard_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_queue(book):
+    """排队位次变化：删除这本书所有排队读者的面板缓存"""
+    invalidate(*BookReservation.objects.filter(
+        book=book, status='waiting'
+    ).values_list('reservationer_id', flat=True))
+
+
+def borrowing_stats(user, now):
+    return BookBorrowing.objects.filter(borrower=user).aggregate(
+        total_borrowed=Count('id'),
+        current_borrowed=Count('id', filter=Q(Q(due_date__isnull=True) | Q(due_date__gte=now), returned=False)),
+        overdue_books=Count('id', filter=Q(returned=False, due_date__lt=now)),
+        next_due=Min('due_date', filter=Q(returned=False, due_date__gte=now)),
+    )
+
+
+def current_borrowings(user):
+    return list(
+        BookBorrowing.objects.filter(borrower=user).outstanding()
+        .select_related('book')
+        .only('id', 'book_id', 'borrowed_date', 'due_date', 'returned', 'book__title')
+        .order_by('due_date')
+    )
+
+
+def recent_reservations(user):
+    waiting_ahead = (
+        BookReservation.objects.filter(
+            book_id=OuterRef('book_id'), status='waiting', position__lt=OuterRef('position'),
+        )
+        .order_by().values('book_id').annotate(count=Count('id')).values('count')
+    )
+    return list(
+        BookReservation.objects.filter(reservationer=user)
+        .select_related('book')
+        .only(
+            'id', 'book_id', 'status', 'position', 'reservation_date', 'hold_expires_at',
+            'book__title',
+        )
+        .annotate(waiting_ahead=Coalesce(Subquery(waiting_ahead, output_field=IntegerField()), 0))
+        .order_by('-reservation_date')[:RESERVATION_LIMIT]
+    )
+
+
+def build_dashboard(user, now):
+    stats = borrowing_stats(user, now)
+    return {
+        'next_due': stats.pop('next_due'),
+        'user_stats': stats,
+        'current_borrowings': current_borrowings(user),
+        'reservations': recent_reservations(user),
+        'profile': UserProfile.objects.filter(user=user).first(),
+    }
+
+
+def get_dashboard(user):
+    """返回个人中心的统计和列表，优先读缓存"""
+    key = dashboard_key(user.pk)
+    dashboard = cache.get(key)
+    if dashboard is not None:
+        return dashboard
+
+    now = timezone.now()
+    dashboard = build_dashboard(user, now)
+    timeout = DASHBOARD_TIMEOUT
+    if dashboard['next_due'] is not None:
+        # 下一本书到期后借阅中、逾期的统计会变化
+        timeout = max(1, min(timeout, int((dashboard['next_due'] - now) / timedelta(seconds=1)) + 1))
+    cache.set(key, dashboard, timeout)
+    return dashboard
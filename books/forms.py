@@ -2,7 +2,9 @@ from django import forms
 from .models import Book, Category, BookBorrowing, BookRecommendation, BookReservation, BookComment, BookReturn
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, BroadcastMessage
+from .category_tree import category_choices
+from . import avatars
 
 class BookSearchForm(forms.Form):
     search_query = forms.CharField(
@@ -13,11 +15,13 @@ class BookSearchForm(forms.Form):
             'placeholder':'输入书名、作者或ISBN'
         })
     )
-    category = forms.ModelChoiceField(
+    # 选项来自进程内缓存的分类树，不再每次请求查询全部分类
+    category = forms.TypedChoiceField(
         label='类别',
-        queryset=Category.objects.all(),
+        choices=category_choices,
+        coerce=int,
+        empty_value=None,
         required=False,
-        empty_label="所有类别",
         widget=forms.Select(attrs={
             'class': 'form-control'
         })
@@ -55,5 +59,57 @@ class UserProfileForm(forms.ModelForm):
         widgets = {
             'email': forms.EmailInput(attrs={'class': 'form-control'}),
             'phone': forms.TextInput(attrs={'class': 'form-control'}),
-            'avatar': forms.FileInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+            'avatar': forms.FileInput(attrs={'class': 'form-control', 'accept': 'image/*'}),
+        }
+
+    def clean_avatar(self):
+        avatar = self.cleaned_data.get('avatar')
+        self.avatar_variants = None
+        if not avatar or 'avatar' not in self.changed_data:
+            return avatar
+        if avatar.size > avatars.MAX_UPLOAD_BYTES:
+            raise forms.ValidationError(f'头像文件不能超过 {avatars.MAX_UPLOAD_BYTES // (1024 * 1024)} MB')
+        try:
+            # 校验时就生成缩略图，图片有问题可以作为表单错误返回
+            self.avatar_variants = avatars.render_variants(avatars.read_upload(avatar))
+        except avatars.InvalidAvatar as e:
+            raise forms.ValidationError(str(e))
+        return avatar
+
+    def save(self, commit=True):
+        if not getattr(self, 'avatar_variants', None):
+            return super().save(commit)
+        # 新上传的头像只保存缩略图，不保存原始文件
+        profile = super().save(commit=False)
+        profile.avatar = self.initial.get('avatar')
+        avatars.save_profile(profile, self.avatar_variants)
+        return profile
+
+class BroadcastForm(forms.ModelForm):
+    class Meta:
+        model = BroadcastMessage
+        fields = ['title', 'message', 'target', 'group', 'recipients']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        target = cleaned_data.get('target')
+        if target == 'group' and not cleaned_data.get('group'):
+            self.add_error('group', '请选择用户组')
+        if target == 'users' and not cleaned_data.get('recipients'):
+            self.add_error('recipients', '请至少选择一个接收者')
+        return cleaned_data
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSONL')], required=False)
+    gzip = forms.BooleanField(required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    status = forms.ChoiceField(choices=BookBorrowing.STATUS_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('开始日期不能晚于结束日期')
+        return cleaned_data
@@ -0,0 +1,190 @@
+"""
+实时通知推送（Server-Sent Events）
+
+/notifications/stream/ 是一个长连接，推送两种事件：
+
+- notification：新通知，data 为通知列表条目的 HTML 片段和通知摘要，
+  id 为最后一条通知的游标；
+- unread：未读数变化，data 为 {"count": n}，连接建立时先推送一次。
+
+连接订阅 pubsub，本进程中的变化在事务提交后立即推送；其他进程（多个 Web
+进程、通知投递进程）中的变化每 POLL_SECONDS 秒轮询一次数据库发现，轮询
+按 (created_at, id) 游标只读新增的通知，加上一次未读计数行的读取。没有事件时
+每 HEARTBEAT_SECONDS 秒发送一行注释作为心跳，避免代理断开空闲连接，也让
+服务端及时发现客户端已断开。
+
+浏览器断线重连时会带上 Last-Event-ID，从该通知之后继续推送，断线期间的
+通知不会丢失。ASGI 下连接只占用一个协程，不限制时长。
+
+WSGI 下每个连接占用一个工作线程，每个标签页一个连接很快就会占满线程池，
+所以页面只在 ASGI 下打开连接（见 context_processors.notifications），WSGI 下
+每 FALLBACK_POLL_SECONDS 秒请求一次 /notifications/unread/ 更新角标。直接访问
+本接口的 WSGI 连接在 MAX_STREAM_SECONDS 秒后主动结束，由浏览器重连。
+
+配置（均可省略）::
+
+    NOTIFICATION_STREAM = {
+        'POLL_SECONDS': 5,
+        'HEARTBEAT_SECONDS': 15,
+        'FALLBACK_POLL_SECONDS': 30,
+    }
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+
+from .models import Notification
+from .notifications import refresh_unread_count
+from .pagination import CursorPaginator, InvalidCursor
+from .pubsub import broker
+
+DEFAULTS = {
+    'POLL_SECONDS': 5,
+    'HEARTBEAT_SECONDS': 15,
+    # 浏览器断线后等待多久重连（毫秒）
+    'RETRY_MS': 3000,
+    'MAX_STREAM_SECONDS': 60,
+    'BATCH_SIZE': 20,
+    # WSGI 下不打开连接，页面按此间隔轮询未读数
+    'FALLBACK_POLL_SECONDS': 30,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'NOTIFICATION_STREAM', {}).get(name, DEFAULTS[name])
+
+
+def format_event(data, event=None, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+HEARTBEAT = ': ping\n\n'
+
+
+class NotificationStream:
+    """一个连接的推送进度：推送到了哪条通知、上次推送的未读数"""
+
+    def __init__(self, user, last_event_id=None):
+        self.user = user
+        self.paginator = CursorPaginator(
+            Notification.objects.filter(recipient=user), ('created_at', 'id'), get_setting('BATCH_SIZE'),
+        )
+        self.last_event_id = last_event_id
+        self.cursor = None
+        self.unread = None
+
+    def start(self):
+        """确定从哪条通知之后开始推送，返回连接建立时的事件"""
+        cursor = self.last_event_id
+        if cursor:
+            try:
+                self.paginator.decode_cursor(cursor)
+            except InvalidCursor:
+                cursor = None
+        if not cursor:
+            # 新打开的页面已经显示了现有的通知，只推送之后的
+            latest = (
+                Notification.objects.filter(recipient=self.user)
+                .order_by('-created_at', '-id').only('id', 'created_at').first()
+            )
+            cursor = self.paginator.encode_cursor(latest) if latest else None
+        self.cursor = cursor
+        return [f'retry: {get_setting("RETRY_MS")}\n\n'] + self.poll()
+
+    def poll(self):
+        """读取游标之后的新通知和最新的未读数，返回需要推送的事件"""
+        events = []
+        while True:
+            page = self.paginator.get_page(self.cursor)
+            if not page:
+                break
+            self.cursor = self.paginator.encode_cursor(page.object_list[-1])
+            events.append(self.notification_event(page.object_list))
+            if not page.has_next:
+                break
+
+        unread = refresh_unread_count(self.user)
+        if unread != self.unread:
+            self.unread = unread
+            events.append(format_event({'count': unread}, 'unread'))
+        return events
+
+    def notification_event(self, notifications):
+        # 列表页按时间倒序显示，片段中最新的在前
+        newest_first = notifications[::-1]
+        return format_event({
+            'html': render_to_string('notifications/_notification_items.html', {'notifications': newest_first}),
+            'notifications': [
+                {
+                    'id': notification.pk,
+                    'type': notification.notification_type,
+                    'title': notification.title,
+                    'message': notification.message,
+                }
+                for notification in newest_first
+            ],
+        }, 'notification', self.cursor)
+
+
+def stream_events(stream, max_seconds):
+    """WSGI：在请求线程中等待唤醒或轮询"""
+    subscription = broker.subscribe(stream.user.pk)
+    try:
+        yield ''.join(stream.start())
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < max_seconds:
+            subscription.wait(get_setting('POLL_SECONDS'))
+            events = stream.poll()
+            now = time.monotonic()
+            if events:
+                yield ''.join(events)
+                last_sent = now
+            elif now - last_sent >= get_setting('HEARTBEAT_SECONDS'):
+                yield HEARTBEAT
+                last_sent = now
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def astream_events(stream):
+    """ASGI：等待时不占用线程，读数据库时才进入 sync_to_async"""
+    subscription = broker.subscribe(stream.user.pk, asyncio.get_running_loop())
+    try:
+        yield ''.join(await sync_to_async(stream.start)())
+        last_sent = time.monotonic()
+        while True:
+            await subscription.await_wake(get_setting('POLL_SECONDS'))
+            events = await sync_to_async(stream.poll)()
+            now = time.monotonic()
+            if events:
+                yield ''.join(events)
+                last_sent = now
+            elif now - last_sent >= get_setting('HEARTBEAT_SECONDS'):
+                yield HEARTBEAT
+                last_sent = now
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def event_stream_response(request, stream):
+    if isinstance(request, ASGIRequest):
+        content = astream_events(stream)
+    else:
+        content = stream_events(stream, get_setting('MAX_STREAM_SECONDS'))
+    response = StreamingHttpResponse(content, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # 让 nginx 等反向代理不要缓冲事件
+    response['X-Accel-Buffering'] = 'no'
+    return response
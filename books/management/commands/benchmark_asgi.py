@@ -0,0 +1,280 @@
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from books.benchmarks import percentile
+from books.models import Book, BookBorrowing
+
+# 对比的部署方式：(名称, 协议, 是否启用异步视图)
+MODES = (
+    ('wsgi-sync', 'wsgi', False),
+    ('asgi-sync', 'asgi', False),
+    ('asgi-async', 'asgi', True),
+)
+
+
+def rss_kb():
+    """当前进程的常驻内存（KB），读取失败时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_kb():
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Command(BaseCommand):
+    help = (
+        '在同一台机器上对比 WSGI 与 ASGI（同步/异步视图）下读多写少页面的吞吐量和内存。'
+        '请求在进程内直接交给 Django 的 WSGI/ASGI 处理器，不经过网络和 HTTP 服务器，'
+        '每种部署方式在独立的子进程中运行'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='每种部署方式的请求总数')
+        parser.add_argument('--concurrency', type=int, default=16, help='并发请求数（WSGI 为线程数）')
+        parser.add_argument('--warmup', type=int, default=50, help='正式计时前的预热请求数')
+        parser.add_argument('--mode', action='append', choices=[name for name, _, _ in MODES], help='只运行指定方式，可重复')
+        parser.add_argument('--username', help='以哪个读者身份访问（默认选最近借过书的读者）')
+        parser.add_argument('--output', help='把结果写入 JSON 文件（默认输出到标准输出）')
+        parser.add_argument('--label', default='')
+        parser.add_argument('--child', help='内部使用：在子进程中运行指定方式')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.run_child(options), ensure_ascii=False))
+            return
+
+        results = {}
+        for name, protocol, async_views in MODES:
+            if options['mode'] and name not in options['mode']:
+                continue
+            results[name] = self.spawn(name, async_views, options)
+            result = results[name]
+            self.stderr.write(
+                f'{name}: {result["requests_per_second"]} req/s, p50={result["p50_ms"]}ms '
+                f'p95={result["p95_ms"]}ms, 内存 {result["rss_before_kb"]}→{result["peak_rss_kb"]} KB, '
+                f'线程 {result["threads"]}'
+            )
+
+        report = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+            },
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'modes': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(self.style.SUCCESS(f'结果已写入 {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def spawn(self, name, async_views, options):
+        """在子进程中运行，保证各方式的内存互不影响"""
+        env = dict(os.environ, LIBMANGE_ASYNC_VIEWS='1' if async_views else '0')
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_asgi', '--child', name,
+            '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']),
+            '--warmup', str(options['warmup']),
+        ]
+        if options['username']:
+            command += ['--username', options['username']]
+        if options['settings']:
+            command += ['--settings', options['settings']]
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'{name} 运行失败：\n{process.stderr}')
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def run_child(self, options):
+        protocol = dict((name, protocol) for name, protocol, _ in MODES)[options['child']]
+        cookie = self.login(options['username'])
+        paths = self.paths()
+        # 请求路径按顺序循环使用
+        schedule = [paths[i % len(paths)] for i in range(options['warmup'] + options['requests'])]
+        warmup, measured = schedule[:options['warmup']], schedule[options['warmup']:]
+
+        self.max_threads = threading.active_count()
+        run = self.run_wsgi if protocol == 'wsgi' else self.run_asgi
+        run(warmup, cookie, options['concurrency'])
+        rss_before = rss_kb()
+        started = time.perf_counter()
+        latencies, statuses = run(measured, cookie, options['concurrency'])
+        elapsed = time.perf_counter() - started
+
+        if statuses.get('200', 0) != len(measured):
+            raise CommandError(f'存在非 200 响应：{statuses}')
+        return {
+            'protocol': protocol,
+            'async_views': settings.ASYNC_VIEWS,
+            'requests_per_second': round(len(measured) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'status_codes': statuses,
+            'rss_before_kb': rss_before,
+            'peak_rss_kb': peak_rss_kb(),
+            'threads': self.max_threads,
+        }
+
+    def login(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'用户 {username} 不存在')
+        else:
+            user_id = BookBorrowing.objects.order_by('-id').values_list('borrower_id', flat=True).first()
+            user = User.objects.filter(pk=user_id).first() or User.objects.filter(is_active=True).first()
+            if user is None:
+                raise CommandError('没有用户数据，请先运行 seed_library')
+        client = Client()
+        client.force_login(user)
+        return '; '.join(f'{key}={morsel.value}' for key, morsel in client.cookies.items())
+
+    def paths(self):
+        book_ids = list(Book.objects.order_by('-id').values_list('id', flat=True)[:20])
+        if not book_ids:
+            raise CommandError('没有图书数据，请先运行 seed_library')
+        return [
+            reverse('index'),
+            reverse('book_list'),
+            reverse('my_borrowings'),
+            reverse('notification_list'),
+        ] + [reverse('book_detail', args=[pk]) for pk in book_ids[:4]]
+
+    def run_wsgi(self, paths, cookie, concurrency):
+        """线程池模拟多线程的 WSGI 服务器"""
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+
+        def request(path):
+            url = urlsplit(path)
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'SCRIPT_NAME': '',
+                'PATH_INFO': url.path,
+                'QUERY_STRING': url.query,
+                'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost',
+                'HTTP_COOKIE': cookie,
+                'wsgi.input': io.BytesIO(b''),
+                'wsgi.errors': sys.stderr,
+                'wsgi.url_scheme': 'http',
+                'wsgi.multithread': True,
+                'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            status = []
+            started = time.perf_counter()
+            response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+            try:
+                for _ in response:
+                    pass
+            finally:
+                response.close()
+            self.sample_threads()
+            return (time.perf_counter() - started) * 1000, status[0].split()[0]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(request, paths))
+        return self.summarize(results)
+
+    def run_asgi(self, paths, cookie, concurrency):
+        from django.core.asgi import get_asgi_application
+        application = get_asgi_application()
+
+        async def request(path):
+            url = urlsplit(path)
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': url.path,
+                'raw_path': url.path.encode(),
+                'query_string': url.query.encode(),
+                'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+                'client': ('127.0.0.1', 50000),
+                'server': ('localhost', 80),
+            }
+            disconnected = asyncio.Event()
+            sent_body = False
+
+            async def receive():
+                nonlocal sent_body
+                if not sent_body:
+                    sent_body = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # 客户端一直保持连接，直到响应结束
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            status = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(str(message['status']))
+                elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                    disconnected.set()
+
+            started = time.perf_counter()
+            await application(scope, receive, send)
+            self.sample_threads()
+            return (time.perf_counter() - started) * 1000, status[0]
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(path):
+                async with semaphore:
+                    return await request(path)
+            return await asyncio.gather(*(limited(path) for path in paths))
+
+        return self.summarize(asyncio.run(run_all()))
+
+    def sample_threads(self):
+        self.max_threads = max(self.max_threads, threading.active_count())
+
+    def summarize(self, results):
+        latencies = [latency for latency, _ in results]
+        statuses = {}
+        for _, status in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        return latencies, statuses
@@ -0,0 +1,148 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books.benchmarks import percentile
+from books.models import Book, Category
+from books import category_tree
+
+
+def legacy_full_path(category):
+    """原来的实现：沿 parent 逐级查询，用于对比"""
+    path = [category.name]
+    current = category
+    while current.parent_id:
+        current = Category.objects.get(pk=current.parent_id)
+        path.append(current.name)
+    return ' > '.join(reversed(path))
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+class Command(BaseCommand):
+    help = '分类树性能基准测试：生成深层分类树，测量完整路径、子树查询和移动分类的耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20000, help='生成的分类数量')
+        parser.add_argument('--depth', type=int, default=12, help='分类树的最大深度')
+        parser.add_argument('--books', type=int, default=20000, help='生成的图书数量')
+        parser.add_argument('--samples', type=int, default=50, help='每项测量的采样次数')
+        parser.add_argument('--keep', action='store_true', help='保留生成的数据（默认测试结束后回滚）')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            nodes = self.build_tree(options['categories'], options['depth'], rng)
+            self.build_books(options['books'], nodes, rng)
+            self.measure(nodes, options['samples'], rng)
+            if not options['keep']:
+                transaction.set_rollback(True)
+        category_tree.invalidate()
+
+    def build_tree(self, count, max_depth, rng, batch_size=2000):
+        tag = f'{int(time.time()) % 100000:05d}'
+        levels = [[] for _ in range(max_depth)]
+        parents = {}
+        for i in range(count):
+            # 前 max_depth 个节点串成一条最深的链，其余随机挂到已有节点下
+            depth = i if i < max_depth else rng.randint(0, max_depth - 1)
+            parents[i] = rng.choice(levels[depth - 1]) if depth else None
+            levels[depth].append(i)
+
+        started = time.perf_counter()
+        codes = {i: f'bench-{tag}-{i}' for i in range(count)}
+        Category.objects.bulk_create(
+            [Category(name=f'分类{i}', code=codes[i]) for i in range(count)],
+            batch_size=batch_size,
+        )
+        ids = dict(Category.objects.filter(code__startswith=f'bench-{tag}-').values_list('code', 'id'))
+        pk = {i: ids[codes[i]] for i in range(count)}
+
+        # 按层级计算父级和物化路径后批量写回
+        categories = []
+        paths = {}
+        for depth, level in enumerate(levels):
+            for i in level:
+                parent = parents[i]
+                paths[i] = f'{paths[parent] if parent is not None else "/"}{pk[i]}/'
+                categories.append(Category(
+                    pk=pk[i],
+                    parent_id=pk[parent] if parent is not None else None,
+                    path=paths[i],
+                    depth=depth,
+                ))
+        Category.objects.bulk_update(categories, ['parent', 'path', 'depth'], batch_size=batch_size)
+        self.stdout.write(
+            f'生成 {count} 个分类（最大深度 {max_depth}），耗时 {time.perf_counter() - started:.1f} 秒'
+        )
+        return [(pk[i], depth) for depth, level in enumerate(levels) for i in level]
+
+    def build_books(self, count, nodes, rng, batch_size=5000):
+        started = time.perf_counter()
+        offset = Book.objects.count()
+        Book.objects.bulk_create(
+            [
+                Book(
+                    title=f'分类测试图书{i}', author='bench', isbn=f'C{offset + i:012d}',
+                    category_id=rng.choice(nodes)[0],
+                )
+                for i in range(count)
+            ],
+            batch_size=batch_size,
+        )
+        self.stdout.write(f'生成 {count} 本图书，耗时 {time.perf_counter() - started:.1f} 秒')
+
+    def measure(self, nodes, samples, rng):
+        category_tree.invalidate()
+        tree, elapsed = timed(category_tree.get_tree)
+        self.stdout.write(f'加载分类树：{len(tree.nodes)} 个节点，{elapsed:.1f}ms')
+
+        deepest = sorted(nodes, key=lambda node: -node[1])[:samples]
+        sample = [rng.choice(nodes)[0] for _ in range(samples)]
+
+        lookups = []
+        for pk, _ in deepest:
+            _, elapsed = timed(tree.full_path, pk)
+            lookups.append(elapsed)
+        legacy = []
+        for pk, _ in deepest[:10]:
+            category = Category.objects.get(pk=pk)
+            _, elapsed = timed(legacy_full_path, category)
+            legacy.append(elapsed)
+        self.report('完整路径（缓存树）', lookups)
+        self.report('完整路径（逐级查询）', legacy)
+
+        subtree = []
+        for pk in sample:
+            lookup = category_tree.subtree_lookup(tree.path(pk), 'category__path')
+            _, elapsed = timed(lambda: list(Book.objects.filter(**lookup).order_by('-created_at', '-id')[:20]))
+            subtree.append(elapsed)
+        self.report('子树图书查询（前 20 本）', subtree)
+
+        shallow = [pk for pk, depth in nodes if depth == 1]
+        moves = []
+        for _ in range(min(samples, 10)):
+            category = Category.objects.get(pk=rng.choice(shallow))
+            targets = [pk for pk, depth in nodes if depth == 0 and pk != category.parent_id]
+            if not targets:
+                break
+            category.parent_id = rng.choice(targets)
+            _, elapsed = timed(category.save)
+            moves.append(elapsed)
+        self.report('移动子树', moves)
+
+    def report(self, label, latencies):
+        if not latencies:
+            return
+        latencies = sorted(latencies)
+        p95 = percentile(latencies, 0.95)
+        self.stdout.write(
+            f'{label}: p50={statistics.median(latencies):.3f}ms p95={p95:.3f}ms max={latencies[-1]:.3f}ms'
+        )
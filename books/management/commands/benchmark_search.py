@@ -0,0 +1,101 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from books.benchmarks import percentile
+from books.models import Book
+from books import search
+
+# 用于生成测试书名、作者的词库
+TITLE_WORDS = [
+    '数据', '结构', '算法', '历史', '中国', '世界', '文学', '经济', '哲学', '心理',
+    '设计', '原理', '导论', '实践', '艺术', '科学', '现代', '古代', '城市', '自然',
+    '网络', '系统', '编程', '语言', '教育', '社会', '人生', '故事', '旅行', '未来',
+    'Python', 'Django', 'Linux', 'Web', 'Data', 'Design', 'History', 'Network',
+]
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN_NAMES = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚'
+
+
+class Command(BaseCommand):
+    help = '图书检索性能基准测试，输出查询延迟分位数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--populate', type=int, default=0, help='先生成指定数量的测试图书并建立索引')
+        parser.add_argument('--queries', type=int, default=200, help='执行的检索次数')
+        parser.add_argument('--page-size', type=int, default=20, help='每次检索取回的结果数')
+        parser.add_argument('--target-ms', type=float, default=20.0, help='p95 延迟目标（毫秒）')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['populate']:
+            self.populate(options['populate'], rng)
+
+        queries = self.build_queries(options['queries'], rng)
+        if not queries:
+            self.stdout.write(self.style.WARNING('没有可用于检索的图书'))
+            return
+
+        latencies = []
+        hits = 0
+        for query in queries:
+            started = time.perf_counter()
+            results = list(search.search_books(query)[:options['page_size']])
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += bool(results)
+
+        latencies.sort()
+        p95 = percentile(latencies, 0.95)
+        self.stdout.write(f'图书总数: {Book.objects.count()}')
+        self.stdout.write(f'检索次数: {len(latencies)}，有结果: {hits}')
+        self.stdout.write(
+            f'p50={statistics.median(latencies):.2f}ms '
+            f'p95={p95:.2f}ms max={latencies[-1]:.2f}ms'
+        )
+        if p95 <= options['target_ms']:
+            self.stdout.write(self.style.SUCCESS(f'p95 满足 {options["target_ms"]}ms 目标'))
+        else:
+            self.stdout.write(self.style.ERROR(f'p95 超出 {options["target_ms"]}ms 目标'))
+
+    def build_queries(self, count, rng):
+        """从现有图书中抽样书名片段、作者和 ISBN 作为检索词"""
+        max_id = Book.objects.order_by('-id').values_list('id', flat=True).first()
+        if not max_id:
+            return []
+        queries = []
+        for _ in range(count):
+            book = Book.objects.filter(id__gte=rng.randint(1, max_id)).order_by('id').first()
+            if book is None:
+                continue
+            kind = rng.random()
+            if kind < 0.6:
+                start = rng.randint(0, max(len(book.title) - 2, 0))
+                queries.append(book.title[start:start + rng.randint(2, 4)])
+            elif kind < 0.9:
+                queries.append(book.author)
+            else:
+                queries.append(book.isbn)
+        return queries
+
+    def populate(self, count, rng, batch_size=5000):
+        offset = Book.objects.count()
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            books = []
+            for i in range(size):
+                n = offset + created + i
+                title = ''.join(rng.sample(TITLE_WORDS, rng.randint(2, 4)))
+                author = rng.choice(SURNAMES) + ''.join(rng.sample(GIVEN_NAMES, rng.randint(1, 2)))
+                books.append(Book(title=title, author=author, isbn=f'B{n:012d}', quantity=3, available=3))
+            with transaction.atomic():
+                # bulk_create 不触发 post_save，因此这里直接批量建立索引
+                # MySQL 的 bulk_create 不回填主键，需要按 ISBN 重新读取
+                Book.objects.bulk_create(books, batch_size=batch_size)
+                books = Book.objects.filter(isbn__in=[book.isbn for book in books]).only('id', 'title', 'author', 'isbn')
+                search.index_books(books, batch_size=batch_size)
+            created += size
+            self.stdout.write(f'已生成 {created}/{count} 本测试图书')
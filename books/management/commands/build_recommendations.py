@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from books import recommendations
+
+class Command(BaseCommand):
+    help = '根据借阅记录计算"借过这本书的读者还借了"的相似图书'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true', help='只重算上次计算之后有新借阅影响到的图书')
+        parser.add_argument('--metric', choices=recommendations.METRICS, default='cosine', help='相似度')
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K, help='每本书保存的相似图书数量')
+        parser.add_argument('--min-co-borrowers', type=int, default=recommendations.MIN_CO_BORROWERS,
+                            help='共同借阅人数少于此数的不算相似')
+        parser.add_argument('--max-user-books', type=int, default=recommendations.MAX_USER_BOOKS,
+                            help='借书超过此数的读者不参与计算，0 表示不限制')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批写入的行数')
+
+    def handle(self, *args, **options):
+        result = recommendations.build(
+            metric=options['metric'],
+            top_k=options['top_k'],
+            min_co_borrowers=options['min_co_borrowers'],
+            max_user_books=options['max_user_books'],
+            incremental=options['incremental'],
+            batch_size=options['batch_size'],
+        )
+        mode = '增量' if result.mode == 'incremental' else '全量'
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode}计算完成：{result.borrowings} 条借阅，{result.books} 本图书，'
+            f'耗时 {result.seconds:.2f} 秒'
+        ))
@@ -1,38 +1,95 @@
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from books.models import BookBorrowing
-from books.views import create_notification
+from books import outbox
 
 class Command(BaseCommand):
     help = '检查逾期图书并发送提醒'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批写入的通知数量')
+        parser.add_argument('--due-soon-days', type=int, default=3, help='提前几天发送到期提醒')
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不修改数据')
+
     def handle(self, *args, **options):
-        # 查找即将到期的图书（3天内）
-        soon_due = BookBorrowing.objects.filter(
-            status='borrowed',
-            due_date__range=[timezone.now(), timezone.now() + timezone.timedelta(days=3)]
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        now = timezone.now()
+        started = time.monotonic()
+
+        # 逾期状态在查询时由 due_date 判断（BookBorrowing.objects.overdue()），不需要改写借阅记录
+        # 查找即将到期的图书，每条借阅只提醒一次
+        phase_started = time.monotonic()
+        soon_due = BookBorrowing.objects.outstanding().filter(
+            due_soon_notified_at__isnull=True,
+            due_date__range=[now, now + timezone.timedelta(days=options['due_soon_days'])],
         )
-        
-        for borrowing in soon_due:
-            create_notification(
-                user=borrowing.borrower,
-                notification_type='overdue',
-                title=f'图书即将到期提醒',
-                message=f'您借阅的《{borrowing.book.title}》将在 {borrowing.due_date.strftime("%Y-%m-%d")} 到期，请及时归还。',
-                related_book=borrowing.book
-            )
-            
+        sent = self.send_reminders(
+            soon_due, 'due_soon_notified_at', now,
+            title='图书即将到期提醒',
+            message='您借阅的《{title}》将在 {due_date:%Y-%m-%d} 到期，请及时归还。',
+        )
+        self.report('到期提醒', sent, phase_started)
+
         # 查找已逾期的图书
-        overdue = BookBorrowing.objects.filter(
-            status='borrowed',
-            due_date__lt=timezone.now()
+        phase_started = time.monotonic()
+        overdue = BookBorrowing.objects.overdue(now).filter(
+            overdue_notified_at__isnull=True,
+        )
+        sent = self.send_reminders(
+            overdue, 'overdue_notified_at', now,
+            title='图书逾期提醒',
+            message='您借阅的《{title}》已逾期，请尽快归还。',
         )
-        
-        for borrowing in overdue:
-            create_notification(
-                user=borrowing.borrower,
-                notification_type='overdue',
-                title=f'图书逾期提醒',
-                message=f'您借阅的《{borrowing.book.title}》已逾期，请尽快归还。',
-                related_book=borrowing.book
-            ) 
\ No newline at end of file
+        self.report('逾期提醒', sent, phase_started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if self.dry_run else ""}完成，总耗时 {time.monotonic() - started:.2f} 秒'
+        ))
+
+    def send_reminders(self, borrowings, flag_field, now, title, message):
+        """按主键分批为借阅记录生成提醒，并在同一事务中记录已提醒"""
+        if self.dry_run:
+            return borrowings.count()
+
+        sent = 0
+        last_id = 0
+        rows = borrowings.order_by('id').values_list(
+            'id', 'borrower_id', 'book_id', 'book__title', 'due_date'
+        )
+        while True:
+            batch = list(rows.filter(id__gt=last_id)[:self.batch_size])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            ids = [row[0] for row in batch]
+            notifications = [
+                {
+                    'recipient_id': borrower_id,
+                    'notification_type': 'overdue',
+                    'title': title,
+                    'message': message.format(title=book_title, due_date=due_date),
+                    'related_book_id': book_id,
+                }
+                for _, borrower_id, book_id, book_title, due_date in batch
+            ]
+            with transaction.atomic():
+                # 再次带上过滤条件，并发运行时已被其他进程处理的记录不会重复提醒
+                claimed = set(
+                    borrowings.filter(id__in=ids).select_for_update().values_list('id', flat=True)
+                )
+                notifications = [
+                    notification for row_id, notification in zip(ids, notifications)
+                    if row_id in claimed
+                ]
+                BookBorrowing.objects.filter(id__in=claimed).update(**{flag_field: now})
+                # 提醒写入发件箱，与"已提醒"标记同时提交
+                outbox.enqueue_many(notifications)
+            sent += len(notifications)
+        return sent
+
+    def report(self, label, count, phase_started):
+        self.stdout.write(f'{label}: {count} 条，耗时 {time.monotonic() - phase_started:.2f} 秒')
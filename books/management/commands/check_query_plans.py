@@ -0,0 +1,177 @@
+import io
+import re
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from books.models import Book, BookBorrowing, Category
+from books import replicas
+
+# 数据量会持续增长的表，这些表上的全表扫描视为回归
+LARGE_TABLES = {
+    'books_book', 'books_bookborrowing', 'books_notification', 'books_bookreservation',
+    'books_booksearchterm', 'books_broadcastmessage', 'auth_user',
+}
+
+# 有意为之的全表扫描：全馆库存汇总（结果有缓存，缓存失效后才执行）
+ALLOWED_SCANS = {
+    'statistics': {'books_book'},
+    'index': {'books_book'},
+    'library_status': {'books_book'},
+}
+
+
+# 会写数据库的场景，只在 --allow-writes 时运行
+WRITE_SCENARIOS = {'borrow_book', 'return_book', 'check_overdue_books'}
+
+_SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+
+
+class PlanRecorder:
+    """记录 SELECT 语句、参数及执行它的数据库别名，供之后在同一个库上 EXPLAIN"""
+
+    def __init__(self, alias, queries):
+        self.alias = alias
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((self.alias, sql, params))
+        return execute(sql, params, many, context)
+
+
+def sqlite_index(words, detail):
+    match = _SQLITE_INDEX_RE.search(detail)
+    if match:
+        return match.group(1)
+    if 'PRIMARY KEY' in detail or 'ROWID' in words:
+        return 'PRIMARY KEY'
+    return None
+
+
+def explain(connection, sql, params):
+    """返回 [(表名, 是否全表扫描, 使用的索引, 计划说明)]"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = []
+            for row in cursor.fetchall():
+                detail = row[-1]
+                words = detail.split()
+                # "SCAN books_book" 为全表扫描；"SCAN books_book USING INDEX ..." 为按索引顺序读取；
+                # "SCAN CONSTANT ROW" 是没有 FROM 的查询
+                if words[:2] == ['SCAN', 'CONSTANT']:
+                    continue
+                if words[:1] == ['SCAN'] and len(words) > 1:
+                    plan.append((words[1], 'USING' not in words, sqlite_index(words, detail), detail))
+                elif words[:1] == ['SEARCH'] and len(words) > 1:
+                    plan.append((words[1], False, sqlite_index(words, detail), detail))
+            return plan
+        if connection.vendor == 'mysql':
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0] for column in cursor.description]
+            plan = []
+            for row in cursor.fetchall():
+                row = dict(zip(columns, row))
+                detail = f'type={row["type"]} key={row["key"]} rows={row["rows"]} extra={row["Extra"]}'
+                plan.append((row['table'], row['type'] == 'ALL', row['key'], detail))
+            return plan
+    raise CommandError(f'不支持的数据库：{connection.vendor}')
+
+
+class Command(BaseCommand):
+    help = '访问主要页面并对其 SQL 执行 EXPLAIN，列出每条查询使用的索引，大表出现全表扫描时失败'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='以哪个读者身份访问（默认选最近借过书的读者）')
+        parser.add_argument('--verbose-plans', action='store_true', help='输出每条查询的完整执行计划')
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help='同时检查借书、还书和 check_overdue_books。请求与线上一样逐个提交，'
+                 '会留下借阅记录、通知和提醒标记，只应对一次性的数据库使用',
+        )
+
+    def handle(self, *args, **options):
+        user = self.pick_user(options['username'])
+        book = Book.objects.filter(available__gt=0).order_by('id').first()
+        category = Category.objects.order_by('id').first()
+        if book is None:
+            raise CommandError('没有图书数据，请先运行 seed_library')
+
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        scenarios = [
+            ('index', lambda: client.get(reverse('index'))),
+            ('library_status', lambda: client.get(reverse('library_status'))),
+            ('book_list', lambda: client.get(reverse('book_list'))),
+            ('book_list_search', lambda: client.get(reverse('book_list'), {'search_query': book.title[:2]})),
+            ('book_list_category', lambda: client.get(reverse('book_list'), {'category': category.pk if category else ''})),
+            ('book_detail', lambda: client.get(reverse('book_detail', args=[book.pk]))),
+            ('borrow_book', lambda: client.post(reverse('borrow_book', args=[book.pk]))),
+            ('return_book', lambda: client.post(reverse('return_book', args=[book.pk]))),
+            ('my_borrowings', lambda: client.get(reverse('my_borrowings'))),
+            ('notification_list', lambda: client.get(reverse('notification_list'))),
+            ('profile', lambda: client.get(reverse('profile'))),
+            ('statistics', lambda: client.get(reverse('statistics'))),
+            ('api_books', lambda: client.get(reverse('api_books'), {'available': '1'})),
+            ('api_books_batch', lambda: client.get(reverse('api_books'), {'isbn': book.isbn})),
+            ('api_availability', lambda: client.get(reverse('api_availability'), {'ids': book.pk})),
+            ('check_overdue_books', lambda: call_command('check_overdue_books', stdout=io.StringIO())),
+        ]
+
+        if not options['allow_writes']:
+            scenarios = [(name, run) for name, run in scenarios if name not in WRITE_SCENARIOS]
+
+        failures = []
+        checked = 0
+        # 不包在外层事务里：事务中的读取一律走主库，只读视图发往副本的查询就不会
+        # 按副本上的执行计划检查。查询记录在实际执行它的连接上，也在那个库上 EXPLAIN
+        for name, run in scenarios:
+            # 前一个场景的写入会让浏览器在粘滞期内只读主库，每个场景都从副本路由的初始状态开始
+            client.cookies.pop(replicas.get_setting('STICKY_COOKIE'), None)
+            queries = []
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(PlanRecorder(connection.alias, queries)))
+                run()
+            allowed = ALLOWED_SCANS.get(name, set())
+            seen = set()
+            for alias, sql, params in queries:
+                if (alias, sql) in seen:
+                    continue
+                seen.add((alias, sql))
+                checked += 1
+                plan = explain(connections[alias], sql, params)
+                if plan:
+                    indexes = ', '.join(f'{table}: {index or "全表扫描"}' for table, _, index, _ in plan)
+                    self.stdout.write(f'[{name}@{alias}] {indexes}')
+                if options['verbose_plans']:
+                    self.stdout.write(f'    {sql}')
+                    for *_, detail in plan:
+                        self.stdout.write(f'    {detail}')
+                for table, full_scan, _, detail in plan:
+                    if full_scan and table in LARGE_TABLES and table not in allowed:
+                        failures.append((name, table, detail, sql))
+
+        for name, table, detail, sql in failures:
+            self.stdout.write(self.style.ERROR(f'[{name}] {table} 全表扫描：{detail}'))
+            self.stdout.write(f'    {sql}')
+        if failures:
+            raise CommandError(f'{len(failures)} 条查询出现全表扫描（共检查 {checked} 条）')
+        self.stdout.write(self.style.SUCCESS(f'检查了 {checked} 条查询，没有发现大表的全表扫描'))
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'用户 {username} 不存在')
+        user_id = BookBorrowing.objects.order_by('-id').values_list('borrower_id', flat=True).first()
+        user = User.objects.filter(pk=user_id).first() or User.objects.filter(is_active=True).first()
+        if user is None:
+            raise CommandError('没有用户数据，请先运行 seed_library')
+        return user
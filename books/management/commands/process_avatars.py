@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books import avatars
+
+
+class Command(BaseCommand):
+    help = '为之前上传、还没有缩略图的头像生成缩略图，成功后删除原始文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='最多处理的头像数量')
+        parser.add_argument('--keep-originals', action='store_true', help='处理成功后保留原始文件')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        profiles = avatars.pending_profiles().order_by('pk')
+        if options['limit']:
+            profiles = profiles[:options['limit']]
+        processed = failed = 0
+        for profile in profiles.iterator():
+            if avatars.backfill(profile, delete_original=not options['keep_originals']):
+                processed += 1
+            else:
+                failed += 1
+        message = f'处理完成：{processed} 个头像，失败或跳过 {failed} 个，耗时 {time.monotonic() - started:.2f} 秒'
+        self.stdout.write(self.style.SUCCESS(message) if not failed else self.style.WARNING(message))
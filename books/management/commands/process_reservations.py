@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books import reservations
+
+
+class Command(BaseCommand):
+    help = '处理预约队列：留书过期的顺延给下一位读者，新增的可借副本分给排队的读者'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的过期预约数量')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        expired = reservations.expire_holds(batch_size=options['batch_size'])
+        self.stdout.write(f'留书过期: {expired} 条，耗时 {time.monotonic() - started:.2f} 秒')
+
+        phase_started = time.monotonic()
+        held = reservations.allocate_available()
+        self.stdout.write(f'分配可借副本: {held} 本，耗时 {time.monotonic() - phase_started:.2f} 秒')
+
+        self.stdout.write(self.style.SUCCESS(f'完成，总耗时 {time.monotonic() - started:.2f} 秒'))
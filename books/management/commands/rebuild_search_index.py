@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books.models import Book, BookSearchTerm
+from books import search
+
+class Command(BaseCommand):
+    help = '批量重建图书检索索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='每批处理的图书数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        started = time.monotonic()
+
+        BookSearchTerm.objects.all().delete()
+
+        # 按主键分批遍历，避免一次性加载全部图书
+        books = Book.objects.only('id', 'title', 'author', 'isbn').order_by('id')
+        last_id = 0
+        total_books = total_terms = 0
+        while True:
+            batch = list(books.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            total_terms += search.index_books(batch, batch_size=batch_size)
+            total_books += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'已索引 {total_books} 本图书')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'索引重建完成：{total_books} 本图书，{total_terms} 个检索词，耗时 {elapsed:.1f} 秒'
+        ))
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from books.models import Notification, NotificationCounter
+from books.notifications import unread_cache_key
+
+class Command(BaseCommand):
+    help = '核对并修复每个用户的未读通知计数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批核对的用户数量')
+        parser.add_argument('--dry-run', action='store_true', help='只报告偏差，不修改数据')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = fixed = 0
+        last_user_id = 0
+        while True:
+            stored = dict(
+                NotificationCounter.objects.filter(user_id__gt=last_user_id)
+                .order_by('user_id').values_list('user_id', 'unread_count')[:batch_size]
+            )
+            if not stored:
+                break
+            last_user_id = max(stored)
+            actual = dict(
+                Notification.objects.filter(recipient_id__in=stored, is_read=False)
+                .order_by().values('recipient_id').annotate(n=Count('id'))
+                .values_list('recipient_id', 'n')
+            )
+            for user_id, count in stored.items():
+                expected = actual.get(user_id, 0)
+                if count == expected:
+                    continue
+                fixed += 1
+                self.stdout.write(f'用户 #{user_id}: 计数 {count}，实际 {expected}')
+                if not options['dry_run']:
+                    NotificationCounter.objects.filter(user_id=user_id).update(unread_count=expected)
+                    cache.delete(unread_cache_key(user_id))
+            checked += len(stored)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if options["dry_run"] else ""}核对 {checked} 个用户，修复 {fixed} 个'
+        ))
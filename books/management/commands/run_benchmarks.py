@@ -0,0 +1,194 @@
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from books.benchmarks import percentile
+from books.middleware import QueryRecorder
+from books.models import Book, BookBorrowing, Category, Notification, UserBorrowStat
+from books import circulation
+
+SCENARIOS = (
+    'book_list', 'book_list_search', 'book_list_category', 'book_detail',
+    'borrow_book', 'return_book', 'statistics', 'profile', 'notification_list',
+)
+# 会写数据库的场景，只在 --allow-writes 时运行
+WRITE_SCENARIOS = ('borrow_book', 'return_book')
+
+
+class Command(BaseCommand):
+    help = '对主要视图做端到端基准测试，输出延迟分位数和查询数量（JSON）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='每个场景的请求次数')
+        parser.add_argument('--warmup', type=int, default=3, help='每个场景正式计时前的预热请求次数')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='只运行指定场景，可重复')
+        parser.add_argument('--username', help='以哪个读者身份访问（默认选借阅最多的读者）')
+        parser.add_argument('--output', help='把结果写入 JSON 文件（默认输出到标准输出）')
+        parser.add_argument('--label', default='', help='写入结果的标签，例如版本号')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help='运行借还书场景。请求与线上一样逐个提交，借阅记录、通知和统计会留在库里，'
+                 '只应对 seed_library 生成的一次性数据库使用',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.user = self.pick_user(options['username'])
+        self.client = Client(HTTP_HOST='localhost')
+        self.client.force_login(self.user)
+        self.book_ids = list(Book.objects.order_by('?').values_list('id', flat=True)[:500])
+        if not self.book_ids:
+            raise CommandError('没有图书数据，请先运行 seed_library')
+        self.available_ids = list(
+            Book.objects.filter(id__in=self.book_ids, available__gt=0).values_list('id', flat=True)
+        )
+        self.rng.shuffle(self.available_ids)
+        self.borrowed = []
+
+        scenarios = options['scenario'] or SCENARIOS
+        if not options['allow_writes']:
+            skipped = [name for name in scenarios if name in WRITE_SCENARIOS]
+            if skipped:
+                self.stderr.write(self.style.WARNING(
+                    f'跳过会写数据库的场景 {", ".join(skipped)}（需要 --allow-writes）'
+                ))
+            scenarios = [name for name in scenarios if name not in WRITE_SCENARIOS]
+
+        # 不包在外层事务里：外层事务中 on_commit 回调（缓存版本号、个人中心失效、
+        # 通知投递）不会执行，副本路由也会因为处在事务中而一律读主库，结果与线上不符
+        results = {}
+        try:
+            for name in scenarios:
+                results[name] = self.run_scenario(name, options['iterations'], options['warmup'])
+                self.stderr.write(
+                    f'{name}: p50={results[name]["p50_ms"]}ms p95={results[name]["p95_ms"]}ms '
+                    f'queries={results[name]["queries_max"]}'
+                )
+        finally:
+            # 归还测试中借出、没有被还书场景归还的图书，库存恢复原样
+            for book in Book.objects.filter(pk__in=self.borrowed):
+                try:
+                    circulation.return_book(self.user, book)
+                except circulation.NotBorrowed:
+                    pass
+
+        report = {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'database_name': str(connection.settings_dict['NAME']),
+            },
+            'dataset': {
+                'books': Book.objects.count(),
+                'categories': Category.objects.count(),
+                'users': User.objects.count(),
+                'borrowings': BookBorrowing.objects.count(),
+                'notifications': Notification.objects.count(),
+            },
+            'iterations': options['iterations'],
+            'scenarios': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stderr.write(self.style.SUCCESS(f'结果已写入 {options["output"]}'))
+        else:
+            self.stdout.write(output)
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'用户 {username} 不存在')
+        # 借阅最多的读者，读汇总表而不是对借阅记录分组计数
+        user_id = (
+            UserBorrowStat.objects.order_by('-borrow_count', 'user_id')
+            .values_list('user_id', flat=True).first()
+        )
+        user = User.objects.filter(pk=user_id).first() or User.objects.filter(is_active=True).first()
+        if user is None:
+            raise CommandError('没有用户数据，请先运行 seed_library')
+        return user
+
+    def requests_for(self, name):
+        """生成场景的请求 (method, url, data)"""
+        rng = self.rng
+        if name == 'book_list':
+            return 'get', reverse('book_list'), None
+        if name == 'book_list_search':
+            title = Book.objects.filter(pk=rng.choice(self.book_ids)).values_list('title', flat=True).first()
+            return 'get', reverse('book_list'), {'search_query': title[:2]}
+        if name == 'book_list_category':
+            category = Book.objects.filter(pk=rng.choice(self.book_ids)).values_list('category_id', flat=True).first()
+            return 'get', reverse('book_list'), {'category': category or ''}
+        if name == 'book_detail':
+            return 'get', reverse('book_detail', args=[rng.choice(self.book_ids)]), None
+        if name == 'borrow_book':
+            if not self.available_ids:
+                raise CommandError('样本中的可借图书不足，请减少 --iterations')
+            book_id = self.available_ids.pop()
+            self.borrowed.append(book_id)
+            return 'post', reverse('borrow_book', args=[book_id]), {}
+        if name == 'return_book':
+            book_id = self.borrowed.pop() if self.borrowed else (
+                BookBorrowing.objects.filter(borrower=self.user, returned=False)
+                .values_list('book_id', flat=True).first()
+            )
+            return 'post', reverse('return_book', args=[book_id]), {}
+        if name == 'statistics':
+            return 'get', reverse('statistics'), None
+        if name == 'profile':
+            return 'get', reverse('profile'), None
+        if name == 'notification_list':
+            return 'get', reverse('notification_list'), None
+        raise CommandError(f'未知场景 {name}')
+
+    def run_scenario(self, name, iterations, warmup):
+        if name == 'return_book' and len(self.borrowed) < iterations + warmup:
+            # 单独运行还书场景时先借出足够的图书
+            for _ in range(iterations + warmup - len(self.borrowed)):
+                self.request(*self.requests_for('borrow_book'))
+
+        latencies, query_counts, statuses = [], [], {}
+        for n in range(warmup + iterations):
+            method, url, data = self.requests_for(name)
+            elapsed, queries, status = self.request(method, url, data)
+            if n < warmup:
+                continue
+            latencies.append(elapsed)
+            query_counts.append(queries)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+        return {
+            'requests': len(latencies),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'max_ms': round(max(latencies), 2),
+            'mean_ms': round(statistics.fmean(latencies), 2),
+            'queries_p50': statistics.median(query_counts),
+            'queries_max': max(query_counts),
+            'status_codes': statuses,
+        }
+
+    def request(self, method, url, data):
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = getattr(self.client, method)(url, data)
+        elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, recorder.count, response.status_code
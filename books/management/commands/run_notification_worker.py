@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        '投递通知发件箱中的消息（站内通知、邮件等），失败的消息按退避时间重试。'
+        '生产环境用 --watch 常驻运行（systemd、supervisor 等），或由 cron 定期运行'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='每批取出的消息数量（默认见 NOTIFICATION_OUTBOX）')
+        parser.add_argument('--watch', action='store_true', help='持续运行，定期检查新的消息')
+        parser.add_argument('--interval', type=float, default=1, help='--watch 模式下没有消息时的等待间隔（秒）')
+        parser.add_argument('--keep-days', type=int, default=7, help='清理多少天前已投递的消息，0 表示不清理')
+
+    def handle(self, *args, **options):
+        if options['keep_days']:
+            deleted = outbox.purge_sent(options['keep_days'])
+            if deleted:
+                self.stdout.write(f'清理已投递的消息 {deleted} 条')
+
+        while True:
+            started = time.monotonic()
+            totals = {}
+            while True:
+                stats = outbox.process_batch(options['batch_size'])
+                if stats is None:
+                    break
+                for key, value in stats.items():
+                    totals[key] = totals.get(key, 0) + value
+            if totals:
+                self.stdout.write(
+                    f'投递 {totals.get("sent", 0)}，稍后重试 {totals.get("retried", 0)}，'
+                    f'放弃 {totals.get("failed", 0)}，耗时 {time.monotonic() - started:.2f} 秒'
+                )
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
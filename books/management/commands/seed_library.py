@@ -0,0 +1,295 @@
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from books.models import Book, BookBorrowing, BookReservation, Category, Notification
+from books import caching, category_tree, rollups, search
+from books.management.commands.benchmark_search import GIVEN_NAMES, SURNAMES, TITLE_WORDS
+
+# 预设规模：图书数量为基准，其余按比例生成
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+CATEGORY_WORDS = [
+    '文学', '历史', '哲学', '经济', '管理', '法律', '教育', '艺术', '计算机', '数学',
+    '物理', '化学', '生物', '医学', '工程', '地理', '政治', '心理', '语言', '军事',
+]
+
+NOTIFICATION_TEMPLATES = [
+    ('borrow', '成功借阅《{title}》', '您已成功借阅《{title}》，请按时归还。'),
+    ('return', '图书归还成功', '您已成功归还《{title}》，欢迎下次借阅。'),
+    ('overdue', '图书逾期提醒', '您借阅的《{title}》已逾期，请尽快归还。'),
+    ('system', '系统通知', '图书馆开放时间调整，请留意公告。'),
+]
+
+
+@contextmanager
+def historical_timestamps(*fields):
+    """暂时关闭 auto_now_add，以便写入过去的时间"""
+    previous = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, previous):
+            field.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = '批量生成测试数据：分类树、图书、读者、借阅记录、通知和预约'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), help='预设规模，按图书数量推算其他数据量')
+        parser.add_argument('--books', type=int, default=1000, help='图书数量')
+        parser.add_argument('--categories', type=int, help='分类数量（默认 图书数/50，最多 5000）')
+        parser.add_argument('--depth', type=int, default=4, help='分类树最大深度')
+        parser.add_argument('--users', type=int, help='读者数量（默认 图书数/10）')
+        parser.add_argument('--borrowings', type=int, help='借阅记录数量（默认 图书数×2）')
+        parser.add_argument('--notifications', type=int, help='通知数量（默认 图书数×2）')
+        parser.add_argument('--reservations', type=int, help='预约记录数量（默认 图书数/5）')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每批写入的行数')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        books = SCALES[options['scale']] if options['scale'] else options['books']
+        counts = {
+            'categories': options['categories'] or max(1, min(books // 50, 5000)),
+            'books': books,
+            'users': options['users'] or max(1, books // 10),
+            'borrowings': options['borrowings'] if options['borrowings'] is not None else books * 2,
+            'notifications': options['notifications'] if options['notifications'] is not None else books * 2,
+            'reservations': options['reservations'] if options['reservations'] is not None else books // 5,
+        }
+        if options['depth'] < 1:
+            raise CommandError('--depth 至少为 1')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.tag = f'{int(time.time()) % 1_000_000:06d}'
+        started = time.monotonic()
+
+        call_command('init_permissions', stdout=io.StringIO())
+        self.reader_group = Group.objects.get(name='读者')
+
+        category_ids = self.step('分类', self.seed_categories, counts['categories'], options['depth'])
+        book_quantities = self.step('图书', self.seed_books, counts['books'], category_ids)
+        user_ids = self.step('读者', self.seed_users, counts['users'])
+        self.step('借阅记录', self.seed_borrowings, counts['borrowings'], book_quantities, user_ids)
+        self.step('通知', self.seed_notifications, counts['notifications'], list(book_quantities), user_ids)
+        self.step('预约记录', self.seed_reservations, counts['reservations'], list(book_quantities), user_ids)
+        self.step('检索索引', self.build_search_index, min(book_quantities))
+        self.step('借阅统计', rollups.rebuild, self.batch_size)
+
+        category_tree.invalidate()
+        caching.touch(Book, Category, BookBorrowing)
+        self.stdout.write(self.style.SUCCESS(f'完成，总耗时 {time.monotonic() - started:.1f} 秒'))
+
+    def step(self, label, func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        self.stdout.write(f'{label}: 耗时 {time.monotonic() - started:.1f} 秒')
+        return result
+
+    def insert(self, model, objects):
+        """按批写入，objects 可以是生成器"""
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def new_ids(self, model, after_id):
+        # MySQL 的 bulk_create 不回填主键，按自增主键读回新写入的行
+        return model.objects.filter(id__gt=after_id).order_by('id')
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def random_past(self, days):
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    @transaction.atomic
+    def seed_categories(self, count, max_depth):
+        rng = self.rng
+        after = self.last_id(Category)
+        self.insert(Category, (
+            Category(
+                name=f'{rng.choice(CATEGORY_WORDS)}{i}',
+                code=f'seed-{self.tag}-{i}',
+            )
+            for i in range(count)
+        ))
+        ids = list(self.new_ids(Category, after).values_list('id', flat=True))
+
+        # 每个分类随机挂到上一层的某个分类下，按层计算物化路径
+        levels = [[] for _ in range(max_depth)]
+        categories = []
+        paths = {}
+        for n, pk in enumerate(ids):
+            depth = 0 if n < max(1, count // 20) else rng.randint(0, max_depth - 1)
+            while depth and not levels[depth - 1]:
+                depth -= 1
+            parent = rng.choice(levels[depth - 1]) if depth else None
+            paths[pk] = f'{paths[parent] if parent else "/"}{pk}/'
+            levels[depth].append(pk)
+            categories.append(Category(pk=pk, parent_id=parent, path=paths[pk], depth=depth))
+        Category.objects.bulk_update(categories, ['parent', 'path', 'depth'], batch_size=self.batch_size)
+        return ids
+
+    @transaction.atomic
+    def seed_books(self, count, category_ids):
+        rng = self.rng
+        after = self.last_id(Book)
+        with historical_timestamps(Book._meta.get_field('created_at')):
+            def books():
+                for i in range(count):
+                    quantity = rng.randint(1, 5)
+                    yield Book(
+                        title=''.join(rng.sample(TITLE_WORDS, rng.randint(2, 4))),
+                        author=rng.choice(SURNAMES) + ''.join(rng.sample(GIVEN_NAMES, rng.randint(1, 2))),
+                        category_id=rng.choice(category_ids),
+                        isbn=f'S{after + i + 1:012d}',
+                        quantity=quantity,
+                        available=quantity,
+                        created_at=self.random_past(730),
+                    )
+            self.insert(Book, books())
+        return dict(self.new_ids(Book, after).values_list('id', 'quantity'))
+
+    @transaction.atomic
+    def seed_users(self, count):
+        # 所有测试读者使用同一个密码，只计算一次哈希
+        password = make_password('library123')
+        after = self.last_id(User)
+        self.insert(User, (
+            User(
+                username=f'reader{self.tag}_{i}',
+                email=f'reader{self.tag}_{i}@example.com',
+                password=password,
+                date_joined=self.random_past(730),
+            )
+            for i in range(count)
+        ))
+        ids = list(self.new_ids(User, after).values_list('id', flat=True))
+        membership = User.groups.through
+        self.insert(membership, (membership(user_id=pk, group_id=self.reader_group.pk) for pk in ids))
+        return ids
+
+    @transaction.atomic
+    def seed_borrowings(self, count, book_quantities, user_ids):
+        rng = self.rng
+        book_ids = list(book_quantities)
+        available = dict(book_quantities)
+
+        def borrowings():
+            for _ in range(count):
+                book_id = rng.choice(book_ids)
+                borrowed = self.random_past(365)
+                due = borrowed + timedelta(days=30)
+                # 约八成已归还；没有可借副本的图书只生成已归还的记录
+                returned = rng.random() < 0.8 or available[book_id] == 0
+                if returned:
+                    latest = min(self.now, due + timedelta(days=10))
+                    return_date = borrowed + (latest - borrowed) * rng.random()
+                    status = 'returned'
+                else:
+                    available[book_id] -= 1
+                    return_date = None
+                    # 逾期在查询时按应还时间判断，不保存在 status 中
+                    status = 'borrowed'
+                yield BookBorrowing(
+                    book_id=book_id,
+                    borrower_id=rng.choice(user_ids),
+                    borrowed_date=borrowed,
+                    due_date=due,
+                    return_date=return_date,
+                    status=status,
+                    returned=returned,
+                )
+
+        with historical_timestamps(BookBorrowing._meta.get_field('borrowed_date')):
+            self.insert(BookBorrowing, borrowings())
+        Book.objects.bulk_update(
+            [Book(pk=pk, available=value) for pk, value in available.items() if value != book_quantities[pk]],
+            ['available'],
+            batch_size=self.batch_size,
+        )
+
+    @transaction.atomic
+    def seed_notifications(self, count, book_ids, user_ids):
+        rng = self.rng
+        titles = dict(Book.objects.filter(id__in=book_ids[:1000]).values_list('id', 'title'))
+        sample_books = list(titles)
+
+        def notifications():
+            for _ in range(count):
+                notification_type, title, message = rng.choice(NOTIFICATION_TEMPLATES)
+                book_id = rng.choice(sample_books)
+                yield Notification(
+                    recipient_id=rng.choice(user_ids),
+                    notification_type=notification_type,
+                    title=title.format(title=titles[book_id]),
+                    message=message.format(title=titles[book_id]),
+                    related_book_id=None if notification_type == 'system' else book_id,
+                    is_read=rng.random() < 0.7,
+                    created_at=self.random_past(180),
+                )
+
+        # 接收者都是新生成的读者，还没有未读计数行，下次读取时按实际数量建立
+        with historical_timestamps(Notification._meta.get_field('created_at')):
+            self.insert(Notification, notifications())
+
+    @transaction.atomic
+    def seed_reservations(self, count, book_ids, user_ids):
+        rng = self.rng
+        # 只有全部借出的图书才会有人排队，其余预约都是已结束的历史记录
+        unavailable = set(
+            Book.objects.filter(id__gte=min(book_ids), available=0).values_list('id', flat=True)
+        )
+        positions = {}
+
+        def reservations():
+            for date in sorted(self.random_past(90) for _ in range(count)):
+                book_id = rng.choice(book_ids)
+                positions[book_id] = positions.get(book_id, 0) + 1
+                if book_id in unavailable and rng.random() < 0.5:
+                    status = 'waiting'
+                else:
+                    status = rng.choice(('fulfilled', 'fulfilled', 'cancelled', 'expired'))
+                yield BookReservation(
+                    book_id=book_id,
+                    reservationer_id=rng.choice(user_ids),
+                    reservation_date=date,
+                    returned=status != 'waiting',
+                    status=status,
+                    position=positions[book_id],
+                )
+
+        with historical_timestamps(BookReservation._meta.get_field('reservation_date')):
+            self.insert(BookReservation, reservations())
+
+    def build_search_index(self, first_book_id):
+        books = Book.objects.filter(id__gte=first_book_id).order_by('id').only('id', 'title', 'author', 'isbn')
+        last_id = first_book_id - 1
+        while True:
+            batch = list(books.filter(id__gt=last_id)[:self.batch_size])
+            if not batch:
+                break
+            search.index_books(batch, batch_size=self.batch_size)
+            last_id = batch[-1].pk
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from books.broadcasts import CHUNK_SIZE, pending_broadcasts, send_broadcast
+
+
+class Command(BaseCommand):
+    help = '发送等待中的群发消息（可重复运行，中断后从断点继续）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='每批写入发件箱的通知数量')
+        parser.add_argument('--watch', action='store_true', help='持续运行，定期检查新的群发消息')
+        parser.add_argument('--interval', type=float, default=5, help='--watch 模式下的检查间隔（秒）')
+
+    def handle(self, *args, **options):
+        while True:
+            for broadcast_id in list(pending_broadcasts().values_list('id', flat=True)):
+                started = time.monotonic()
+                broadcast = send_broadcast(broadcast_id, options['chunk_size'], progress=self.progress)
+                elapsed = time.monotonic() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f'《{broadcast.title}》发送完成：{broadcast.sent_count} 人，耗时 {elapsed:.2f} 秒'
+                ))
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+    def progress(self, broadcast):
+        if broadcast.status != 'done':
+            self.stdout.write(
+                f'《{broadcast.title}》已发送 {broadcast.sent_count}/{broadcast.total_recipients}'
+            )
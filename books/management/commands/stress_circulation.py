@@ -0,0 +1,161 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from books.benchmarks import percentile
+from books.models import Book, BookBorrowing, Notification
+from books import circulation
+
+# 数据库返回的锁冲突错误：SQLite 的 database is locked，MySQL 的 1205/1213
+LOCK_ERROR_MARKERS = ('locked', 'deadlock', 'lock wait timeout')
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in LOCK_ERROR_MARKERS)
+
+
+class Command(BaseCommand):
+    help = '并发借还压力测试：多线程对同一本书反复借阅/归还，报告吞吐量、锁等待和最终一致性'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='并发线程数')
+        parser.add_argument('--operations', type=int, default=2000, help='借阅/归还操作总数')
+        parser.add_argument('--copies', type=int, default=5, help='测试图书的副本数')
+        parser.add_argument('--users', type=int, default=64, help='参与测试的读者数量')
+        parser.add_argument('--max-retries', type=int, default=20, help='遇到锁冲突时的最大重试次数')
+        parser.add_argument('--keep', action='store_true', help='测试结束后保留测试数据')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        users_count = max(options['users'], threads)
+        self.max_retries = options['max_retries']
+        self.lock = threading.Lock()
+        self.lock_retries = 0
+        self.lock_wait = 0.0
+        self.failures = 0
+
+        tag = f'{int(time.time()) % 100000:05d}'
+        book = Book.objects.create(
+            title=f'压力测试图书 {tag}',
+            author='stress',
+            isbn=f'STRESS{tag}'[:13],
+            quantity=options['copies'],
+            available=options['copies'],
+        )
+        users = [
+            User.objects.create(username=f'stress_{tag}_{i}')
+            for i in range(users_count)
+        ]
+
+        # 每个线程独占一组读者，线程内自行记录谁借着书，不需要额外加锁
+        groups = [users[i::threads] for i in range(threads)]
+        per_thread = [options['operations'] // threads] * threads
+        for i in range(options['operations'] % threads):
+            per_thread[i] += 1
+
+        self.stdout.write(
+            f'图书 #{book.pk}：{options["copies"]} 个副本，{threads} 个线程，'
+            f'{users_count} 个读者，共 {options["operations"]} 次操作'
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = list(executor.map(
+                lambda args: self.worker(book, *args),
+                [(group, count, random.Random((options['seed'] or 0) + i)) for i, (group, count) in enumerate(zip(groups, per_thread))],
+            ))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(lat for result in results for lat in result['latencies'])
+        borrowed = sum(result['borrowed'] for result in results)
+        returned = sum(result['returned'] for result in results)
+        unavailable = sum(result['unavailable'] for result in results)
+
+        self.stdout.write(f'耗时 {elapsed:.2f} 秒，吞吐量 {len(latencies) / elapsed:.1f} 次/秒')
+        self.stdout.write(f'借出 {borrowed}，归还 {returned}，无可借副本 {unavailable}，失败 {self.failures}')
+        if latencies:
+            p95 = percentile(latencies, 0.95)
+            self.stdout.write(
+                f'延迟 p50={statistics.median(latencies):.2f}ms p95={p95:.2f}ms max={latencies[-1]:.2f}ms'
+            )
+        self.stdout.write(f'锁冲突重试 {self.lock_retries} 次，累计等待 {self.lock_wait * 1000:.1f}ms')
+
+        ok = self.check_consistency(book, borrowed, returned)
+        if not options['keep']:
+            Notification.objects.filter(recipient__in=users).delete()
+            book.delete()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        if not ok:
+            raise CommandError('一致性检查失败')
+
+    def worker(self, book, users, count, rng):
+        result = {'latencies': [], 'borrowed': 0, 'returned': 0, 'unavailable': 0}
+        holding = set()
+        try:
+            for _ in range(count):
+                user = rng.choice(users)
+                started = time.perf_counter()
+                if user.pk in holding:
+                    if self.attempt(circulation.return_book, user, book):
+                        holding.discard(user.pk)
+                        result['returned'] += 1
+                else:
+                    try:
+                        if self.attempt(circulation.borrow_book, user, book):
+                            holding.add(user.pk)
+                            result['borrowed'] += 1
+                    except circulation.BookUnavailable:
+                        result['unavailable'] += 1
+                result['latencies'].append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+        return result
+
+    def attempt(self, func, *args):
+        """执行一次借还操作，遇到锁冲突时退避重试"""
+        for retry in range(self.max_retries + 1):
+            attempt_started = time.perf_counter()
+            try:
+                func(*args)
+                return True
+            except OperationalError as e:
+                if not is_lock_error(e) or retry == self.max_retries:
+                    with self.lock:
+                        self.failures += 1
+                    self.stderr.write(f'操作失败: {e}')
+                    return False
+                backoff = min(0.001 * 2 ** retry, 0.1)
+                time.sleep(backoff)
+                with self.lock:
+                    self.lock_retries += 1
+                    self.lock_wait += time.perf_counter() - attempt_started
+                close_old_connections()
+        return False
+
+    def check_consistency(self, book, borrowed, returned):
+        book.refresh_from_db()
+        active = BookBorrowing.objects.filter(book=book, returned=False).count()
+        total = BookBorrowing.objects.filter(book=book).count()
+        expected = book.quantity - active
+
+        self.stdout.write(
+            f'最终库存 available={book.available}，quantity={book.quantity}，'
+            f'未归还借阅 {active}，借阅记录 {total}'
+        )
+        ok = (
+            book.available == expected
+            and 0 <= book.available <= book.quantity
+            and total == borrowed
+            and active == borrowed - returned
+        )
+        if ok:
+            self.stdout.write(self.style.SUCCESS('一致性检查通过'))
+        else:
+            self.stdout.write(self.style.ERROR(f'一致性检查失败：期望 available={expected}'))
+        return ok
@@ -0,0 +1,253 @@
+"""
+请求性能统计
+
+RequestProfilingMiddleware 记录每个请求的 SQL 数量、数据库耗时、模板渲染耗时
+和总耗时，按 URL 名称汇总，并通过 Server-Timing 响应头返回给浏览器开发者工具。
+慢请求和超出查询预算的请求会把最耗时的几条 SQL 写入 books.performance 日志。
+
+统计会替换 Template.render 并给每个响应加上 Server-Timing 头，只在 DEBUG 或
+ENABLED 打开时启用；否则中间件在加载时抛出 MiddlewareNotUsed，不做任何修改。
+
+配置（均可省略）::
+
+    REQUEST_PROFILING = {
+        'ENABLED': False,
+        'SLOW_REQUEST_MS': 500,
+        'TOP_QUERIES': 5,
+        'QUERY_BUDGETS': {'book_list': 8},
+    }
+"""
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger('books.performance')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+    'QUERY_BUDGETS': {},
+}
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'REQUEST_PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def profiling_enabled():
+    return settings.DEBUG or get_setting('ENABLED')
+
+
+class QueryRecorder:
+    """记录代码块中执行的 SQL 及耗时
+
+    with QueryRecorder() as recorder:
+        ...
+    recorder.count, recorder.db_ms, recorder.top_queries()
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.template_ms = 0.0
+        self.template_queries = 0
+        self._rendering = 0
+        self._token = None
+        self.parent = None
+
+    def __enter__(self):
+        install_query_recording()
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_ms(self):
+        return sum(duration for _, duration in self.queries)
+
+    def top_queries(self, limit=5):
+        """按 SQL 合并后耗时最多的查询 [(sql, 执行次数, 总耗时)]，重复执行的查询通常就是 N+1"""
+        grouped = {}
+        for sql, duration in self.queries:
+            times, total = grouped.get(sql, (0, 0.0))
+            grouped[sql] = (times + 1, total + duration)
+        ranked = sorted(grouped.items(), key=lambda item: (-item[1][1], -item[1][0]))
+        return [(sql, times, total) for sql, (times, total) in ranked[:limit]]
+
+    def format_queries(self, limit=5):
+        return '\n'.join(
+            f'  {total:8.2f}ms  x{times:<3d} {sql}' for sql, times, total in self.top_queries(limit)
+        )
+
+
+_original_render = Template.render
+_patch_lock = threading.Lock()
+
+
+def _active_recorders():
+    recorder = _current.get()
+    while recorder is not None:
+        yield recorder
+        recorder = recorder.parent
+
+
+def _record_query(execute, sql, params, many, context):
+    recorders = list(_active_recorders())
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = (time.perf_counter() - started) * 1000
+        for recorder in recorders:
+            recorder.queries.append((sql, duration))
+            if recorder._rendering:
+                recorder.template_queries += 1
+
+
+def install_query_recording():
+    """给当前线程的数据库连接挂上查询记录，查询记到当前上下文中的 QueryRecorder 上
+
+    记录器挂上后不再移除，没有活动的记录器时直接执行查询。
+    """
+    for connection in connections.all():
+        if _record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_record_query)
+
+
+def _timed_render(self, context=None, request=None):
+    recorders = list(_active_recorders())
+    if not recorders:
+        return _original_render(self, context, request)
+    # 表单控件等也会通过这里渲染子模板，只累计最外层模板的耗时；
+    # 渲染期间执行的查询（模板里访问关联对象等）单独计数
+    for recorder in recorders:
+        recorder._rendering += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        for recorder in recorders:
+            recorder._rendering -= 1
+            if not recorder._rendering:
+                recorder.template_ms += elapsed
+
+
+def install_template_timing():
+    with _patch_lock:
+        if Template.render is not _timed_render:
+            Template.render = _timed_render
+
+
+class RequestStats:
+    """进程内按 URL 名称汇总的请求统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.views = {}
+
+    def record(self, name, queries, db_ms, template_ms, total_ms):
+        with self._lock:
+            stats = self.views.setdefault(name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'db_ms': 0.0, 'template_ms': 0.0, 'total_ms': 0.0, 'max_total_ms': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries
+            stats['max_queries'] = max(stats['max_queries'], queries)
+            stats['db_ms'] += db_ms
+            stats['template_ms'] += template_ms
+            stats['total_ms'] += total_ms
+            stats['max_total_ms'] = max(stats['max_total_ms'], total_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self.views.items()}
+
+
+request_stats = RequestStats()
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class RequestProfilingMiddleware:
+    # 同时支持 WSGI 和 ASGI，异步视图不会因为这个中间件被包回同步调用
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_template_timing()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # 数据库连接按线程区分，异步 ORM 的查询在 sync_to_async 的线程里执行，
+        # 要在那个线程的连接上挂记录器
+        await sync_to_async(install_query_recording)()
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, started)
+
+    def finish(self, request, response, recorder, started):
+        total_ms = (time.perf_counter() - started) * 1000
+
+        name = url_name(request)
+        request_stats.record(name, recorder.count, recorder.db_ms, recorder.template_ms, total_ms)
+        response['Server-Timing'] = (
+            f'db;dur={recorder.db_ms:.1f};desc="{recorder.count} queries", '
+            f'tpl;dur={recorder.template_ms:.1f}, '
+            f'total;dur={total_ms:.1f}'
+        )
+
+        budget = get_setting('QUERY_BUDGETS').get(name)
+        over_budget = budget is not None and recorder.count > budget
+        if over_budget or total_ms >= get_setting('SLOW_REQUEST_MS'):
+            logger.warning(
+                '%s %s [%s] %.1fms, %d queries (budget %s, %d in templates), db %.1fms, templates %.1fms\n%s',
+                request.method, request.path, name, total_ms, recorder.count, budget,
+                recorder.template_queries, recorder.db_ms, recorder.template_ms,
+                recorder.format_queries(get_setting('TOP_QUERIES')),
+            )
+        else:
+            logger.debug(
+                '%s %s [%s] %.1fms, %d queries, db %.1fms, templates %.1fms',
+                request.method, request.path, name, total_ms, recorder.count,
+                recorder.db_ms, recorder.template_ms,
+            )
+        return response
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=16, verbose_name='检索词')),
+                ('weight', models.PositiveSmallIntegerField(default=1, verbose_name='权重')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='books.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '图书检索词',
+                'verbose_name_plural': '图书检索词',
+                'db_table': 'books_booksearchterm',
+                'indexes': [models.Index(fields=['term', 'weight', 'book'], name='search_term_weight_idx')],
+                'constraints': [models.UniqueConstraint(fields=('term', 'book'), name='uniq_search_term_book')],
+            },
+        ),
+    ]
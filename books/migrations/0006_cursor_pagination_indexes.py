@@ -0,0 +1,27 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_booksearchterm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['borrower', 'borrowed_date', 'id'], name='borrowing_borrower_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'created_at', 'id'], name='notification_recipient_idx'),
+        ),
+    ]
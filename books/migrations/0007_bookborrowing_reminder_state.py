@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookborrowing',
+            name='due_soon_notified_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='到期提醒时间'),
+        ),
+        migrations.AddField(
+            model_name='bookborrowing',
+            name='overdue_notified_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='逾期提醒时间'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0007_bookborrowing_reminder_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookBorrowStat',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stat', serialize=False, to='books.book', verbose_name='图书')),
+                ('borrow_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='借阅次数')),
+            ],
+            options={
+                'verbose_name': '图书借阅统计',
+                'verbose_name_plural': '图书借阅统计',
+                'db_table': 'books_bookborrowstat',
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryBorrowStat',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stat', serialize=False, to='books.category', verbose_name='分类')),
+                ('borrow_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='借阅次数')),
+            ],
+            options={
+                'verbose_name': '分类借阅统计',
+                'verbose_name_plural': '分类借阅统计',
+                'db_table': 'books_categoryborrowstat',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyBorrowStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('borrow_count', models.PositiveIntegerField(default=0, verbose_name='借阅次数')),
+                ('return_count', models.PositiveIntegerField(default=0, verbose_name='归还次数')),
+            ],
+            options={
+                'verbose_name': '每日借阅统计',
+                'verbose_name_plural': '每日借阅统计',
+                'db_table': 'books_dailyborrowstat',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserBorrowStat',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_stat', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='读者')),
+                ('borrow_count', models.PositiveIntegerField(db_index=True, default=0, verbose_name='借阅次数')),
+            ],
+            options={
+                'verbose_name': '读者借阅统计',
+                'verbose_name_plural': '读者借阅统计',
+                'db_table': 'books_userborrowstat',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0008_borrow_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('unread_count', models.IntegerField(default=0, verbose_name='未读数量')),
+            ],
+            options={
+                'verbose_name': '未读通知计数',
+                'verbose_name_plural': '未读通知计数',
+                'db_table': 'books_notificationcounter',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    """按层级为已有分类计算物化路径"""
+    Category = apps.get_model('books', 'Category')
+    rows = list(Category.objects.values_list('id', 'parent_id'))
+    children = {}
+    for pk, parent_id in rows:
+        children.setdefault(parent_id, []).append(pk)
+
+    paths = {}
+    stack = [(pk, '/') for pk in children.get(None, [])]
+    while stack:
+        pk, parent_path = stack.pop()
+        paths[pk] = f'{parent_path}{pk}/'
+        stack.extend((child, paths[pk]) for child in children.get(pk, []))
+
+    for pk, path in paths.items():
+        Category.objects.filter(pk=pk).update(path=path, depth=path.count('/') - 2)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='层级'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=500, verbose_name='分类路径'),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0010_category_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='消息标题')),
+                ('message', models.TextField(verbose_name='消息内容')),
+                ('target', models.CharField(choices=[('all', '全部用户'), ('staff', '管理员'), ('group', '指定用户组'), ('users', '指定用户')], default='all', max_length=10, verbose_name='发送对象')),
+                ('status', models.CharField(choices=[('pending', '等待发送'), ('sending', '发送中'), ('done', '已完成')], db_index=True, default='pending', max_length=10, verbose_name='状态')),
+                ('total_recipients', models.IntegerField(blank=True, null=True, verbose_name='接收人数')),
+                ('sent_count', models.IntegerField(default=0, verbose_name='已发送数量')),
+                ('last_user_id', models.IntegerField(default=0, verbose_name='已发送到的用户ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始发送时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='auth.group', verbose_name='用户组')),
+                ('recipients', models.ManyToManyField(blank=True, related_name='targeted_broadcasts', to=settings.AUTH_USER_MODEL, verbose_name='指定用户')),
+                ('sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sent_broadcasts', to=settings.AUTH_USER_MODEL, verbose_name='发送者')),
+            ],
+            options={
+                'verbose_name': '群发消息',
+                'verbose_name_plural': '群发消息',
+                'db_table': 'books_broadcastmessage',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='broadcast',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='notifications', to='books.broadcastmessage', verbose_name='所属群发消息'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['broadcast', 'is_read'], name='notification_broadcast_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_broadcastmessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['borrowed_date', 'id'], name='borrowing_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_borrowing_export_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['borrower', 'status', 'due_date'], name='borrowing_borrower_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['status', 'due_date'], name='borrowing_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['book', 'returned'], name='reservation_book_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_queue(apps, schema_editor):
+    """按预约时间为已有预约编排队序号，未归还的预约进入排队状态"""
+    BookReservation = apps.get_model('books', 'BookReservation')
+    positions = {}
+    batch = []
+    rows = BookReservation.objects.order_by('book_id', 'reservation_date', 'id').values_list('id', 'book_id', 'returned')
+    for pk, book_id, returned in rows.iterator(chunk_size=5000):
+        positions[book_id] = positions.get(book_id, 0) + 1
+        batch.append(BookReservation(
+            pk=pk, position=positions[book_id], status='fulfilled' if returned else 'waiting',
+        ))
+        if len(batch) >= 5000:
+            BookReservation.objects.bulk_update(batch, ['position', 'status'])
+            batch = []
+    if batch:
+        BookReservation.objects.bulk_update(batch, ['position', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_hot_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookreservation',
+            name='status',
+            field=models.CharField(choices=[('waiting', '排队中'), ('ready', '待取书'), ('fulfilled', '已借出'), ('cancelled', '已取消'), ('expired', '已过期')], default='waiting', max_length=20, verbose_name='状态'),
+        ),
+        migrations.AddField(
+            model_name='bookreservation',
+            name='position',
+            field=models.PositiveIntegerField(null=True, verbose_name='排队序号'),
+        ),
+        migrations.AddField(
+            model_name='bookreservation',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='留书时间'),
+        ),
+        migrations.AddField(
+            model_name='bookreservation',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='留书截止时间'),
+        ),
+        migrations.RunPython(populate_queue, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='bookreservation',
+            name='position',
+            field=models.PositiveIntegerField(verbose_name='排队序号'),
+        ),
+        # 预约改为按 status 查询后不再有按 (book, returned) 的过滤，这个索引由
+        # reservation_queue_idx (book, status, position) 取代，保留只会增加写入开销
+        migrations.RemoveIndex(
+            model_name='bookreservation',
+            name='reservation_book_returned_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['book', 'status', 'position'], name='reservation_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['status', 'hold_expires_at'], name='reservation_hold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookreservation',
+            index=models.Index(fields=['reservationer', 'status'], name='reservation_user_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookreservation',
+            constraint=models.UniqueConstraint(fields=('book', 'position'), name='reservation_book_position_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_reservation_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=20, verbose_name='投递渠道')),
+                ('notification_type', models.CharField(choices=[('borrow', '借阅提醒'), ('return', '归还提醒'), ('overdue', '逾期提醒'), ('reserve', '预约提醒'), ('system', '系统通知')], max_length=20, verbose_name='通知类型')),
+                ('title', models.CharField(max_length=200, verbose_name='通知标题')),
+                ('message', models.TextField(verbose_name='通知内容')),
+                ('status', models.CharField(choices=[('pending', '待投递'), ('sent', '已投递'), ('failed', '投递失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='失败次数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次投递时间')),
+                ('last_error', models.TextField(blank=True, verbose_name='最近一次错误')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='投递时间')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='接收者')),
+                ('related_book', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='books.book', verbose_name='相关图书')),
+            ],
+            options={
+                'verbose_name': '通知发件箱',
+                'verbose_name_plural': '通知发件箱',
+                'db_table': 'books_notificationoutbox',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_stored_overdue(apps, schema_editor):
+    """逾期改为查询时判断，status 只保留借出和归还两种取值"""
+    BookBorrowing = apps.get_model('books', 'BookBorrowing')
+    BookBorrowing.objects.filter(status='overdue').update(status='borrowed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_stored_overdue, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='bookborrowing',
+            name='borrowing_borrower_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bookborrowing',
+            name='borrowing_status_due_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['borrower', 'returned', 'due_date'], name='borrowing_borrower_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['returned', 'due_date'], name='borrowing_open_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_effective_borrowing_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='头像摘要'),
+        ),
+    ]
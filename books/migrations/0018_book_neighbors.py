@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_userprofile_avatar_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mode', models.CharField(choices=[('full', '全量'), ('incremental', '增量')], max_length=12, verbose_name='方式')),
+                ('metric', models.CharField(max_length=10, verbose_name='相似度')),
+                ('last_borrowing_id', models.BigIntegerField(verbose_name='处理到的借阅记录')),
+                ('borrowings', models.PositiveIntegerField(default=0, verbose_name='借阅记录数')),
+                ('books', models.PositiveIntegerField(default=0, verbose_name='更新的图书数')),
+                ('seconds', models.FloatField(default=0, verbose_name='耗时（秒）')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='计算时间')),
+            ],
+            options={
+                'verbose_name': '相似图书计算记录',
+                'verbose_name_plural': '相似图书计算记录',
+                'db_table': 'books_recommendationbuild',
+            },
+        ),
+        migrations.CreateModel(
+            name='BookNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='排名')),
+                ('score', models.FloatField(verbose_name='相似度')),
+                ('co_borrowers', models.PositiveIntegerField(verbose_name='共同借阅人数')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='books.book', verbose_name='图书')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='books.book', verbose_name='相似图书')),
+            ],
+            options={
+                'verbose_name': '相似图书',
+                'verbose_name_plural': '相似图书',
+                'db_table': 'books_bookneighbor',
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='uniq_neighbor_book_rank')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_book_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('label', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='模型')),
+                ('version', models.BigIntegerField(verbose_name='版本号')),
+            ],
+            options={
+                'verbose_name': '缓存版本',
+                'verbose_name_plural': '缓存版本',
+                'db_table': 'books_cacheversion',
+            },
+        ),
+    ]
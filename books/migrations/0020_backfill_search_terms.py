@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:12
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def backfill_search_terms(apps, schema_editor):
+    """为还没有检索词的图书建立索引
+
+    0005 只建了 BookSearchTerm 表，升级前已有的图书在运行 rebuild_search_index
+    之前都搜不到。已有索引的图书跳过，重复执行不会产生重复的检索词。
+    """
+    from books.search import FIELD_WEIGHTS, tokenize
+
+    Book = apps.get_model('books', 'Book')
+    BookSearchTerm = apps.get_model('books', 'BookSearchTerm')
+    books = (
+        Book.objects.filter(search_terms__isnull=True)
+        .order_by('id').values_list('id', *[field for field, _ in FIELD_WEIGHTS])
+    )
+    last_id = 0
+    while True:
+        batch = list(books.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        terms = []
+        for book_id, *values in batch:
+            weights = {}
+            for (_, weight), value in zip(FIELD_WEIGHTS, values):
+                for term in tokenize(value):
+                    weights[term] = weights.get(term, 0) + weight
+            terms.extend(
+                BookSearchTerm(book_id=book_id, term=term, weight=weight)
+                for term, weight in weights.items()
+            )
+        BookSearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_cache_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
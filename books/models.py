@@ -1,4 +1,7 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User, Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
@@ -10,12 +13,19 @@ class Category(models.Model):
     description = models.TextField('描述', blank=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间', null=True, blank=True)
     update_at = models.DateTimeField(auto_now=True, verbose_name='更新时间', null=True, blank=True)
+    # 物化路径：从根到自身的主键序列，如 "/1/5/12/"，用于子树查询
+    path = models.CharField(max_length=500, default='', editable=False, db_index=True, verbose_name='分类路径')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='层级')
 
     def __str__(self):
         return self.name
 
     def get_full_path(self):
         """获取完整的分类路径"""
+        from .category_tree import get_tree
+        full_path = get_tree().full_path(self.pk)
+        if full_path is not None:
+            return full_path
         path = [self.name]
         current = self
         while current.parent:
@@ -23,6 +33,40 @@ class Category(models.Model):
             path.append(current.name)
         return ' > '.join(reversed(path))
 
+    def clean(self):
+        if self.pk and self.parent_id and self.path:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if parent_path.startswith(self.path):
+                raise ValidationError({'parent': '不能把分类移动到自身或其子分类下'})
+
+    def save(self, *args, **kwargs):
+        """保存后维护物化路径，移动分类时同步更新整棵子树"""
+        with transaction.atomic():
+            stored = None
+            if self.pk:
+                stored = Category.objects.filter(pk=self.pk).values_list('path', 'depth').first()
+            super().save(*args, **kwargs)
+
+            parent_path = '/'
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or '/'
+            new_path = f'{parent_path}{self.pk}/'
+            new_depth = new_path.count('/') - 2
+            old_path, old_depth = stored or ('', 0)
+            if old_path and old_path != new_path and new_path.startswith(old_path):
+                raise ValueError('不能把分类移动到自身或其子分类下')
+
+            if (self.path, self.depth) != (new_path, new_depth):
+                Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            if old_path and old_path != new_path:
+                Category.objects.filter(
+                    path__gt=old_path, path__lt=old_path[:-1] + '0'
+                ).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - old_depth),
+                )
+        self.path, self.depth = new_path, new_depth
+
     class Meta:
         db_table = 'books_category'
         verbose_name = "图书分类"
@@ -51,8 +95,10 @@ class Book(models.Model):
         return self.available == 0 and self.quantity > 0
 
     def get_active_reservations(self):
-        """获取当前有效的预约"""
-        return self.bookreservation_set.filter(returned=False)
+        """获取当前有效的预约，按排队顺序"""
+        return self.bookreservation_set.filter(
+            status__in=BookReservation.ACTIVE_STATUSES
+        ).order_by('position')
 
     def get_borrowing_history(self):
         """获取借阅历史"""
@@ -62,6 +108,70 @@ class Book(models.Model):
         db_table = 'books_book'
         verbose_name = "图书"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 图书列表按 (created_at, id) 游标分页
+            models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+        ]
+
+class BookSearchTerm(models.Model):
+    """图书检索倒排索引，由 books.search 维护"""
+    term = models.CharField(max_length=16, verbose_name='检索词')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='search_terms', verbose_name='图书')
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name='权重')
+
+    def __str__(self):
+        return f"{self.term} -> {self.book_id}"
+
+    class Meta:
+        db_table = 'books_booksearchterm'
+        verbose_name = "图书检索词"
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'book'], name='uniq_search_term_book'),
+        ]
+        indexes = [
+            models.Index(fields=['term', 'weight', 'book'], name='search_term_weight_idx'),
+        ]
+
+
+class BookBorrowingQuerySet(models.QuerySet):
+    """借阅记录查询集
+
+    逾期不保存在 status 中，而是查询时按 due_date 与当前时间比较得出，
+    借阅到期后不需要任何写入，状态就是正确的。未归还借阅的查询走
+    (returned, due_date) 索引。
+    """
+
+    def outstanding(self):
+        """未归还的借阅，包括已逾期的"""
+        return self.filter(returned=False)
+
+    def overdue(self, now=None):
+        return self.filter(returned=False, due_date__lt=now or timezone.now())
+
+    def on_loan(self, now=None):
+        """未归还且未逾期的借阅"""
+        now = now or timezone.now()
+        return self.filter(Q(due_date__isnull=True) | Q(due_date__gte=now), returned=False)
+
+    def with_status(self, status, now=None):
+        """按实际状态（borrowed / overdue / returned）过滤"""
+        if status == 'returned':
+            return self.filter(returned=True)
+        if status == 'overdue':
+            return self.overdue(now)
+        if status == 'borrowed':
+            return self.on_loan(now)
+        return self.none()
+
+    def with_effective_status(self, now=None):
+        """注解 effective_status：已归还、已逾期或借阅中"""
+        return self.annotate(effective_status=Case(
+            When(returned=True, then=Value('returned')),
+            When(due_date__lt=now or timezone.now(), then=Value('overdue')),
+            default=Value('borrowed'),
+            output_field=models.CharField(max_length=10),
+        ))
 
 
 class BookBorrowing(models.Model):
@@ -83,23 +193,50 @@ class BookBorrowing(models.Model):
         verbose_name='借阅状态'
     )
     returned = models.BooleanField(default=False, verbose_name='是否归还')
+    # 提醒去重：每条借阅记录的每种提醒只发送一次
+    due_soon_notified_at = models.DateTimeField(null=True, blank=True, verbose_name='到期提醒时间')
+    overdue_notified_at = models.DateTimeField(null=True, blank=True, verbose_name='逾期提醒时间')
+
+    objects = BookBorrowingQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.borrower.username} borrowed {self.book.title}"
 
-    def save(self, *args, **kwargs):
+    @property
+    def is_overdue(self):
+        return not self.returned and self.due_date is not None and self.due_date < timezone.now()
+
+    def get_effective_status(self):
+        """实际状态；查询时注解过 effective_status 的直接使用注解的值"""
+        status = getattr(self, 'effective_status', None)
+        if status is not None:
+            return status
         if self.returned:
-            self.status = 'returned'
-        elif self.due_date and self.due_date < timezone.now():
-            self.status = 'overdue'
-        else:
-            self.status = 'borrowed'
+            return 'returned'
+        return 'overdue' if self.is_overdue else 'borrowed'
+
+    def get_effective_status_display(self):
+        return dict(self.STATUS_CHOICES)[self.get_effective_status()]
+
+    def save(self, *args, **kwargs):
+        # status 只记录借出和归还，逾期由 BookBorrowingQuerySet 在查询时判断
+        self.status = 'returned' if self.returned else 'borrowed'
         super().save(*args, **kwargs)
 
     class Meta:
         db_table = 'books_bookborrowing'
         verbose_name = "借阅记录"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 我的借阅按 (borrowed_date, id) 游标分页
+            models.Index(fields=['borrower', 'borrowed_date', 'id'], name='borrowing_borrower_date_idx'),
+            # 导出借阅记录时按 (borrowed_date, id) 范围过滤并分批读取
+            models.Index(fields=['borrowed_date', 'id'], name='borrowing_date_id_idx'),
+            # 个人中心按读者统计未归还、已逾期的借阅
+            models.Index(fields=['borrower', 'returned', 'due_date'], name='borrowing_borrower_open_idx'),
+            # 逾期统计、check_overdue_books 按应还时间范围查找未归还的借阅
+            models.Index(fields=['returned', 'due_date'], name='borrowing_open_due_idx'),
+        ]
 
 class BookReturn(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name='图书')
@@ -116,18 +253,60 @@ class BookReturn(models.Model):
         verbose_name_plural = verbose_name
 
 class BookReservation(models.Model):
+    STATUS_CHOICES = (
+        ('waiting', '排队中'),
+        ('ready', '待取书'),
+        ('fulfilled', '已借出'),
+        ('cancelled', '已取消'),
+        ('expired', '已过期'),
+    )
+    # 仍在队列中的状态；其余状态的预约已结束，returned 同时置为 True
+    ACTIVE_STATUSES = ('waiting', 'ready')
+
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name='图书')
     reservationer = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='预约者')
     reservation_date = models.DateTimeField(auto_now_add=True, verbose_name='预约时间')
     returned = models.BooleanField(default=False, verbose_name='是否归还')
-    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting', verbose_name='状态')
+    # 同一本书内单调递增的排队序号，先到先得
+    position = models.PositiveIntegerField(verbose_name='排队序号')
+    ready_at = models.DateTimeField(null=True, blank=True, verbose_name='留书时间')
+    hold_expires_at = models.DateTimeField(null=True, blank=True, verbose_name='留书截止时间')
+
     def __str__(self):
         return f"{self.reservationer.username} reserved {self.book.title}"
-    
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def queue_position(self):
+        """当前排在第几位（待取书的预约返回 0）；查询时注解过 waiting_ahead 的直接使用"""
+        if self.status != 'waiting':
+            return 0
+        waiting_ahead = getattr(self, 'waiting_ahead', None)
+        if waiting_ahead is not None:
+            return waiting_ahead + 1
+        return BookReservation.objects.filter(
+            book_id=self.book_id, status='waiting', position__lt=self.position
+        ).count() + 1
+
     class Meta:
         db_table = 'books_bookreservation'
         verbose_name = "预约记录"
         verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'position'], name='reservation_book_position_uniq'),
+        ]
+        indexes = [
+            # 取队首：WHERE book_id = ? AND status = 'waiting' ORDER BY position LIMIT 1；
+            # 也用于查询图书当前有效的预约，取代了原来的 (book, returned) 索引
+            models.Index(fields=['book', 'status', 'position'], name='reservation_queue_idx'),
+            # 查找留书已过期的预约
+            models.Index(fields=['status', 'hold_expires_at'], name='reservation_hold_idx'),
+            # 读者自己的预约
+            models.Index(fields=['reservationer', 'status'], name='reservation_user_status_idx'),
+        ]
 
 class BookComment(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name='图书')
@@ -161,6 +340,8 @@ class UserProfile(models.Model):
     email = models.EmailField(verbose_name='邮箱')
     phone = models.CharField(max_length=11, verbose_name='电话')
     avatar = models.ImageField(upload_to='avatar/', verbose_name='头像', null=True, blank=True)
+    # 头像缩略图所在目录的内容哈希，为空表示还没有生成缩略图（见 books.avatars）
+    avatar_digest = models.CharField(max_length=16, blank=True, default='', editable=False, verbose_name='头像摘要')
 
     def __str__(self):
         return self.user.username
@@ -186,16 +367,236 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     is_read = models.BooleanField(default=False, verbose_name='是否已读')
     related_book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='相关图书')
+    broadcast = models.ForeignKey('BroadcastMessage', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='notifications', verbose_name='所属群发消息')
     
     class Meta:
         db_table = 'books_notification'
         verbose_name = "系统通知"
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
+        indexes = [
+            # 通知列表按 (created_at, id) 游标分页
+            models.Index(fields=['recipient', 'created_at', 'id'], name='notification_recipient_idx'),
+            # 统计群发消息的已读数量
+            models.Index(fields=['broadcast', 'is_read'], name='notification_broadcast_idx'),
+            # 未读通知数和未读列表
+            models.Index(fields=['recipient', 'is_read', 'created_at'], name='notification_unread_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_notification_type_display()} - {self.title}"
 
+class NotificationCounter(models.Model):
+    """每个用户的未读通知数，由 books.notifications 维护"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter', verbose_name='用户')
+    unread_count = models.IntegerField(default=0, verbose_name='未读数量')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread_count}"
+
+    class Meta:
+        db_table = 'books_notificationcounter'
+        verbose_name = "未读通知计数"
+        verbose_name_plural = verbose_name
+
+class NotificationOutbox(models.Model):
+    """通知发件箱
+
+    业务事务里只写发件箱，由 run_notification_worker 按渠道投递（见 books.outbox）。
+    每条消息的每个渠道一行，各渠道独立重试。
+    """
+    STATUS_CHOICES = (
+        ('pending', '待投递'),
+        ('sent', '已投递'),
+        ('failed', '投递失败'),
+    )
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='接收者')
+    channel = models.CharField(max_length=20, verbose_name='投递渠道')
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES, verbose_name='通知类型')
+    title = models.CharField(max_length=200, verbose_name='通知标题')
+    message = models.TextField(verbose_name='通知内容')
+    related_book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True, blank=True, db_index=False, verbose_name='相关图书')
+    broadcast = models.ForeignKey('BroadcastMessage', on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='outbox_messages', verbose_name='所属群发消息')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='失败次数')
+    # 待投递的消息在此时间之后才会被取出；取出时推后一个租期，投递进程崩溃后租期结束会被重新取出
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='下次投递时间')
+    last_error = models.TextField(blank=True, verbose_name='最近一次错误')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='投递时间')
+
+    def __str__(self):
+        return f"{self.channel} -> {self.recipient_id}: {self.title}"
+
+    class Meta:
+        db_table = 'books_notificationoutbox'
+        verbose_name = "通知发件箱"
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 按到期时间取待投递的消息；也用于清理早已投递的消息
+            models.Index(fields=['status', 'next_attempt_at', 'id'], name='outbox_due_idx'),
+        ]
+
+class BroadcastMessage(models.Model):
+    """群发的系统消息
+
+    消息内容只保存一份，由 send_broadcasts 命令在请求之外按用户主键分批
+    把每个接收者的通知写入发件箱，sent_count / last_user_id 记录发送进度，中断后可以继续。
+    """
+    TARGET_CHOICES = (
+        ('all', '全部用户'),
+        ('staff', '管理员'),
+        ('group', '指定用户组'),
+        ('users', '指定用户'),
+    )
+    STATUS_CHOICES = (
+        ('pending', '等待发送'),
+        ('sending', '发送中'),
+        ('done', '已完成'),
+    )
+
+    title = models.CharField(max_length=200, verbose_name='消息标题')
+    message = models.TextField(verbose_name='消息内容')
+    target = models.CharField(max_length=10, choices=TARGET_CHOICES, default='all', verbose_name='发送对象')
+    group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='用户组')
+    recipients = models.ManyToManyField(User, blank=True, related_name='targeted_broadcasts', verbose_name='指定用户')
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='sent_broadcasts', verbose_name='发送者')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True, verbose_name='状态')
+    total_recipients = models.IntegerField(null=True, blank=True, verbose_name='接收人数')
+    sent_count = models.IntegerField(default=0, verbose_name='已发送数量')
+    last_user_id = models.IntegerField(default=0, verbose_name='已发送到的用户ID')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始发送时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+
+    def __str__(self):
+        return self.title
+
+    @property
+    def progress(self):
+        """发送进度百分比"""
+        if self.status == 'done':
+            return 100
+        if not self.total_recipients:
+            return 0
+        return min(100, self.sent_count * 100 // self.total_recipients)
+
+    class Meta:
+        db_table = 'books_broadcastmessage'
+        verbose_name = "群发消息"
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+
+class DailyBorrowStat(models.Model):
+    """每日借还量汇总，由 books.rollups 维护"""
+    date = models.DateField(unique=True, verbose_name='日期')
+    borrow_count = models.PositiveIntegerField(default=0, verbose_name='借阅次数')
+    return_count = models.PositiveIntegerField(default=0, verbose_name='归还次数')
+
+    def __str__(self):
+        return f"{self.date}: {self.borrow_count}/{self.return_count}"
+
+    class Meta:
+        db_table = 'books_dailyborrowstat'
+        verbose_name = "每日借阅统计"
+        verbose_name_plural = verbose_name
+
+class BookBorrowStat(models.Model):
+    """单本图书累计借阅次数"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='borrow_stat', verbose_name='图书')
+    borrow_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='借阅次数')
+
+    def __str__(self):
+        return f"{self.book_id}: {self.borrow_count}"
+
+    class Meta:
+        db_table = 'books_bookborrowstat'
+        verbose_name = "图书借阅统计"
+        verbose_name_plural = verbose_name
+
+class CategoryBorrowStat(models.Model):
+    """分类累计借阅次数（按借阅时图书所属分类计）"""
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='borrow_stat', verbose_name='分类')
+    borrow_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='借阅次数')
+
+    def __str__(self):
+        return f"{self.category_id}: {self.borrow_count}"
+
+    class Meta:
+        db_table = 'books_categoryborrowstat'
+        verbose_name = "分类借阅统计"
+        verbose_name_plural = verbose_name
+
+class UserBorrowStat(models.Model):
+    """读者累计借阅次数"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='borrow_stat', verbose_name='读者')
+    borrow_count = models.PositiveIntegerField(default=0, db_index=True, verbose_name='借阅次数')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.borrow_count}"
+
+    class Meta:
+        db_table = 'books_userborrowstat'
+        verbose_name = "读者借阅统计"
+        verbose_name_plural = verbose_name
+
+class CacheVersion(models.Model):
+    """books.caching 中各模型数据的版本号，所有进程共享"""
+    label = models.CharField(max_length=100, primary_key=True, verbose_name='模型')
+    version = models.BigIntegerField(verbose_name='版本号')
+
+    def __str__(self):
+        return f"{self.label}: {self.version}"
+
+    class Meta:
+        db_table = 'books_cacheversion'
+        verbose_name = "缓存版本"
+        verbose_name_plural = verbose_name
+
+class BookNeighbor(models.Model):
+    """"借过这本书的读者还借了"：每本书相似度最高的若干本书，由 books.recommendations 离线计算"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbors', verbose_name='图书')
+    neighbor = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+', verbose_name='相似图书')
+    rank = models.PositiveSmallIntegerField(verbose_name='排名')
+    score = models.FloatField(verbose_name='相似度')
+    co_borrowers = models.PositiveIntegerField(verbose_name='共同借阅人数')
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+    class Meta:
+        db_table = 'books_bookneighbor'
+        verbose_name = "相似图书"
+        verbose_name_plural = verbose_name
+        constraints = [
+            # 图书详情页：WHERE book_id = ? ORDER BY rank
+            models.UniqueConstraint(fields=['book', 'rank'], name='uniq_neighbor_book_rank'),
+        ]
+
+class RecommendationBuild(models.Model):
+    """相似图书的每次计算，增量计算从最近一次处理到的借阅记录之后开始"""
+    MODE_CHOICES = (
+        ('full', '全量'),
+        ('incremental', '增量'),
+    )
+
+    mode = models.CharField(max_length=12, choices=MODE_CHOICES, verbose_name='方式')
+    metric = models.CharField(max_length=10, verbose_name='相似度')
+    last_borrowing_id = models.BigIntegerField(verbose_name='处理到的借阅记录')
+    borrowings = models.PositiveIntegerField(default=0, verbose_name='借阅记录数')
+    books = models.PositiveIntegerField(default=0, verbose_name='更新的图书数')
+    seconds = models.FloatField(default=0, verbose_name='耗时（秒）')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='计算时间')
+
+    def __str__(self):
+        return f"{self.get_mode_display()} {self.created_at:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        db_table = 'books_recommendationbuild'
+        verbose_name = "相似图书计算记录"
+        verbose_name_plural = verbose_name
+
 # 定义权限常量
 class UserPermissions:
     BORROW_BOOK = 'borrow_book'
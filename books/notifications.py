@@ -0,0 +1,165 @@
+"""
+通知的创建与未读计数
+
+每个用户的未读数保存在 NotificationCounter 中，创建通知、标记已读/未读时
+同步增减；读取时优先走缓存，缓存未命中再读计数行，计数行不存在时才
+建立计数行并 COUNT 一次。计数出现偏差时用 reconcile_unread_counts 修复。
+
+未读数变化（包括新通知）在事务提交后通过 pubsub 通知本进程中的实时连接。
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Notification, NotificationCounter
+from .pubsub import broker
+
+UNREAD_CACHE_KEY = 'notifications:unread:{user_id}'
+UNREAD_CACHE_TIMEOUT = 300
+
+
+def unread_cache_key(user_id):
+    return UNREAD_CACHE_KEY.format(user_id=user_id)
+
+
+def get_unread_count(user):
+    """获取用户的未读通知数"""
+    key = unread_cache_key(user.pk)
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    count = read_counter(user.pk)
+    if count is None:
+        count = create_counter(user.pk)
+    return fill_cache(user.pk, count)
+
+
+def read_counter(user_id):
+    return NotificationCounter.objects.filter(user_id=user_id).values_list('unread_count', flat=True).first()
+
+
+def create_counter(user_id):
+    """建立计数行并按实际未读数初始化，返回未读数
+
+    先插入计数行再计数：插入之后提交的 adjust_unread_counts 都会累加到这一行上；
+    计数放在 UPDATE 的子查询中，读到的是最新提交的通知，而不是事务开始时的快照。
+    """
+    unread = (
+        Notification.objects.filter(recipient_id=user_id, is_read=False)
+        .order_by().values('recipient_id').annotate(n=Count('id')).values('n')
+    )
+    with transaction.atomic():
+        _, created = NotificationCounter.objects.get_or_create(user_id=user_id, defaults={'unread_count': 0})
+        if created:
+            NotificationCounter.objects.filter(user_id=user_id).update(
+                unread_count=Coalesce(Subquery(unread), 0)
+            )
+        return NotificationCounter.objects.filter(user_id=user_id).values_list('unread_count', flat=True).get()
+
+
+def fill_cache(user_id, count):
+    """回填缓存
+
+    读取计数行之后提交的调整可能在写缓存之前就清除了缓存，写入后再核对一次
+    计数行，不一致时丢弃刚写入的值，避免旧值在缓存中保留 UNREAD_CACHE_TIMEOUT。
+    """
+    key = unread_cache_key(user_id)
+    cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    latest = read_counter(user_id)
+    if latest is not None and latest != count:
+        cache.delete(key)
+        return latest
+    return count
+
+
+def refresh_unread_count(user):
+    """跳过缓存读取计数行并回填缓存
+
+    其他进程（如通知投递进程）修改计数时只能清除它自己的本地缓存，
+    实时连接轮询时用这个函数读取最新值。
+    """
+    count = read_counter(user.pk)
+    if count is None:
+        cache.delete(unread_cache_key(user.pk))
+        return get_unread_count(user)
+    return fill_cache(user.pk, count)
+
+
+def publish_changes(user_ids):
+    """事务提交后唤醒这些用户的实时通知连接"""
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: broker.publish(user_ids))
+
+
+def adjust_unread_counts(deltas):
+    """按 {user_id: 增量} 调整未读计数，增量相同的用户合并为一条 UPDATE
+
+    计数行不存在的用户不需要处理，下次读取时会按实际数量建立。
+    """
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(user_id)
+    if not by_delta:
+        return
+    for delta, user_ids in by_delta.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(
+            unread_count=F('unread_count') + delta
+        )
+
+    changed = [user_id for user_ids in by_delta.values() for user_id in user_ids]
+    keys = [unread_cache_key(user_id) for user_id in changed]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    publish_changes(changed)
+
+
+def create_notification(user, notification_type, title, message, related_book=None):
+    """创建通知的辅助函数"""
+    with transaction.atomic():
+        notification = Notification.objects.create(
+            recipient=user,
+            notification_type=notification_type,
+            title=title,
+            message=message,
+            related_book=related_book
+        )
+        adjust_unread_counts({user.pk: 1})
+    return notification
+
+
+def bulk_create_notifications(notifications, batch_size=1000):
+    """批量创建通知，notifications 为未保存的 Notification 实例列表"""
+    deltas = defaultdict(int)
+    for notification in notifications:
+        if not notification.is_read:
+            deltas[notification.recipient_id] += 1
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+        adjust_unread_counts(deltas)
+    return created
+
+
+def set_read_state(queryset, is_read=True):
+    """批量标记通知为已读/未读，同步调整各接收者的未读计数，返回实际修改的数量"""
+    with transaction.atomic():
+        target = queryset.filter(is_read=not is_read)
+        per_user = dict(
+            target.order_by().values('recipient_id').annotate(n=Count('id')).values_list('recipient_id', 'n')
+        )
+        updated = target.update(is_read=is_read)
+        sign = -1 if is_read else 1
+        adjust_unread_counts({user_id: sign * n for user_id, n in per_user.items()})
+    return updated
+
+
+def reset_unread_counts(user_ids):
+    """丢弃计数行和缓存，下次读取时按实际未读数重建"""
+    user_ids = list(user_ids)
+    NotificationCounter.objects.filter(user_id__in=user_ids).delete()
+    keys = [unread_cache_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+    publish_changes(user_ids)
@@ -0,0 +1,251 @@
+"""
+通知发件箱
+
+借还书等业务只在自己的事务里写 NotificationOutbox，请求路径上没有任何
+外部调用；事务回滚时通知也一并消失，不会出现"借书失败却收到借阅通知"。
+run_notification_worker 分批取出到期的消息，按渠道投递：
+
+- in_app：写 Notification 表，和"标记已投递"在同一个事务里，恰好一次；
+- email：通过 Django 的邮件后端发送，发送成功后再标记已投递，
+  标记前进程崩溃会在租期结束后重发，即至少一次。
+
+投递失败按指数退避重试，超过 MAX_ATTEMPTS 次标记为失败，可在后台重新排队。
+渠道可以在 settings.NOTIFICATION_OUTBOX['CHANNELS'] 中替换或增加。
+
+部署时需要常驻一个投递进程，否则借还书等通知不会出现在通知列表中::
+
+    python manage.py run_notification_worker --watch
+
+可以由 systemd、supervisor 等进程管理器启动；也可以由 cron 每分钟运行一次
+不带 --watch 的命令。多个投递进程可以同时运行，取出消息时用 SKIP LOCKED 和
+租期互相避让。开发环境或单进程部署可以设置 LIBMANGE_OUTBOX_DELIVER_ON_COMMIT=1
+（DELIVER_ON_COMMIT），在写入发件箱的事务提交后由当前进程立即投递一批，
+不需要单独的投递进程；这样邮件等外部调用会回到请求路径上，生产环境不建议使用。
+"""
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification, NotificationOutbox
+from .notifications import bulk_create_notifications
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHANNELS': {
+        'in_app': 'books.outbox.InAppChannel',
+    },
+    'DELIVER_ON_COMMIT': False,
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_SECONDS': 30,
+    'MAX_BACKOFF_SECONDS': 3600,
+    'LEASE_SECONDS': 300,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'NOTIFICATION_OUTBOX', {}).get(name, DEFAULTS[name])
+
+
+class InAppChannel:
+    """站内通知：写 Notification 表并更新未读计数"""
+
+    # 只写数据库，可以和标记已投递放在同一个事务里
+    transactional = True
+
+    def deliver(self, messages):
+        bulk_create_notifications([
+            Notification(
+                recipient_id=message.recipient_id,
+                notification_type=message.notification_type,
+                title=message.title,
+                message=message.message,
+                related_book_id=message.related_book_id,
+                broadcast_id=message.broadcast_id,
+            )
+            for message in messages
+        ])
+        return {}
+
+
+class EmailChannel:
+    """邮件通知：用 EMAIL_BACKEND 发送，没有邮箱的用户直接跳过"""
+
+    transactional = False
+
+    def deliver(self, messages):
+        emails = dict(
+            User.objects.filter(pk__in={message.recipient_id for message in messages})
+            .exclude(email='').values_list('id', 'email')
+        )
+        errors = {}
+        connection = get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            return {message.pk: e for message in messages}
+        try:
+            for message in messages:
+                if message.recipient_id not in emails:
+                    continue
+                try:
+                    EmailMessage(
+                        subject=message.title,
+                        body=message.message,
+                        to=[emails[message.recipient_id]],
+                        connection=connection,
+                    ).send()
+                except Exception as e:
+                    errors[message.pk] = e
+        finally:
+            connection.close()
+        return errors
+
+
+_channels = {}
+
+
+def get_channel(name):
+    if name not in _channels:
+        _channels[name] = import_string(get_setting('CHANNELS')[name])()
+    return _channels[name]
+
+
+def enqueue_many(items, channels=None):
+    """把通知写入发件箱，items 为 dict(recipient_id, notification_type, title, message, related_book_id)，
+    群发消息另带 broadcast_id
+
+    必须和业务修改在同一个事务里调用，提交后才会被投递。
+    """
+    channels = channels or list(get_setting('CHANNELS'))
+    rows = [NotificationOutbox(channel=channel, **item) for item in items for channel in channels]
+    created = NotificationOutbox.objects.bulk_create(rows, batch_size=1000)
+    if get_setting('DELIVER_ON_COMMIT'):
+        # 投递失败只记录日志，不影响已经提交的业务
+        transaction.on_commit(process_batch, robust=True)
+    return created
+
+
+def enqueue(recipient_id, notification_type, title, message, related_book_id=None, channels=None):
+    return enqueue_many([{
+        'recipient_id': recipient_id,
+        'notification_type': notification_type,
+        'title': title,
+        'message': message,
+        'related_book_id': related_book_id,
+    }], channels)
+
+
+def claim(batch_size, now):
+    """取出一批到期的消息，并把下次投递时间推后一个租期，避免被其他进程重复取出"""
+    lease_until = now + timedelta(seconds=get_setting('LEASE_SECONDS'))
+    with transaction.atomic():
+        messages = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        NotificationOutbox.objects.filter(
+            pk__in=[message.pk for message in messages]
+        ).update(next_attempt_at=lease_until)
+    return messages
+
+
+def backoff(attempts):
+    """第 attempts 次失败后的等待时间：指数增长，加随机抖动，避免大量消息同时重试"""
+    seconds = min(get_setting('BACKOFF_SECONDS') * 2 ** (attempts - 1), get_setting('MAX_BACKOFF_SECONDS'))
+    return timedelta(seconds=seconds * random.uniform(0.5, 1.0))
+
+
+def mark_sent(ids, now):
+    return NotificationOutbox.objects.filter(pk__in=ids, status='pending').update(status='sent', sent_at=now)
+
+
+def mark_failed(message, error, now):
+    attempts = message.attempts + 1
+    values = {'attempts': attempts, 'last_error': f'{type(error).__name__}: {error}'[:2000]}
+    if attempts >= get_setting('MAX_ATTEMPTS'):
+        values['status'] = 'failed'
+    else:
+        values['next_attempt_at'] = now + backoff(attempts)
+    NotificationOutbox.objects.filter(pk=message.pk, status='pending').update(**values)
+    return values.get('status') == 'failed'
+
+
+def deliver(messages, now):
+    """按渠道投递一批消息，返回各结果的数量"""
+    stats = defaultdict(int)
+    by_channel = defaultdict(list)
+    for message in messages:
+        by_channel[message.channel].append(message)
+
+    for name, group in by_channel.items():
+        try:
+            channel = get_channel(name)
+        except (KeyError, ImportError) as e:
+            errors = {message.pk: e for message in group}
+        else:
+            errors = {}
+            try:
+                if channel.transactional:
+                    with transaction.atomic():
+                        # 其他进程已经投递过的消息不再重复写入
+                        pending = set(
+                            NotificationOutbox.objects.select_for_update()
+                            .filter(pk__in=[message.pk for message in group], status='pending')
+                            .values_list('id', flat=True)
+                        )
+                        stats['skipped'] += len(group) - len(pending)
+                        group = [message for message in group if message.pk in pending]
+                        errors = channel.deliver(group)
+                        mark_sent([message.pk for message in group if message.pk not in errors], now)
+                else:
+                    errors = channel.deliver(group)
+                    mark_sent([message.pk for message in group if message.pk not in errors], now)
+            except Exception as e:
+                errors = {message.pk: e for message in group}
+        stats['sent'] += len(group) - len(errors)
+
+        for message in group:
+            if message.pk in errors:
+                failed = mark_failed(message, errors[message.pk], now)
+                stats['failed' if failed else 'retried'] += 1
+    return stats
+
+
+def process_batch(batch_size=None):
+    """取出并投递一批消息；没有到期的消息时返回 None"""
+    now = timezone.now()
+    messages = claim(batch_size or get_setting('BATCH_SIZE'), now)
+    if not messages:
+        return None
+    return deliver(messages, now)
+
+
+def purge_sent(keep_days, batch_size=5000):
+    """删除 keep_days 天前已投递的消息，返回删除的数量"""
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted = 0
+    # sent 行的 next_attempt_at 即最后一次取出的时间，可以走 outbox_due_idx
+    rows = NotificationOutbox.objects.filter(status='sent', next_attempt_at__lt=cutoff)
+    while True:
+        ids = list(rows.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += NotificationOutbox.objects.filter(pk__in=ids).delete()[0]
+
+
+def retry_failed(queryset):
+    """把投递失败的消息重新排队"""
+    return queryset.filter(status='failed').update(
+        status='pending', attempts=0, next_attempt_at=timezone.now(), last_error='',
+    )
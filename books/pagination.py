@@ -0,0 +1,168 @@
+"""
+游标（keyset）分页
+
+按排序字段的取值定位下一页（WHERE (created_at, id) < (?, ?)），而不是
+OFFSET，翻到多深的页面代价都和第一页相同。排序字段的最后一个必须唯一
+（通常是 id），字段取值不能为 NULL。
+
+无效的游标返回 400：退回第一页会让“加载更多”重复追加已经显示过的条目。
+"""
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import BadRequest, FieldDoesNotExist
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class CursorPage:
+    """一页数据，可以直接在模板中迭代"""
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    def __init__(self, queryset, ordering, per_page=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):
+            values = [obj[name] for name, _ in self._fields()]
+        else:
+            values = [getattr(obj, name) for name, _ in self._fields()]
+        data = json.dumps([_dump_value(value) for value in values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor(cursor) from e
+        fields = self._fields()
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+
+        opts = self.queryset.model._meta
+        decoded = []
+        for (name, _), value in zip(fields, values):
+            try:
+                field = opts.pk if name == 'pk' else opts.get_field(name)
+            except FieldDoesNotExist:
+                # 注解字段（如检索得分）直接使用原始值
+                decoded.append(value)
+                continue
+            try:
+                decoded.append(field.to_python(value))
+            except Exception as e:
+                raise InvalidCursor(cursor) from e
+        return decoded
+
+    def _seek_filter(self, values):
+        """构造 (f1, f2, ...) 严格位于游标之后的过滤条件"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = f'{name}__lt' if descending else f'{name}__gt'
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _page_queryset(self, cursor):
+        queryset = self.queryset
+        if cursor:
+            queryset = queryset.filter(self._seek_filter(self.decode_cursor(cursor)))
+        # 多取一条用于判断是否还有下一页
+        return queryset[:self.per_page + 1]
+
+    def _make_page(self, items):
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode_cursor(items[-1])
+        return CursorPage(items, next_cursor)
+
+    def get_page(self, cursor=None):
+        """取得游标之后的一页，游标无效时抛出 InvalidCursor"""
+        return self._make_page(list(self._page_queryset(cursor)))
+
+    async def aget_page(self, cursor=None):
+        return self._make_page([item async for item in self._page_queryset(cursor)])
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, ordering, per_page=None):
+    """按请求中的 cursor 参数分页，游标无效时抛出 BadRequest（400）"""
+    paginator = CursorPaginator(queryset, ordering, per_page or get_page_size(request))
+    try:
+        return paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise BadRequest('无效的分页游标')
+
+
+async def apaginate(request, queryset, ordering, per_page=None):
+    paginator = CursorPaginator(queryset, ordering, per_page or get_page_size(request))
+    try:
+        return await paginator.aget_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise BadRequest('无效的分页游标')
+
+
+def wants_json(request):
+    """“加载更多”请求：?format=json 或 AJAX 请求"""
+    return (
+        request.GET.get('format') == 'json'
+        or request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    )
+
+
+def load_more_response(request, page, template_name, context):
+    """只渲染本页条目的片段，连同下一页游标以 JSON 返回"""
+    html = render_to_string(template_name, context, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    })
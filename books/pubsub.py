@@ -0,0 +1,85 @@
+"""
+进程内的通知订阅
+
+每个打开的实时通知连接（books.live）按用户订阅，通知或未读数变化时
+notifications 在事务提交后调用 publish 唤醒对应用户的连接，连接再从数据库
+读取新内容。这里只传递"有变化"，不传递内容，丢失一次唤醒也不会丢数据。
+
+只能唤醒同一进程内的连接；其他进程（多个 Web 进程、通知投递进程）中的
+变化由连接定时轮询数据库发现。
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+
+class Subscription:
+    """一个连接的订阅；WSGI 下用线程事件等待，ASGI 下传入事件循环用 asyncio 等待"""
+
+    def __init__(self, user_id, loop=None):
+        self.user_id = user_id
+        self._loop = loop
+        self._event = asyncio.Event() if loop is not None else threading.Event()
+
+    def wake(self):
+        # publish 在提交事务的线程中调用，asyncio.Event 只能在事件循环线程里设置
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+    def wait(self, timeout):
+        """等待唤醒或超时，返回是否被唤醒"""
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+    async def await_wake(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._event.clear()
+        return True
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, user_id, loop=None):
+        subscription = Subscription(user_id, loop)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_ids):
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in targets:
+            try:
+                subscription.wake()
+            except RuntimeError:
+                # 事件循环已关闭，连接正在退出
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+broker = Broker()
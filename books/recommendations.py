@@ -0,0 +1,212 @@
+"""
+"借过这本书的读者还借了"
+
+离线任务（build_recommendations 命令）根据借阅记录计算图书之间的相似度，
+每本书保存相似度最高的 TOP_K 本到 BookNeighbor，图书详情页按 (book, rank)
+索引一次查询读出，不在请求中计算。
+
+借阅记录看作 读者×图书 的 0/1 稀疏矩阵 X（同一读者多次借同一本书只算一次），
+两本书的共同借阅人数即 XᵀX 中的元素。计算全部用 NumPy 数组完成：
+
+- 矩阵同时按读者（行）和按图书（列）存下标数组，相当于 CSR + CSC；
+- 一批目标图书的共现计数：先取借过这些书的读者，再展开这些读者借过的全部
+  图书，用 bincount 累加成 (目标图书数 × 图书总数) 的稠密块，块的大小由
+  BLOCK_CELLS 限制；
+- 相似度：余弦 c / √(nᵢ·nⱼ) 或 Jaccard c / (nᵢ + nⱼ - c)，共同借阅人数少于
+  MIN_CO_BORROWERS 的不算相似；argpartition 取每行前 K 个。
+
+计算量是 Σ(每位读者借过的书数)²，借阅量异常大的账号（馆员测试账号等）
+会主导计算又没有推荐意义，借书超过 MAX_USER_BOOKS 本的读者不参与计算。
+
+增量计算只重算受新借阅影响的图书：新借阅的图书，以及借了这些书的读者借过的
+全部图书——它们与新书的共同借阅人数变了。其他图书列表中与这些书的相似度只
+因热度（分母）变化略有偏差，定期全量计算即可修正。
+"""
+import time
+
+import numpy as np
+from django.db import transaction
+
+from .models import BookBorrowing, BookNeighbor, RecommendationBuild
+
+METRICS = ('cosine', 'jaccard')
+TOP_K = 10
+MIN_CO_BORROWERS = 2
+MAX_USER_BOOKS = 500
+# 每块共现矩阵的元素个数上限（int64，约 64 MB）
+BLOCK_CELLS = 8_000_000
+FETCH_SIZE = 20_000
+
+BORROWING_DTYPE = np.dtype([('id', np.int64), ('borrower_id', np.int64), ('book_id', np.int64)])
+
+
+def related_books(book):
+    """图书详情页的"还借了"列表，按 (book, rank) 唯一索引一次查询"""
+    return (
+        BookNeighbor.objects.filter(book=book)
+        .select_related('neighbor')
+        .only('id', 'book_id', 'neighbor_id', 'rank', 'score', 'neighbor__title', 'neighbor__author')
+        .order_by('rank')
+    )
+
+
+def load_borrowings():
+    """全部借阅记录的 (id, 读者, 图书)，返回结构化数组"""
+    rows = BookBorrowing.objects.order_by().values_list('id', 'borrower_id', 'book_id')
+    return np.fromiter(rows.iterator(chunk_size=FETCH_SIZE), dtype=BORROWING_DTYPE)
+
+
+def concat_ranges(starts, lengths):
+    """把若干个 [start, start + length) 区间首尾相接成一个下标数组"""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class BorrowMatrix:
+    """读者×图书 的 0/1 稀疏矩阵"""
+
+    def __init__(self, user_ids, book_ids, max_user_books=MAX_USER_BOOKS):
+        self.users, user_index = np.unique(user_ids, return_inverse=True)
+        self.books, book_index = np.unique(book_ids, return_inverse=True)
+        n_books = len(self.books)
+
+        # 去重后按 (读者, 图书) 排序，即行优先存储
+        cells = np.unique(user_index.astype(np.int64) * n_books + book_index)
+        user_index, book_index = cells // n_books, cells % n_books
+        user_degree = np.bincount(user_index, minlength=len(self.users))
+        if max_user_books:
+            keep = user_degree[user_index] <= max_user_books
+            user_index, book_index = user_index[keep], book_index[keep]
+            user_degree = np.bincount(user_index, minlength=len(self.users))
+
+        self.user_degree = user_degree
+        self.user_ptr = np.concatenate(([0], np.cumsum(user_degree)))
+        self.user_books = book_index
+
+        order = np.argsort(book_index, kind='stable')
+        self.book_degree = np.bincount(book_index, minlength=n_books)
+        self.book_ptr = np.concatenate(([0], np.cumsum(self.book_degree)))
+        self.book_users = user_index[order]
+
+    @property
+    def n_books(self):
+        return len(self.books)
+
+    def book_indices(self, book_ids):
+        """图书 ID 对应的列号，不在矩阵中的忽略"""
+        book_ids = np.asarray(book_ids)
+        positions = np.searchsorted(self.books, book_ids)
+        positions = np.minimum(positions, self.n_books - 1)
+        return np.unique(positions[self.books[positions] == book_ids])
+
+    def books_of_users(self, user_ids):
+        """这些读者借过的全部图书的列号"""
+        user_ids = np.asarray(user_ids)
+        positions = np.minimum(np.searchsorted(self.users, user_ids), len(self.users) - 1)
+        users = positions[self.users[positions] == user_ids]
+        return np.unique(self.user_books[concat_ranges(self.user_ptr[users], self.user_degree[users])])
+
+    def co_counts(self, targets):
+        """targets 中每本书与全部图书的共同借阅人数，(len(targets), n_books) 矩阵"""
+        lengths = self.book_degree[targets]
+        rows = np.repeat(np.arange(len(targets)), lengths)
+        users = self.book_users[concat_ranges(self.book_ptr[targets], lengths)]
+        user_lengths = self.user_degree[users]
+        rows = np.repeat(rows, user_lengths)
+        books = self.user_books[concat_ranges(self.user_ptr[users], user_lengths)]
+        counts = np.bincount(rows * self.n_books + books, minlength=len(targets) * self.n_books)
+        return counts.reshape(len(targets), self.n_books)
+
+    def similarity(self, targets, counts, metric):
+        target_degree = self.book_degree[targets][:, None].astype(np.float64)
+        degree = self.book_degree[None, :].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if metric == 'cosine':
+                scores = counts / np.sqrt(target_degree * degree)
+            else:
+                scores = counts / (target_degree + degree - counts)
+        return np.nan_to_num(scores, nan=0.0, posinf=0.0)
+
+    def top_neighbors(self, targets, metric='cosine', top_k=TOP_K, min_co_borrowers=MIN_CO_BORROWERS):
+        """逐块计算，依次返回 (图书列号, [(相似图书列号, 相似度, 共同借阅人数), ...])"""
+        k = min(top_k, self.n_books - 1)
+        if k <= 0:
+            return
+        block = max(1, BLOCK_CELLS // self.n_books)
+        for start in range(0, len(targets), block):
+            chunk = targets[start:start + block]
+            counts = self.co_counts(chunk)
+            scores = self.similarity(chunk, counts, metric)
+            scores[counts < min_co_borrowers] = 0
+            scores[np.arange(len(chunk)), chunk] = 0
+
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind='stable')
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+            candidate_counts = np.take_along_axis(counts, candidates, axis=1)
+            for i, target in enumerate(chunk):
+                yield target, [
+                    (neighbor, score, co_borrowers)
+                    for neighbor, score, co_borrowers
+                    in zip(candidates[i].tolist(), candidate_scores[i].tolist(), candidate_counts[i].tolist())
+                    if score > 0
+                ]
+
+
+def build(metric='cosine', top_k=TOP_K, min_co_borrowers=MIN_CO_BORROWERS,
+          max_user_books=MAX_USER_BOOKS, incremental=False, batch_size=5000):
+    """计算相似图书并写入 BookNeighbor，返回本次的 RecommendationBuild"""
+    if metric not in METRICS:
+        raise ValueError(f'未知的相似度：{metric}')
+    started = time.monotonic()
+    previous = RecommendationBuild.objects.order_by('-id').first()
+    if previous is None or previous.metric != metric:
+        # 没有算过，或者换了相似度，只能全量计算
+        incremental = False
+
+    borrowings = load_borrowings()
+    last_id = int(borrowings['id'].max()) if len(borrowings) else 0
+    mode = 'incremental' if incremental else 'full'
+    new = borrowings[borrowings['id'] > previous.last_borrowing_id] if incremental else borrowings
+
+    neighbors = []
+    targets = np.array([], dtype=np.int64)
+    if len(new):
+        matrix = BorrowMatrix(borrowings['borrower_id'], borrowings['book_id'], max_user_books)
+        if incremental:
+            targets = np.union1d(
+                matrix.book_indices(new['book_id']),
+                matrix.books_of_users(np.unique(new['borrower_id'])),
+            )
+        else:
+            targets = np.arange(matrix.n_books)
+        for target, similar in matrix.top_neighbors(targets, metric, top_k, min_co_borrowers):
+            book_id = int(matrix.books[target])
+            neighbors.extend(
+                BookNeighbor(
+                    book_id=book_id, neighbor_id=int(matrix.books[neighbor]),
+                    rank=rank, score=score, co_borrowers=co_borrowers,
+                )
+                for rank, (neighbor, score, co_borrowers) in enumerate(similar, start=1)
+            )
+        target_ids = matrix.books[targets].tolist()
+    else:
+        target_ids = []
+
+    with transaction.atomic():
+        if incremental:
+            for start in range(0, len(target_ids), 1000):
+                BookNeighbor.objects.filter(book_id__in=target_ids[start:start + 1000]).delete()
+        else:
+            BookNeighbor.objects.all().delete()
+        BookNeighbor.objects.bulk_create(neighbors, batch_size=batch_size)
+        return RecommendationBuild.objects.create(
+            mode=mode,
+            metric=metric,
+            last_borrowing_id=last_id,
+            borrowings=len(new),
+            books=len(target_ids),
+            seconds=round(time.monotonic() - started, 3),
+        )
@@ -0,0 +1,274 @@
+"""
+只读副本路由
+
+写入和普通读取都走主库（default）；用 read_replica 装饰的只读视图（目录浏览、
+统计页）和 use_replica() 包住的代码块中的读取发往只读副本，减轻借还书写入
+所在的主库的压力。
+
+读自己的写：请求中发生过写入（借还书、预约、登录写会话……）时，响应带上
+STICKY_COOKIE，之后 STICKY_SECONDS 秒内该浏览器的读取全部回到主库，不会
+因为复制延迟看到借阅前的状态；同一请求中写入之后的读取、事务中的读取也都走主库。
+
+副本健康检查：每个进程每 HEALTH_CHECK_SECONDS 秒对副本执行一次 SELECT 1，
+MySQL 副本还会读取复制延迟，连接失败或延迟超过 MAX_LAG_SECONDS 的副本暂时
+不参与选择；没有可用副本时读取回到主库。一个请求内固定使用同一个副本。
+
+副本的数据来自数据库自身的复制，migrate 只需要对主库执行。按模型版本缓存的
+视图数据（books.caching）在缓存未命中时用 use_primary() 读主库重新计算，
+不会把副本上落后的数据存到新版本号下；版本号和 ETag 与请求的其他数据读自
+同一个库，最多落后复制延迟。
+
+配置::
+
+    DATABASE_ROUTERS = ['books.replicas.PrimaryReplicaRouter']
+    DATABASE_REPLICATION = {
+        'REPLICAS': ['replica1', 'replica2'],   # DATABASES 中的别名
+        'STICKY_SECONDS': 15,
+    }
+"""
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'REPLICAS': [],
+    # 写入后多少秒内读取留在主库，应大于正常情况下的复制延迟
+    'STICKY_SECONDS': 15,
+    'STICKY_COOKIE': 'db_primary_until',
+    'HEALTH_CHECK_SECONDS': 10,
+    'MAX_LAG_SECONDS': 5,
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_setting(name):
+    return getattr(settings, 'DATABASE_REPLICATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestState:
+    """一个请求的路由状态：是否粘在主库、是否已经写入过"""
+
+    def __init__(self, sticky=False):
+        self.sticky = sticky
+        self.wrote = False
+
+    @property
+    def pinned(self):
+        return self.sticky or self.wrote
+
+
+class ReplicaReads:
+    """use_replica() 的作用范围，第一次读取时选定副本"""
+
+    def __init__(self):
+        self.alias = None
+        self.chosen = False
+
+
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+class ReplicaHealth:
+    """各副本最近一次检查的结果，按进程缓存"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+
+    def is_healthy(self, alias):
+        with self._lock:
+            status = self._status.get(alias)
+        if status is None or time.monotonic() - status[1] >= get_setting('HEALTH_CHECK_SECONDS'):
+            # 多个线程同时过期时可能重复检查，检查本身很轻，不加锁等待
+            healthy = self.check(alias)
+            with self._lock:
+                self._status[alias] = (healthy, time.monotonic())
+            return healthy
+        return status[0]
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                if connection.vendor == 'mysql':
+                    lag = replication_lag(cursor)
+                    if lag is None or lag > get_setting('MAX_LAG_SECONDS'):
+                        logger.warning('副本 %s 复制延迟 %s 秒，暂停使用', alias, lag)
+                        return False
+        except DatabaseError as e:
+            logger.warning('副本 %s 不可用：%s', alias, e)
+            connection.close()
+            return False
+        return True
+
+    def mark_unhealthy(self, alias):
+        with self._lock:
+            self._status[alias] = (False, time.monotonic())
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+health = ReplicaHealth()
+
+
+def replication_lag(cursor):
+    """MySQL 副本落后主库的秒数；复制已停止时返回 None，不是副本时返回 0"""
+    for statement, column in (
+        ('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+        ('SHOW SLAVE STATUS', 'Seconds_Behind_Master'),
+    ):
+        try:
+            cursor.execute(statement)
+        except DatabaseError:
+            # MySQL 8.0.22 之前没有 SHOW REPLICA STATUS
+            continue
+        row = cursor.fetchone()
+        if row is None:
+            return 0
+        columns = [description[0] for description in cursor.description]
+        return row[columns.index(column)]
+    return None
+
+
+def choose_replica():
+    """随机选一个健康的副本，都不可用时返回 None"""
+    replicas = [alias for alias in get_setting('REPLICAS') if health.is_healthy(alias)]
+    return random.choice(replicas) if replicas else None
+
+
+def replica_for_read():
+    """当前上下文中读取应使用的副本，应使用主库时返回 None"""
+    reads = _replica_reads.get()
+    if reads is None:
+        return None
+    state = _request_state.get()
+    if state is not None and state.pinned:
+        return None
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    if not reads.chosen:
+        reads.alias = choose_replica()
+        reads.chosen = True
+    return reads.alias
+
+
+class use_replica:
+    """代码块中的读取发往副本（请求粘在主库时除外），可用作上下文管理器"""
+
+    def __enter__(self):
+        self._token = _replica_reads.set(ReplicaReads())
+        return self
+
+    def __exit__(self, *exc_info):
+        _replica_reads.reset(self._token)
+
+
+class use_primary:
+    """代码块中的读取回到主库，即使外层用了 use_replica()"""
+
+    def __enter__(self):
+        self._token = _replica_reads.set(None)
+        return self
+
+    def __exit__(self, *exc_info):
+        _replica_reads.reset(self._token)
+
+
+def read_replica(view_func):
+    """只读视图装饰器：GET/HEAD 请求中的读取发往副本"""
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in SAFE_METHODS:
+                return await view_func(request, *args, **kwargs)
+            # sync_to_async 会把上下文变量带进执行查询的线程
+            with use_replica():
+                return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return replica_for_read()
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本和主库是同一份数据
+        return True
+
+
+class StickyPrimaryMiddleware:
+    """读自己的写：请求中有写入时设置 cookie，有效期内该浏览器的读取都走主库
+
+    要放在 SessionMiddleware 之前，会话的保存也算作写入。
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        try:
+            until = float(request.COOKIES.get(get_setting('STICKY_COOKIE'), 0))
+        except ValueError:
+            until = 0
+        state = RequestState(sticky=until > time.time())
+        return state, _request_state.set(state)
+
+    def finish(self, state, response):
+        if state.wrote:
+            seconds = get_setting('STICKY_SECONDS')
+            response.set_cookie(
+                get_setting('STICKY_COOKIE'), f'{time.time() + seconds:.0f}',
+                max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
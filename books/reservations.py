@@ -0,0 +1,242 @@
+"""
+预约排队
+
+每本书的预约按 position 先到先得。有副本归还时不直接增加可借数量，
+而是留给队首读者（status=ready），在 HOLD_DAYS 内借阅有效，过期后
+顺延给下一位；队列为空时副本才回到可借数量中。
+
+取队首是 (book, status, position) 索引上的一次定位，与排队人数无关。
+同一本书的队列操作都先锁住图书行，并发归还、预约不会把同一个副本
+分给两个人，也不会产生重复的排队序号。
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Book, BookBorrowing, BookReservation
+from . import caching, dashboard, outbox
+
+# 留书期限（天）
+HOLD_DAYS = 3
+
+ACTIVE = BookReservation.ACTIVE_STATUSES
+
+
+class ReservationError(Exception):
+    pass
+
+
+class NotReservable(ReservationError):
+    """有可借副本，或读者正在借阅这本书"""
+
+
+class AlreadyReserved(ReservationError):
+    """读者已在这本书的队列中"""
+
+
+class NoReservation(ReservationError):
+    """没有可取消的预约"""
+
+
+def notify(user_id, book, title, message):
+    outbox.enqueue(user_id, 'reserve', title, message, related_book_id=book.pk)
+
+
+def lock_book(book):
+    """锁住图书行，串行化同一本书的队列操作，返回当前可借数量"""
+    return Book.objects.select_for_update().filter(pk=book.pk).values_list('available', flat=True).get()
+
+
+def queue_length(book):
+    return BookReservation.objects.filter(book=book, status='waiting').count()
+
+
+async def aqueue_length(book):
+    return await BookReservation.objects.filter(book=book, status='waiting').acount()
+
+
+def reserve(user, book):
+    """加入预约队列，返回预约记录"""
+    with transaction.atomic():
+        if lock_book(book) > 0:
+            raise NotReservable('有可借副本，可以直接借阅')
+        if BookBorrowing.objects.filter(book=book, borrower=user, returned=False).exists():
+            raise NotReservable('您正在借阅这本书')
+        if BookReservation.objects.filter(book=book, reservationer=user, status__in=ACTIVE).exists():
+            raise AlreadyReserved(book.pk)
+
+        last = (
+            BookReservation.objects.filter(book=book)
+            .order_by('-position').values_list('position', flat=True).first()
+        )
+        reservation = BookReservation.objects.create(
+            book=book, reservationer=user, position=(last or 0) + 1,
+        )
+        notify(
+            user.pk, book,
+            title=f'成功预约《{book.title}》',
+            message=f'您已预约《{book.title}》，当前排在第 {reservation.queue_position()} 位，'
+                    f'有副本归还时会为您保留 {HOLD_DAYS} 天。',
+        )
+    return reservation
+
+
+def next_waiting(book):
+    """队首的排队预约，加锁读取以拿到最新状态"""
+    return (
+        BookReservation.objects.select_for_update()
+        .filter(book=book, status='waiting')
+        .order_by('position').first()
+    )
+
+
+def hold_for(reservation, book, now):
+    """把一个副本留给指定预约"""
+    expires = now + timedelta(days=HOLD_DAYS)
+    BookReservation.objects.filter(pk=reservation.pk).update(
+        status='ready', ready_at=now, hold_expires_at=expires,
+    )
+    reservation.status, reservation.ready_at, reservation.hold_expires_at = 'ready', now, expires
+    # 队首离开排队，后面读者的位次都前移一位
+    dashboard.invalidate(reservation.reservationer_id)
+    dashboard.invalidate_queue(book)
+    notify(
+        reservation.reservationer_id, book,
+        title=f'预约的《{book.title}》已到馆',
+        message=f'您预约的《{book.title}》已为您保留，请在 '
+                f'{timezone.localtime(expires).strftime("%Y-%m-%d %H:%M")} 前借阅，逾期将顺延给下一位读者。',
+    )
+
+
+def release_copy(book, now=None):
+    """一个副本回到馆内：有人排队就留给队首读者，否则可借数量加一
+
+    必须在事务中调用。返回获得留书的预约，没有人排队时返回 None。
+    """
+    now = now or timezone.now()
+    lock_book(book)
+    head = next_waiting(book)
+    if head is not None:
+        hold_for(head, book, now)
+        return head
+    Book.objects.filter(
+        pk=book.pk, available__lt=F('quantity')
+    ).update(available=F('available') + 1)
+    caching.touch(Book)
+    return None
+
+
+def fulfil(user, book):
+    """读者借阅时结束其预约；借走的是留给他的副本时返回 True，此时可借数量不变"""
+    lock_book(book)
+    held = BookReservation.objects.filter(
+        book=book, reservationer=user, status='ready'
+    ).update(status='fulfilled', returned=True)
+    if held:
+        dashboard.invalidate(user.pk)
+        return True
+    # 有空余副本时排队的读者直接借阅，同时离开队列
+    left = BookReservation.objects.filter(
+        book=book, reservationer=user, status='waiting'
+    ).update(status='fulfilled', returned=True)
+    if left:
+        dashboard.invalidate(user.pk)
+        dashboard.invalidate_queue(book)
+    return False
+
+
+def cancel(user, reservation_id):
+    """取消预约；已留书的预约取消后副本顺延给下一位"""
+    reservation = (
+        BookReservation.objects.select_related('book')
+        .filter(pk=reservation_id, reservationer=user, status__in=ACTIVE).first()
+    )
+    if reservation is None:
+        raise NoReservation(reservation_id)
+    book = reservation.book
+    with transaction.atomic():
+        # 与归还、预约一致，先锁图书行再锁预约行
+        lock_book(book)
+        status = (
+            BookReservation.objects.select_for_update()
+            .filter(pk=reservation_id, status__in=ACTIVE).values_list('status', flat=True).first()
+        )
+        if status is None:
+            raise NoReservation(reservation_id)
+        BookReservation.objects.filter(pk=reservation.pk).update(status='cancelled', returned=True)
+        reservation.status, reservation.returned = 'cancelled', True
+        dashboard.invalidate(user.pk)
+        if status == 'ready':
+            release_copy(book)
+        else:
+            dashboard.invalidate_queue(book)
+        notify(
+            user.pk, book,
+            title='预约已取消',
+            message=f'您已取消对《{book.title}》的预约。',
+        )
+    return reservation
+
+
+def expire_holds(now=None, batch_size=500):
+    """把超过留书期限的预约标记为过期，副本顺延给下一位，返回过期的数量"""
+    now = now or timezone.now()
+    expired = 0
+    last_id = 0
+    rows = BookReservation.objects.filter(
+        status='ready', hold_expires_at__lt=now
+    ).order_by('id').values_list('id', 'book_id')
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return expired
+        last_id = batch[-1][0]
+        books = Book.objects.in_bulk({book_id for _, book_id in batch})
+        for reservation_id, book_id in batch:
+            book = books[book_id]
+            with transaction.atomic():
+                lock_book(book)
+                reservation = (
+                    BookReservation.objects.select_for_update()
+                    .filter(pk=reservation_id, status='ready', hold_expires_at__lt=now).first()
+                )
+                if reservation is None:
+                    # 已被借走或取消
+                    continue
+                BookReservation.objects.filter(pk=reservation.pk).update(status='expired', returned=True)
+                dashboard.invalidate(reservation.reservationer_id)
+                notify(
+                    reservation.reservationer_id, book,
+                    title='预约已过期',
+                    message=f'您预约的《{book.title}》未在保留期内借阅，预约已失效。',
+                )
+                release_copy(book, now)
+                expired += 1
+
+
+def allocate_available(now=None):
+    """把可借副本分给排队的读者（例如入库增加了副本），返回留书的数量"""
+    now = now or timezone.now()
+    book_ids = (
+        BookReservation.objects.filter(status='waiting', book__available__gt=0)
+        .order_by().values_list('book_id', flat=True).distinct()
+    )
+    held = 0
+    for book in Book.objects.filter(pk__in=list(book_ids)).only('id', 'title'):
+        with transaction.atomic():
+            lock_book(book)
+            while True:
+                head = next_waiting(book)
+                if head is None:
+                    break
+                taken = Book.objects.filter(
+                    pk=book.pk, available__gt=0
+                ).update(available=F('available') - 1)
+                if not taken:
+                    break
+                hold_for(head, book, now)
+                held += 1
+            caching.touch(Book)
+    return held
@@ -0,0 +1,148 @@
+"""
+图书全文检索
+
+基于倒排索引实现：把书名、作者、ISBN 切分为检索词，写入 BookSearchTerm
+表，(term, book) 上有唯一索引。中文按单字 + 双字切分，可以匹配任意
+连续片段；英文、数字按单词切分并索引单词的全部前缀，支持前缀匹配
+（例如输入 "pyth" 或 ISBN 前几位）。查询时所有检索词都命中的图书才算
+匹配，并按字段权重之和排序。
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, Sum, Value
+
+from .models import Book, BookSearchTerm
+
+# 各字段的权重，命中 ISBN 的结果最相关，其次是书名、作者
+FIELD_WEIGHTS = (
+    ('isbn', 5),
+    ('title', 3),
+    ('author', 2),
+)
+
+# 检索词最大长度，与 BookSearchTerm.term 一致
+MAX_TERM_LENGTH = 16
+
+# 选择最短倒排链时每个检索词最多数到的记录数，只用于估算，不限制结果
+MAX_CANDIDATES = 1000
+
+# 中日韩统一表意文字
+_CJK_RE = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_WORD_RE = re.compile(r'[0-9a-z]+')
+# ISBN 中数字之间的连字符
+_DIGIT_HYPHEN_RE = re.compile(r'(?<=\d)-(?=\d)')
+
+
+def _bigrams(text):
+    if len(text) < 2:
+        return [text]
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def _prefixes(word):
+    word = word[:MAX_TERM_LENGTH]
+    if len(word) < 2:
+        return [word]
+    return [word[:i] for i in range(2, len(word) + 1)]
+
+
+def tokenize(text, for_query=False):
+    """把文本切分为检索词集合
+
+    建索引时中文同时产出单字和双字，单词产出全部前缀；查询时多于一个字
+    的中文只使用双字，单词只使用其本身，以减少需要合并的倒排链。
+    """
+    if not text:
+        return set()
+    text = _DIGIT_HYPHEN_RE.sub('', text.lower())
+    terms = set()
+    for run in _CJK_RE.findall(text):
+        if not for_query or len(run) == 1:
+            terms.update(run)
+        terms.update(_bigrams(run))
+    for word in _WORD_RE.findall(_CJK_RE.sub(' ', text)):
+        if for_query:
+            terms.add(word[:MAX_TERM_LENGTH])
+        else:
+            terms.update(_prefixes(word))
+    return terms
+
+
+def build_terms(book):
+    """计算一本图书的检索词及其权重"""
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(book, field)):
+            weights[term] = weights.get(term, 0) + weight
+    return [
+        BookSearchTerm(book_id=book.pk, term=term, weight=weight)
+        for term, weight in weights.items()
+    ]
+
+
+def index_book(book):
+    """重建单本图书的索引（保存图书时调用）"""
+    with transaction.atomic():
+        BookSearchTerm.objects.filter(book_id=book.pk).delete()
+        BookSearchTerm.objects.bulk_create(build_terms(book))
+
+
+def index_books(books, batch_size=1000):
+    """批量重建多本图书的索引，返回写入的检索词数量"""
+    books = list(books)
+    terms = []
+    for book in books:
+        terms.extend(build_terms(book))
+    with transaction.atomic():
+        BookSearchTerm.objects.filter(book_id__in=[book.pk for book in books]).delete()
+        BookSearchTerm.objects.bulk_create(terms, batch_size=batch_size)
+    return len(terms)
+
+
+def _rarest_term(terms):
+    """估算每个检索词的倒排链长度（最多数到 MAX_CANDIDATES），返回最短的一个"""
+    best, best_count = None, None
+    for term in sorted(terms):
+        count = BookSearchTerm.objects.filter(term=term)[:MAX_CANDIDATES].count()
+        if best_count is None or count < best_count:
+            best, best_count = term, count
+        if count == 0:
+            break
+    return best, best_count
+
+
+def _no_results(books):
+    """空结果也带上 search_score 注解，调用方可以照常按得分排序"""
+    return books.none().annotate(search_score=Value(0, output_field=IntegerField()))
+
+
+def search_books(query, books=None):
+    """在给定的图书查询集中检索，结果带 search_score 注解并按相关度排序
+
+    分类、可借等过滤条件应在调用前作用于 books，这样候选集只包含符合
+    条件的图书。
+    """
+    terms = tokenize(query, for_query=True)
+    if books is None:
+        books = Book.objects.all()
+    if not terms:
+        return _no_results(books)
+
+    # 以倒排链最短的检索词圈定候选图书，再对候选计算全部检索词的命中
+    pivot, count = _rarest_term(terms)
+    if count == 0:
+        return _no_results(books)
+    # 候选作为子查询交给数据库，不截断：检索词再宽泛也不会丢掉匹配的图书，
+    # 代价是宽泛查询的耗时随匹配数量增长（见 benchmark_search）
+    candidates = BookSearchTerm.objects.filter(term=pivot).values('book_id')
+
+    return books.filter(
+        id__in=candidates,
+        search_terms__term__in=terms,
+    ).annotate(
+        search_hits=Count('search_terms'),
+        search_score=Sum('search_terms__weight'),
+    ).filter(
+        search_hits=len(terms)
+    ).order_by('-search_score', '-id')
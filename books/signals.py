@@ -0,0 +1,56 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book, BookBorrowing, BookReservation, Category
+from . import caching, category_tree, dashboard, search
+
+# 影响检索索引的字段
+SEARCH_FIELDS = {field for field, _ in search.FIELD_WEIGHTS}
+
+
+@receiver(post_save, sender=Book)
+def update_book_search_index(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """图书保存后增量更新检索索引
+
+    删除图书时索引行会随外键级联删除，无需单独处理。
+    """
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_book(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, raw=False, **kwargs):
+    """分类变化后使分类树和依赖分类的视图缓存失效（更新 Category 的版本号）"""
+    if raw:
+        return
+    category_tree.invalidate()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookBorrowing)
+@receiver(post_delete, sender=BookBorrowing)
+def invalidate_view_cache(sender, raw=False, **kwargs):
+    """图书、借阅变化后使依赖它们的视图缓存失效（分类见 invalidate_category_tree）"""
+    if raw:
+        return
+    caching.touch(sender)
+
+
+@receiver(post_save, sender=BookBorrowing)
+@receiver(post_delete, sender=BookBorrowing)
+@receiver(post_save, sender=BookReservation)
+@receiver(post_delete, sender=BookReservation)
+def invalidate_dashboard(sender, instance, raw=False, **kwargs):
+    """借阅、预约记录变化后使读者的个人中心缓存失效
+
+    用 update() 修改的地方（归还、预约状态流转）需要自己调用 dashboard.invalidate。
+    """
+    if raw:
+        return
+    user_id = instance.borrower_id if sender is BookBorrowing else instance.reservationer_id
+    dashboard.invalidate(user_id)
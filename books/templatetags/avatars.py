@@ -0,0 +1,19 @@
+from django import template
+
+from books import avatars
+
+register = template.Library()
+
+
+@register.inclusion_tag('accounts/_avatar.html')
+def avatar(profile, size=96, css_class='rounded-circle', alt='头像'):
+    """显示头像：WebP 优先，不支持的浏览器用 JPEG；没有头像时显示默认图片
+
+    size 为显示尺寸（像素），选用不小于它的缩略图。还没有缩略图的旧头像显示原始文件。
+    """
+    return {
+        'urls': avatars.avatar_urls(profile, size),
+        'size': size,
+        'css_class': css_class,
+        'alt': alt,
+    }
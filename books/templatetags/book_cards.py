@@ -0,0 +1,47 @@
+"""
+图书卡片的片段缓存
+
+每张卡片的 HTML 按图书的 update_at 缓存，内容没变的卡片不再渲染模板。
+借还书用 update() 修改库存，不会刷新 update_at，所以可借数量、总数和分类
+名称也是缓存键的一部分。一页的卡片用一次 get_many 读取，只渲染未命中的卡片，
+再用一次 set_many 写回。
+
+卡片需要 views.card_queryset 投影出的字段（category_name 为注解）。
+"""
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_KEY = 'book_card:{pk}:{digest}'
+CARD_TIMEOUT = 24 * 3600
+CARD_TEMPLATE = 'books/_book_card.html'
+
+
+def card_key(book):
+    updated = book.update_at.timestamp() if book.update_at else None
+    parts = (updated, book.available, book.quantity, book.category_name)
+    return CARD_KEY.format(pk=book.pk, digest=hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+@register.simple_tag
+def book_cards(books):
+    """依次输出每本书的卡片"""
+    books = list(books)
+    keys = [card_key(book) for book in books]
+    cached = cache.get_many(keys)
+    rendered = {}
+    card_template = get_template(CARD_TEMPLATE)
+    html = []
+    for key, book in zip(keys, books):
+        card = cached.get(key)
+        if card is None:
+            card = rendered[key] = card_template.render({'book': book})
+        html.append(card)
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+    return mark_safe(''.join(html))
@@ -0,0 +1,85 @@
+"""
+测试辅助：查询预算
+
+    from books.testing import QueryBudgetMixin, query_budget
+
+    class BookListTests(QueryBudgetMixin, TestCase):
+        def test_book_list(self):
+            self.client.force_login(self.user)
+            # 预算取 REQUEST_PROFILING['QUERY_BUDGETS']['book_list']
+            self.assertViewWithinBudget('book_list')
+
+        def test_search(self):
+            with query_budget(3):
+                list(search.search_books('python'))
+
+超出预算时断言失败，并列出最耗时的查询，方便定位 N+1。
+
+FlakyEmailBackend 是按比例随机失败的内存邮件后端，用来演练通知发件箱的重试：
+
+    LIBMANGE_EMAIL_BACKEND=books.testing.FlakyEmailBackend python manage.py run_notification_worker
+"""
+import random
+import smtplib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail.backends import locmem
+from django.urls import resolve, reverse
+
+from .middleware import QueryRecorder, get_setting, install_template_timing
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, max_db_ms=None, label='block'):
+    """代码块中的查询数超过 max_queries（或数据库耗时超过 max_db_ms）时断言失败"""
+    # 测试时中间件未启用，由这里统计模板渲染期间的查询
+    install_template_timing()
+    with QueryRecorder() as recorder:
+        yield recorder
+    problems = []
+    if recorder.count > max_queries:
+        problems.append(f'{recorder.count} queries > budget {max_queries}')
+    if max_db_ms is not None and recorder.db_ms > max_db_ms:
+        problems.append(f'db {recorder.db_ms:.1f}ms > budget {max_db_ms}ms')
+    if problems:
+        raise QueryBudgetExceeded(
+            f'{label}: {"; ".join(problems)} '
+            f'({recorder.template_queries} queries during template rendering)\n'
+            f'{recorder.format_queries(get_setting("TOP_QUERIES"))}'
+        )
+
+
+class QueryBudgetMixin:
+    """TestCase 混入类，按 URL 名称检查视图的查询预算"""
+
+    def assertViewWithinBudget(self, viewname, budget=None, args=None, kwargs=None,
+                               data=None, method='get', status_code=200):
+        url = reverse(viewname, args=args, kwargs=kwargs)
+        name = resolve(url).view_name
+        if budget is None:
+            budget = get_setting('QUERY_BUDGETS').get(name)
+            if budget is None:
+                self.fail(f'REQUEST_PROFILING["QUERY_BUDGETS"] 中没有 {name} 的预算')
+        with query_budget(budget, label=name):
+            response = getattr(self.client, method)(url, data)
+        self.assertEqual(response.status_code, status_code)
+        return response
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """内存邮件后端，每封邮件按 settings.EMAIL_FAILURE_RATE（默认 0.3）的概率发送失败
+
+    发送成功的邮件保存在 django.core.mail.outbox 中。
+    """
+
+    def send_messages(self, messages):
+        rate = getattr(settings, 'EMAIL_FAILURE_RATE', 0.3)
+        for message in messages:
+            if random.random() < rate:
+                raise smtplib.SMTPServerDisconnected('模拟的邮件服务器故障')
+        return super().send_messages(messages)
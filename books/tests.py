@@ -1,3 +1,1736 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+
+from .models import (
+    Book, BookBorrowing, BookBorrowStat, BookNeighbor, BookReservation, BookSearchTerm, BroadcastMessage, CacheVersion,
+    Category, CategoryBorrowStat, DailyBorrowStat, Notification, NotificationCounter, NotificationOutbox,
+    RecommendationBuild, UserBorrowStat, UserProfile,
+)
+from .testing import QueryBudgetMixin, query_budget
+from .notifications import create_notification, get_unread_count
+from . import (
+    async_views, avatars, benchmarks, broadcasts, caching, category_tree, circulation, dashboard, exports, notifications, outbox, recommendations,
+    replicas, reservations, rollups, search,
+)
+
+
+class CatalogApiTests(QueryBudgetMixin, TestCase):
+    """目录接口：查询次数不随返回的图书数量增长，字段投影和 ETag 生效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('kiosk', password='kiosk-pass')
+        parent = Category.objects.create(name='计算机', code='TP')
+        cls.category = Category.objects.create(name='程序设计', code='TP3', parent=parent)
+        cls.books = [
+            Book.objects.create(
+                title=f'图书 {i}', author=f'作者 {i % 7}', isbn=f'978000000{i:04d}',
+                category=cls.category, quantity=2, available=i % 3,
+            )
+            for i in range(40)
+        ]
+
+    def setUp(self):
+        # 版本号第一次读取时才初始化，先建好，预算按之后的请求计算
+        caching.get_versions([Book, Category])
+        self.client.force_login(self.user)
+
+    def test_book_list(self):
+        response = self.assertViewWithinBudget('api_books', budget=4, data={'page_size': 15})
+        data = response.json()
+        self.assertEqual(len(data['results']), 15)
+        self.assertTrue(data['has_next'])
+        self.assertEqual(set(data['results'][0]), {'id', 'isbn', 'title', 'author', 'category', 'available'})
+        self.assertEqual(data['results'][0]['category'], '程序设计')
+
+        # 按游标翻页，不重复也不遗漏
+        seen = [row['id'] for row in data['results']]
+        cursor = data['next_cursor']
+        while cursor:
+            data = self.assertViewWithinBudget('api_books', budget=4, data={'page_size': 15, 'cursor': cursor}).json()
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+        self.assertEqual(sorted(seen), sorted(book.pk for book in self.books))
+
+    def test_invalid_cursor(self):
+        # 不能退回第一页，否则客户端会重复追加已有的条目
+        response = self.client.get(reverse('api_books'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+    def test_fields_projection(self):
+        data = self.assertViewWithinBudget('api_books', data={'fields': 'isbn,quantity'}).json()
+        self.assertEqual(set(data['results'][0]), {'isbn', 'quantity'})
+
+        response = self.client.get(reverse('api_books'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_available_filter(self):
+        data = self.assertViewWithinBudget('api_books', data={'available': '1', 'page_size': 100}).json()
+        self.assertEqual(len(data['results']), sum(1 for book in self.books if book.available > 0))
+        self.assertTrue(all(row['available'] > 0 for row in data['results']))
+
+    def test_batch_by_ids(self):
+        ids = [book.pk for book in reversed(self.books)] + [999999]
+        data = self.assertViewWithinBudget(
+            'api_books', budget=4, data={'ids': ','.join(map(str, ids)), 'fields': 'title'}
+        ).json()
+        self.assertEqual([row['title'] for row in data['results']], [book.title for book in reversed(self.books)])
+        self.assertEqual(data['missing'], [999999])
+
+    def test_batch_by_isbn(self):
+        isbns = [book.isbn for book in self.books[:5]]
+        data = self.assertViewWithinBudget('api_books', budget=4, data={'isbn': isbns}).json()
+        self.assertEqual([row['isbn'] for row in data['results']], isbns)
+
+    def test_search(self):
+        data = self.assertViewWithinBudget('api_books', data={'q': self.books[12].isbn, 'fields': 'id'}).json()
+        self.assertIn(self.books[12].pk, [row['id'] for row in data['results']])
+
+    def test_search_without_matches(self):
+        # 查询没有检索词、或检索词没有倒排记录时返回空结果，不是 500
+        for query in ('!!!', 'zzzzqq'):
+            data = self.client.get(reverse('api_books'), {'q': query}).json()
+            self.assertEqual((data['results'], data['has_next']), ([], False))
+
+    def test_batch_limit(self):
+        response = self.client.get(reverse('api_books'), {'ids': ','.join(str(i) for i in range(1, 102))})
+        self.assertEqual(response.status_code, 400)
+
+    def test_book_detail(self):
+        book = self.books[0]
+        data = self.assertViewWithinBudget('api_book_detail', args=[book.pk]).json()
+        self.assertEqual(data['isbn'], book.isbn)
+        self.assertIn('description', data)
+        self.assertViewWithinBudget('api_book_detail', args=[999999], status_code=404)
+
+    def test_categories(self):
+        data = self.assertViewWithinBudget('api_categories').json()
+        self.assertEqual([row['name'] for row in data['results']], ['计算机', '程序设计'])
+
+    def test_availability(self):
+        ids = [book.pk for book in self.books]
+        data = self.assertViewWithinBudget('api_availability', data={'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual(len(data['results']), len(ids))
+        self.assertEqual(set(data['results'][0]), {'id', 'isbn', 'quantity', 'available'})
+        self.assertViewWithinBudget('api_availability', status_code=400)
+
+    def test_not_modified(self):
+        response = self.client.get(reverse('api_books'))
+        etag = response['ETag']
+        # 未变化时只读取会话、用户和版本号，不查询目录数据
+        with query_budget(3, label='api_books 304'):
+            response = self.client.get(reverse('api_books'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(pk=self.books[0].pk).update(available=0)
+            caching.touch(Book)
+        response = self.client.get(reverse('api_books'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_books')).status_code, 401)
+
+
+class BookListCardTests(QueryBudgetMixin, TestCase):
+    """图书列表：卡片只读需要的列，HTML 按图书缓存，库存变化后重新渲染"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('browser', password='browser-pass')
+        cls.category = Category.objects.create(name='历史', code='K')
+        cls.books = [
+            Book.objects.create(
+                title=f'史书 {i}', author='作者', isbn=f'978300000{i:04d}',
+                category=cls.category, quantity=3, available=3, description='简介' * 500,
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        # 未读数角标由上下文处理器读取，先建好计数缓存
+        get_unread_count(self.user)
+        self.client.force_login(self.user)
+
+    def test_cards(self):
+        response = self.assertViewWithinBudget('book_list', data={'page_size': 30})
+        self.assertContains(response, 'card-title', count=30)
+        self.assertContains(response, '分类：历史', count=30)
+        self.assertNotIn('description', response.context['books'].object_list[0].__dict__)
+        self.assertContains(response, '<select', count=1)
+
+        # 借书用 update() 扣减库存，update_at 不变，卡片也要更新
+        Book.objects.filter(pk=self.books[-1].pk).update(available=1)
+        response = self.client.get(reverse('book_list'), {'page_size': 30})
+        self.assertContains(response, '可借数量：1/3', count=1)
+        self.assertContains(response, '可借数量：3/3', count=29)
+
+    def test_search_without_matches(self):
+        for query in ('!!!', 'zzzzqq'):
+            response = self.client.get(reverse('book_list'), {'search_query': query})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['books']), 0)
+
+    def test_load_more_with_invalid_cursor(self):
+        response = self.client.get(reverse('book_list'), {'cursor': 'WyJ4Il0', 'format': 'json'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_category_select_keeps_selection(self):
+        self.client.get(reverse('book_list'))
+        response = self.client.get(reverse('book_list'), {'category': self.category.pk})
+        self.assertContains(response, f'<option value="{self.category.pk}" selected>')
+
+
+class ProfileDashboardTests(QueryBudgetMixin, TestCase):
+    """个人中心：统计一条聚合查询，列表不随行数增加查询，按用户缓存并在借还、预约后失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='reader-pass')
+        cls.others = [User.objects.create_user(f'reader{i}', password='reader-pass') for i in range(3)]
+        category = Category.objects.create(name='文学', code='I')
+        cls.books = [
+            Book.objects.create(
+                title=f'小说 {i}', author='作者', isbn=f'978100000{i:04d}',
+                category=category, quantity=1, available=1,
+            )
+            for i in range(8)
+        ]
+        now = timezone.now()
+        for i, book in enumerate(cls.books[:6]):
+            BookBorrowing.objects.create(
+                book=book, borrower=cls.user, due_date=now + timedelta(days=10 if i % 2 else -3),
+            )
+        BookBorrowing.objects.create(
+            book=cls.books[6], borrower=cls.user, due_date=now - timedelta(days=20),
+            returned=True, return_date=now - timedelta(days=25),
+        )
+        # 第 8 本书被借走，reader0、reader1 排在前面
+        cls.waiting_book = cls.books[7]
+        cls.waiting_book.available = 0
+        cls.waiting_book.save()
+        for position, user in enumerate(cls.others[:2] + [cls.user], start=1):
+            BookReservation.objects.create(book=cls.waiting_book, reservationer=user, position=position)
+
+    def setUp(self):
+        cache.clear()
+        # 未读数由上下文处理器读取，先建好计数缓存
+        get_unread_count(self.user)
+        self.client.force_login(self.user)
+
+    def test_dashboard_queries(self):
+        response = self.assertViewWithinBudget('profile')
+        self.assertEqual(response.context['user_stats'], {
+            'total_borrowed': 7, 'current_borrowed': 3, 'overdue_books': 3,
+        })
+        self.assertEqual(len(response.context['current_borrowings']), 6)
+        self.assertContains(response, '已逾期', count=3)
+        self.assertContains(response, '排队中，第 3 位')
+
+        # 命中缓存后只有会话和用户两条查询
+        self.assertViewWithinBudget('profile', budget=2)
+
+    def test_invalidated_by_return(self):
+        self.client.get(reverse('profile'))
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.return_book(self.user, self.books[0])
+        stats = self.client.get(reverse('profile')).context['user_stats']
+        self.assertEqual(stats['overdue_books'], 2)
+
+    def test_invalidated_when_queue_moves(self):
+        self.assertContains(self.client.get(reverse('profile')), '排队中，第 3 位')
+        ahead = BookReservation.objects.get(book=self.waiting_book, reservationer=self.others[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.cancel(self.others[0], ahead.pk)
+        self.assertContains(self.client.get(reverse('profile')), '排队中，第 2 位')
+
+    def test_cache_expires_when_next_loan_falls_due(self):
+        BookBorrowing.objects.filter(borrower=self.user, returned=False, due_date__gt=timezone.now()).update(
+            due_date=timezone.now() + timedelta(seconds=30),
+        )
+        with mock.patch('books.dashboard.cache.set') as cache_set:
+            self.client.get(reverse('profile'))
+        key, _, timeout = cache_set.call_args.args
+        self.assertEqual(key, dashboard.dashboard_key(self.user.pk))
+        self.assertLessEqual(timeout, 31)
+
+
+@override_settings(DATABASE_REPLICATION={'REPLICAS': ['replica'], 'STICKY_SECONDS': 15})
+class ReplicaRoutingTests(TransactionTestCase):
+    """主库和副本是两个 SQLite 文件，之间没有复制：副本上的书名代表复制延迟时的旧数据
+
+    TestCase 会把每个测试包在事务里，而事务中的读取总是走主库，这里用 TransactionTestCase。
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # 先检查一次副本，之后的请求复用检查结果
+        replicas.health.reset()
+        replicas.health.is_healthy('replica')
+        self.user = User.objects.create_user('reader', password='reader-pass', is_superuser=True)
+        self.book = Book.objects.create(title='主库书名', author='作者', isbn='9782000000001', quantity=2, available=2)
+        self.client.force_login(self.user)
+        self.replicate(self.user, *Session.objects.all())
+        Book.objects.using('replica').create(
+            pk=self.book.pk, title='副本书名', author='作者', isbn=self.book.isbn, quantity=2, available=2,
+        )
+
+    def replicate(self, *objects):
+        for obj in objects:
+            obj.save(using='replica')
+
+    def api_title(self):
+        return self.client.get(reverse('api_book_detail', args=[self.book.pk])).json()['title']
+
+    def test_read_only_views_use_replica(self):
+        self.assertEqual(self.api_title(), '副本书名')
+        # 没有标记为只读的代码照常读主库
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, '主库书名')
+        with replicas.use_replica():
+            self.assertEqual(Book.objects.get(pk=self.book.pk).title, '副本书名')
+
+    def test_sticky_after_write(self):
+        response = self.client.post(reverse('borrow_book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('db_primary_until', response.cookies)
+        self.assertEqual(self.api_title(), '主库书名')
+
+        # 粘滞期过后回到副本
+        self.client.cookies['db_primary_until'] = '0'
+        self.assertEqual(self.api_title(), '副本书名')
+
+    def test_unhealthy_replica_falls_back_to_primary(self):
+        replicas.health.reset()
+        with mock.patch.object(replicas.health, 'check', return_value=False) as check:
+            self.assertEqual(self.api_title(), '主库书名')
+            self.assertEqual(self.api_title(), '主库书名')
+        # 检查结果在 HEALTH_CHECK_SECONDS 内复用
+        self.assertEqual(check.call_count, 1)
+
+    def test_cached_data_built_on_primary(self):
+        # 未读计数行不存在时会在请求中写入，请求随之粘在主库；先建好并复制到副本
+        get_unread_count(self.user)
+        self.replicate(*NotificationCounter.objects.all())
+        # 首页走副本，但缓存未命中时的数据从主库计算，不把副本的旧数据存到当前版本号下
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '主库书名')
+        self.assertNotContains(response, '副本书名')
+
+    def test_api_etag_follows_replica_data(self):
+        caching.get_versions([Book])
+        self.replicate(*CacheVersion.objects.all())
+        response = self.client.get(reverse('api_book_detail', args=[self.book.pk]))
+        self.assertEqual(response.json()['title'], '副本书名')
+        etag = response['ETag']
+
+        # 主库更新并提升版本号，副本还没复制过来：副本上的版本号和数据都是旧的
+        Book.objects.filter(pk=self.book.pk).update(title='新书名')
+        caching.touch(Book)
+        response = self.client.get(
+            reverse('api_book_detail', args=[self.book.pk]), headers={'If-None-Match': etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # 复制追上后 ETag 随数据一起变化
+        self.replicate(Book.objects.get(pk=self.book.pk), *CacheVersion.objects.all())
+        response = self.client.get(
+            reverse('api_book_detail', args=[self.book.pk]), headers={'If-None-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], '新书名')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_writes_and_transactions_use_primary(self):
+        with replicas.use_replica():
+            Book.objects.filter(pk=self.book.pk).update(title='新书名')
+            with transaction.atomic():
+                self.assertEqual(Book.objects.get(pk=self.book.pk).title, '新书名')
+            self.assertEqual(Book.objects.get(pk=self.book.pk).title, '副本书名')
+
+
+class AvatarTests(TestCase):
+    """头像：上传后生成固定尺寸的缩略图，摆正方向、去掉元数据；旧头像由 process_avatars 命令补生成"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        cache.clear()
+        self.user = User.objects.create_user('photographer', password='photo-pass', email='p@example.com')
+        get_unread_count(self.user)
+        self.client.force_login(self.user)
+
+    def photo(self, fmt='JPEG'):
+        """400x200 的横向照片，EXIF 标记需要顺时针旋转 90°（手机竖拍），带拍摄设备信息"""
+        image = Image.new('RGB', (400, 200), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'PhoneMaker'
+        output = io.BytesIO()
+        image.save(output, fmt, exif=exif.tobytes())
+        return output.getvalue()
+
+    def upload(self, data, name='photo.jpg'):
+        return self.client.post(reverse('edit_profile'), {
+            'email': 'p@example.com', 'phone': '13800000000',
+            'avatar': SimpleUploadedFile(name, data, content_type='image/jpeg'),
+        })
+
+    def test_upload_creates_variants(self):
+        self.assertRedirects(self.upload(self.photo()), reverse('profile'))
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(len(profile.avatar_digest), 16)
+        self.assertEqual(profile.avatar.name, f'avatar/{profile.avatar_digest}/master.jpg')
+
+        with default_storage.open(profile.avatar.name) as f:
+            master = Image.open(f)
+            # 按 EXIF 摆正后是竖图，且不再带 EXIF
+            self.assertEqual(master.size, (200, 400))
+            self.assertFalse(master.getexif())
+        for size in avatars.SIZES:
+            for extension in avatars.FORMATS:
+                with default_storage.open(avatars.variant_name(profile.avatar_digest, size, extension)) as f:
+                    self.assertEqual(Image.open(f).size, (size, size))
+
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, avatars.variant_url(profile.avatar_digest, 256, 'webp'))
+
+    def test_variant_cache_headers(self):
+        self.upload(self.photo())
+        digest = UserProfile.objects.get(user=self.user).avatar_digest
+        response = self.client.get(avatars.variant_url(digest, 96, 'webp'))
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('avatar', args=[digest, '97.webp'])).status_code, 404)
+
+    def test_replacing_avatar_removes_old_files(self):
+        self.upload(self.photo())
+        old_digest = UserProfile.objects.get(user=self.user).avatar_digest
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(self.photo('PNG'), name='photo.png')
+        new_digest = UserProfile.objects.get(user=self.user).avatar_digest
+        self.assertNotEqual(new_digest, old_digest)
+        self.assertFalse(default_storage.exists(avatars.variant_name(old_digest, 96, 'jpg')))
+        self.assertTrue(default_storage.exists(avatars.variant_name(new_digest, 96, 'jpg')))
+
+    def legacy_avatar(self, data):
+        original = default_storage.save('avatar/legacy.jpg', ContentFile(data))
+        UserProfile.objects.create(user=self.user, email='p@example.com', phone='13800000000', avatar=original)
+        return original
+
+    def test_existing_avatar_shown_as_is(self):
+        original = self.legacy_avatar(self.photo())
+        with query_budget(6, label='profile'):
+            response = self.client.get(reverse('profile'))
+        # 显示时不处理图片、不改数据、不删文件
+        self.assertContains(response, default_storage.url(original))
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar_digest, '')
+        self.assertTrue(default_storage.exists(original))
+
+    def test_process_avatars_command(self):
+        original = self.legacy_avatar(self.photo())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_avatars', stdout=io.StringIO())
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertTrue(profile.avatar_digest)
+        self.assertTrue(default_storage.exists(avatars.variant_name(profile.avatar_digest, 256, 'webp')))
+        self.assertFalse(default_storage.exists(original))
+        self.assertContains(self.client.get(reverse('profile')), avatars.variant_url(profile.avatar_digest, 256, 'jpg'))
+
+    def test_failed_backfill_keeps_original(self):
+        original = self.legacy_avatar(b'not an image')
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_avatars', stdout=io.StringIO())
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar_digest, '')
+        self.assertTrue(default_storage.exists(original))
+
+    def test_invalid_upload(self):
+        response = self.upload(b'not an image')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+
+class RecommendationTests(QueryBudgetMixin, TestCase):
+    """相似图书：分块的稀疏计算与稠密矩阵结果一致，增量只重算受影响的图书，详情页一条查询读出"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='科学', code='N')
+        cls.books = {
+            name: Book.objects.create(
+                title=f'科普 {name}', author=f'作者 {name}', isbn=f'97840000000{i:02d}',
+                category=category, quantity=5, available=5,
+            )
+            for i, name in enumerate('ABCD')
+        }
+        cls.users = [User.objects.create_user(f'scientist{i}', password='pass') for i in range(6)]
+        # A、B 总是一起借；C、D 各只有一位共同读者，不够 MIN_CO_BORROWERS
+        for user, names in zip(cls.users, ['ABC', 'AB', 'ABD', 'CD', 'AA']):
+            for name in names:
+                cls.borrow(user, name)
+
+    @classmethod
+    def borrow(cls, user, name):
+        BookBorrowing.objects.create(book=cls.books[name], borrower=user, due_date=timezone.now() + timedelta(days=30))
+
+    def neighbors(self, name):
+        return [
+            (related.neighbor.title[-1], related.co_borrowers)
+            for related in recommendations.related_books(self.books[name])
+        ]
+
+    def test_matches_dense_computation(self):
+        rng = np.random.default_rng(7)
+        user_ids = rng.integers(0, 60, 2000)
+        book_ids = rng.zipf(1.5, 2000) % 40
+        matrix = recommendations.BorrowMatrix(user_ids, book_ids, max_user_books=0)
+
+        dense = np.zeros((60, 40), dtype=np.int64)
+        dense[user_ids, book_ids] = 1
+        dense = dense[:, dense.any(axis=0)]
+        co_counts = dense.T @ dense
+        degree = np.diag(co_counts)
+        expected = co_counts / np.sqrt(np.outer(degree, degree))
+        np.fill_diagonal(expected, 0)
+        expected[co_counts < 2] = 0
+
+        targets = np.arange(matrix.n_books)
+        # 每块只放 3 本书，覆盖分块拼接
+        with mock.patch.object(recommendations, 'BLOCK_CELLS', 3 * matrix.n_books):
+            np.testing.assert_array_equal(matrix.co_counts(targets), co_counts)
+            for target, similar in matrix.top_neighbors(targets, top_k=5):
+                best = np.sort(expected[target])[::-1][:5]
+                np.testing.assert_allclose([score for _, score, _ in similar], best[best > 0])
+
+    def test_full_build(self):
+        build = recommendations.build(metric='jaccard')
+        self.assertEqual((build.mode, build.borrowings, build.books), ('full', 12, 4))
+        self.assertEqual(self.neighbors('A'), [('B', 3)])
+        self.assertEqual(self.neighbors('C'), [])
+        # 重复借阅只算一次：A 有 4 位读者，B 有 3 位，共同 3 位
+        self.assertEqual(BookNeighbor.objects.get(book=self.books['A']).score, 0.75)
+
+    def test_incremental_build(self):
+        recommendations.build()
+        a_row = BookNeighbor.objects.get(book=self.books['A'])
+        self.borrow(self.users[5], 'C')
+        self.borrow(self.users[5], 'D')
+
+        build = recommendations.build(incremental=True)
+        self.assertEqual((build.mode, build.borrowings, build.books), ('incremental', 2, 2))
+        self.assertEqual(build.last_borrowing_id, BookBorrowing.objects.latest('id').pk)
+        self.assertEqual(self.neighbors('C'), [('D', 2)])
+        self.assertAlmostEqual(BookNeighbor.objects.get(book=self.books['C']).score, 2 / 3)
+        # 没受影响的图书不重写
+        self.assertTrue(BookNeighbor.objects.filter(pk=a_row.pk).exists())
+
+        # 没有新借阅时什么都不做
+        self.assertEqual(recommendations.build(incremental=True).books, 0)
+        self.assertEqual(RecommendationBuild.objects.count(), 3)
+
+    def test_book_detail(self):
+        recommendations.build()
+        self.client.force_login(self.users[0])
+        response = self.assertViewWithinBudget('book_detail', args=[self.books['A'].pk])
+        self.assertContains(response, '借过这本书的读者还借了')
+        self.assertContains(response, reverse('book_detail', args=[self.books['B'].pk]))
+        response = self.client.get(reverse('book_detail', args=[self.books['C'].pk]))
+        self.assertNotContains(response, '借过这本书的读者还借了')
+
+
+class UnreadBadgeTests(TestCase):
+    """未读数角标：服务端渲染初始值；WSGI 下轮询未读数，只有 ASGI 下才打开实时连接"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('notified', password='notified-pass')
+
+    def setUp(self):
+        cache.clear()
+        get_unread_count(self.user)
+        self.client.force_login(self.user)
+
+    def test_badge_rendered_without_stream_under_wsgi(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_notification(self.user, 'system', '通知', '内容')
+            create_notification(self.user, 'system', '通知', '内容')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'bg-danger">2</span>', html=False)
+        self.assertNotContains(response, reverse('notification_stream'))
+        self.assertContains(response, reverse('unread_notification_count'))
+
+        response = self.client.get(reverse('unread_notification_count'))
+        self.assertEqual(response.json(), {'count': 2})
+        self.assertEqual(response['Cache-Control'], 'no-store')
+
+    def test_badge_hidden_when_nothing_unread(self):
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'bg-danger d-none"></span>', html=False)
+
+    async def test_stream_only_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('index'))
+        self.assertContains(response, reverse('notification_stream'))
+        self.assertNotContains(response, reverse('unread_notification_count'))
+
+
+class ViewDataCacheTests(TestCase):
+    """按模型版本缓存：版本号在数据库中，其他进程（各有一份本地缓存）的写入也能让本进程的缓存失效"""
+
+    def setUp(self):
+        cache.clear()
+        # 另一个 Web 进程：同一个数据库，独立的 LocMemCache
+        self.other_process_cache = LocMemCache('other-process', {})
+        self.other_process_cache.clear()
+
+    def write_in_other_process(self, **fields):
+        with mock.patch.object(caching, 'cache', self.other_process_cache), \
+                self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(author='作者', quantity=1, available=1, **fields)
+
+    def test_write_in_other_process_invalidates_data(self):
+        builds = []
+
+        def builder():
+            builds.append(1)
+            return Book.objects.count()
+
+        self.assertEqual(caching.cached_data('book_count', [Book], builder), 0)
+        self.assertEqual(caching.cached_data('book_count', [Book], builder), 0)
+        self.assertEqual(len(builds), 1)
+
+        self.write_in_other_process(title='新书', isbn='9785000000001')
+        self.assertEqual(caching.cached_data('book_count', [Book], builder), 1)
+        self.assertEqual(len(builds), 2)
+
+    def test_write_in_other_process_changes_etag(self):
+        etag = self.client.get(reverse('index'))['ETag']
+        response = self.client.get(reverse('index'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.write_in_other_process(title='新书', isbn='9785000000002')
+        response = self.client.get(reverse('index'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '新书')
+
+    def test_versions_never_go_backwards(self):
+        [before] = caching.get_versions([Book])
+        with mock.patch('books.caching.time.time_ns', return_value=before - 10**9):
+            with self.captureOnCommitCallbacks(execute=True):
+                caching.touch(Book)
+        self.assertEqual(caching.get_versions([Book]), [before + 1])
+
+
+@override_settings(
+    NOTIFICATION_OUTBOX={
+        'CHANNELS': {'in_app': 'books.outbox.InAppChannel', 'email': 'books.outbox.EmailChannel'},
+        'MAX_ATTEMPTS': 3,
+        'BACKOFF_SECONDS': 30,
+        'MAX_BACKOFF_SECONDS': 45,
+        'LEASE_SECONDS': 300,
+    },
+    EMAIL_BACKEND='books.testing.FlakyEmailBackend',
+    EMAIL_FAILURE_RATE=0,
+)
+class NotificationOutboxTests(TestCase):
+    """通知发件箱：站内通知恰好一次，邮件至少一次；租期、退避、放弃和重新排队"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('patron', password='patron-pass', email='patron@example.com')
+
+    def setUp(self):
+        cache.clear()
+        get_unread_count(self.user)
+
+    def enqueue(self, channels=None):
+        outbox.enqueue(self.user.pk, 'system', '测试通知', '内容', channels=channels)
+
+    def test_rolled_back_business_leaves_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.enqueue()
+            raise RuntimeError
+        self.assertIsNone(outbox.process_batch())
+
+    def test_in_app_delivered_exactly_once(self):
+        self.enqueue(['in_app'])
+        messages = outbox.claim(10, timezone.now())
+        self.assertEqual(outbox.deliver(messages, timezone.now())['sent'], 1)
+        # 租期过后另一个投递进程拿着同一批消息重试：已投递的跳过，不会重复写入
+        stats = outbox.deliver(messages, timezone.now())
+        self.assertEqual((stats['sent'], stats['skipped']), (0, 1))
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).unread_count, 1)
+
+    def test_lease(self):
+        self.enqueue(['in_app'])
+        now = timezone.now()
+        self.assertEqual(len(outbox.claim(10, now)), 1)
+        # 租期内其他进程取不到；投递进程崩溃，租期结束后重新取出
+        self.assertEqual(outbox.claim(10, now + timedelta(seconds=299)), [])
+        self.assertEqual(len(outbox.claim(10, now + timedelta(seconds=301))), 1)
+
+    def test_email_at_least_once(self):
+        self.enqueue(['email'])
+        # 邮件已发出，标记已投递之前进程崩溃：租期结束后再发一次
+        with mock.patch.object(outbox, 'mark_sent', side_effect=DatabaseError('连接断开')):
+            outbox.process_batch()
+        message = NotificationOutbox.objects.get()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+
+        outbox.deliver(outbox.claim(10, message.next_attempt_at), timezone.now())
+        self.assertEqual(NotificationOutbox.objects.get().status, 'sent')
+        self.assertEqual([email.to for email in mail.outbox], [['patron@example.com']] * 2)
+
+    @override_settings(EMAIL_FAILURE_RATE=1)
+    def test_backoff_then_give_up(self):
+        self.enqueue(['email'])
+        now = timezone.now()
+        waits = []
+        for attempt in range(1, 4):
+            stats = outbox.deliver(outbox.claim(10, now), now)
+            message = NotificationOutbox.objects.get()
+            self.assertEqual(message.attempts, attempt)
+            self.assertIn('SMTPServerDisconnected', message.last_error)
+            if attempt < 3:
+                self.assertEqual(stats['retried'], 1)
+                waits.append((message.next_attempt_at - now).total_seconds())
+                # 退避期间不会被取出
+                self.assertEqual(outbox.claim(10, now), [])
+                now = message.next_attempt_at
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(message.status, 'failed')
+        # 30 × 2^(n-1) 秒乘 0.5～1 的抖动，不超过 MAX_BACKOFF_SECONDS
+        self.assertTrue(15 <= waits[0] <= 30)
+        self.assertTrue(22.5 <= waits[1] <= 45)
+        self.assertEqual(outbox.claim(10, now + timedelta(days=1)), [])
+
+        self.assertEqual(outbox.retry_failed(NotificationOutbox.objects.all()), 1)
+        message = NotificationOutbox.objects.get()
+        self.assertEqual((message.status, message.attempts, message.last_error), ('pending', 0, ''))
+        with self.settings(EMAIL_FAILURE_RATE=0):
+            self.assertEqual(outbox.process_batch()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_worker_command(self):
+        self.enqueue()
+        output = io.StringIO()
+        call_command('run_notification_worker', stdout=output)
+        self.assertIn('投递 2', output.getvalue())
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_deliver_on_commit(self):
+        with self.settings(NOTIFICATION_OUTBOX={'CHANNELS': {'in_app': 'books.outbox.InAppChannel'}, 'DELIVER_ON_COMMIT': True}):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.enqueue()
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+
+
+class BroadcastTests(TestCase):
+    """群发消息经发件箱投递，中断后从断点继续，不会重复发送"""
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(f'reader{i}', password='pass') for i in range(5)]
+        User.objects.create_user('inactive', password='pass', is_active=False)
+        self.broadcast = BroadcastMessage.objects.create(title='闭馆通知', message='周一闭馆', target='all')
+
+    def test_enqueued_through_outbox(self):
+        broadcast, sent = broadcasts.send_chunk(self.broadcast.pk, chunk_size=2)
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.total_recipients), ('sending', 2, 5))
+        # 只写发件箱，通知由投递进程生成
+        self.assertEqual(NotificationOutbox.objects.filter(broadcast=self.broadcast).count(), 2)
+        self.assertFalse(Notification.objects.exists())
+
+        broadcast = broadcasts.send_broadcast(self.broadcast.pk, chunk_size=2)
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.total_recipients), ('done', 5, 5))
+        # 已完成的群发再次运行不会重复写入
+        broadcasts.send_broadcast(self.broadcast.pk, chunk_size=2)
+        self.assertEqual(
+            sorted(NotificationOutbox.objects.values_list('recipient_id', flat=True)),
+            [user.pk for user in self.users],
+        )
+
+        while outbox.process_batch():
+            pass
+        notifications = Notification.objects.filter(broadcast=self.broadcast)
+        self.assertEqual(sorted(notifications.values_list('recipient_id', flat=True)), [user.pk for user in self.users])
+        self.assertEqual(get_unread_count(self.users[0]), 1)
+
+        notifications.filter(recipient=self.users[0]).update(is_read=True)
+        self.assertEqual(broadcasts.read_counts([self.broadcast]), {self.broadcast.pk: 1})
+
+    def test_rolled_back_chunk_resumes(self):
+        with mock.patch.object(outbox, 'enqueue_many', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                broadcasts.send_chunk(self.broadcast.pk, chunk_size=2)
+        # 失败的一批连同进度一起回滚，重新运行从原来的断点开始
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.status, self.broadcast.last_user_id), ('pending', 0))
+        broadcasts.send_broadcast(self.broadcast.pk, chunk_size=2)
+        self.assertEqual(NotificationOutbox.objects.filter(broadcast=self.broadcast).count(), 5)
+
+
+class ReservationQueueTests(TestCase):
+    """预约排队：归还的副本留给队首，留书过期或取消后顺延给下一位，排队序号在同一本书内唯一"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='热门小说', author='作者', isbn='9786000000001', quantity=1, available=1)
+        cls.borrower = User.objects.create_user('holder', password='pass')
+        cls.patrons = [User.objects.create_user(f'patron{i}', password='pass') for i in range(3)]
+
+    def setUp(self):
+        circulation.borrow_book(self.borrower, self.book)
+        self.first = reservations.reserve(self.patrons[0], self.book)
+        self.second = reservations.reserve(self.patrons[1], self.book)
+
+    def available(self):
+        return Book.objects.get(pk=self.book.pk).available
+
+    def status(self, reservation):
+        return BookReservation.objects.get(pk=reservation.pk).status
+
+    def test_reserve_only_when_unavailable(self):
+        self.assertEqual((self.first.position, self.second.position), (1, 2))
+        self.assertEqual(self.second.queue_position(), 2)
+        with self.assertRaises(reservations.AlreadyReserved):
+            reservations.reserve(self.patrons[0], self.book)
+        with self.assertRaises(reservations.NotReservable):
+            reservations.reserve(self.borrower, self.book)
+
+    def test_return_holds_copy_for_head(self):
+        circulation.return_book(self.borrower, self.book)
+        self.assertEqual(self.status(self.first), 'ready')
+        self.assertEqual(self.status(self.second), 'waiting')
+        # 留书不计入可借数量，其他读者借不到
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(BookReservation.objects.get(pk=self.second.pk).queue_position(), 1)
+        with self.assertRaises(circulation.BookUnavailable):
+            circulation.borrow_book(self.patrons[2], self.book)
+
+        circulation.borrow_book(self.patrons[0], self.book)
+        self.assertEqual(self.status(self.first), 'fulfilled')
+        self.assertEqual(self.available(), 0)
+
+    def test_expired_hold_passes_to_next(self):
+        circulation.return_book(self.borrower, self.book)
+        later = timezone.now() + timedelta(days=reservations.HOLD_DAYS, hours=1)
+        self.assertEqual(reservations.expire_holds(later), 1)
+        self.assertEqual(self.status(self.first), 'expired')
+        self.assertEqual(self.status(self.second), 'ready')
+        # 再次执行不会重复处理
+        self.assertEqual(reservations.expire_holds(later), 0)
+
+        # 最后一位也过期后，副本回到可借数量
+        much_later = later + timedelta(days=reservations.HOLD_DAYS, hours=1)
+        self.assertEqual(reservations.expire_holds(much_later), 1)
+        self.assertEqual(self.available(), 1)
+
+    def test_cancel_ready_hold(self):
+        circulation.return_book(self.borrower, self.book)
+        reservations.cancel(self.patrons[0], self.first.pk)
+        self.assertEqual(self.status(self.first), 'cancelled')
+        self.assertEqual(self.status(self.second), 'ready')
+        with self.assertRaises(reservations.NoReservation):
+            reservations.cancel(self.patrons[0], self.first.pk)
+
+        reservations.cancel(self.patrons[1], self.second.pk)
+        self.assertEqual(self.available(), 1)
+
+    def test_cancel_waiting_moves_queue_up(self):
+        third = reservations.reserve(self.patrons[2], self.book)
+        reservations.cancel(self.patrons[1], self.second.pk)
+        self.assertEqual(BookReservation.objects.get(pk=third.pk).queue_position(), 2)
+        self.assertEqual(self.available(), 0)
+
+    def test_position_unique_per_book(self):
+        # 两位读者同时预约、算出同一个序号时（没有锁住图书行），后提交的插入失败
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BookReservation.objects.create(book=self.book, reservationer=self.patrons[2], position=2)
+        # 序号只在同一本书内唯一
+        other = Book.objects.create(title='另一本', author='作者', isbn='9786000000002', quantity=1, available=0)
+        BookReservation.objects.create(book=other, reservationer=self.patrons[2], position=2)
+
+
+class CirculationTests(TestCase):
+    """借还书的库存与借阅状态用带条件的 UPDATE 修改，过期的读取不会让库存变成负数或重复归还"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='并发图书', author='作者', isbn='9786100000001', quantity=1, available=1)
+        cls.users = [User.objects.create_user(f'reader{i}', password='pass') for i in range(2)]
+
+    def available(self):
+        return Book.objects.get(pk=self.book.pk).available
+
+    def test_borrow_last_copy_once(self):
+        circulation.borrow_book(self.users[0], self.book)
+        self.assertEqual(self.available(), 0)
+        # self.book 仍是借出前读到的 available=1，扣减按数据库中的值判断
+        with self.assertRaises(circulation.BookUnavailable):
+            circulation.borrow_book(self.users[1], self.book)
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(BookBorrowing.objects.filter(book=self.book).count(), 1)
+        self.assertEqual(NotificationOutbox.objects.filter(recipient_id=self.users[1].pk).count(), 0)
+
+    def test_return_applies_once(self):
+        circulation.borrow_book(self.users[0], self.book)
+        circulation.return_book(self.users[0], self.book)
+        self.assertEqual(self.available(), 1)
+        with self.assertRaises(circulation.NotBorrowed):
+            circulation.return_book(self.users[0], self.book)
+        self.assertEqual(self.available(), 1)
+
+    def test_concurrent_return_applies_once(self):
+        circulation.borrow_book(self.users[0], self.book)
+        filter_ = BookBorrowing.objects.filter
+
+        def read_then_returned_elsewhere(*args, **kwargs):
+            # 另一个重复提交的归还请求在本次读到借阅记录之后先完成了归还
+            borrowing = filter_(*args, **kwargs).order_by('borrowed_date').first()
+            filter_(pk=borrowing.pk).update(returned=True, status='returned')
+            lookup.side_effect = None
+            return filter_(pk=borrowing.pk)
+
+        with mock.patch.object(BookBorrowing.objects, 'filter', side_effect=read_then_returned_elsewhere,
+                               wraps=filter_) as lookup, \
+                mock.patch.object(circulation.reservations, 'release_copy') as release:
+            with self.assertRaises(circulation.NotBorrowed):
+                circulation.return_book(self.users[0], self.book)
+        release.assert_not_called()
+        self.assertEqual(self.available(), 0)
+
+
+class CirculationConcurrencyTests(TransactionTestCase):
+    """多线程对同一本书反复借还，结束时库存与未归还借阅数一致"""
+
+    def test_stress_circulation(self):
+        out = io.StringIO()
+        call_command(
+            'stress_circulation', threads=4, operations=80, copies=2, users=8, seed=1,
+            stdout=out, stderr=io.StringIO(),
+        )
+        self.assertIn('一致性检查通过', out.getvalue())
+
+
+class OverdueReminderTests(TestCase):
+    """check_overdue_books 每条借阅的每种提醒只发一次，重复运行不会重复入队"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('late', password='pass')
+        now = timezone.now()
+        for i, due in enumerate([now - timedelta(days=2), now + timedelta(days=1), now + timedelta(days=20)]):
+            book = Book.objects.create(title=f'提醒 {i}', author='作者', isbn=f'97862000000{i:02d}', quantity=1, available=0)
+            BookBorrowing.objects.create(book=book, borrower=cls.user, due_date=due)
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('check_overdue_books', *args, stdout=out)
+        return out.getvalue()
+
+    def test_second_run_sends_nothing(self):
+        output = self.run_command()
+        self.assertIn('到期提醒: 1 条', output)
+        self.assertIn('逾期提醒: 1 条', output)
+        self.assertEqual(NotificationOutbox.objects.filter(recipient_id=self.user.pk).count(), 2)
+
+        output = self.run_command()
+        self.assertIn('到期提醒: 0 条', output)
+        self.assertIn('逾期提醒: 0 条', output)
+        self.assertEqual(NotificationOutbox.objects.filter(recipient_id=self.user.pk).count(), 2)
+
+    def test_dry_run_changes_nothing(self):
+        output = self.run_command('--dry-run')
+        self.assertIn('逾期提醒: 1 条', output)
+        self.assertFalse(NotificationOutbox.objects.exists())
+        self.assertFalse(BookBorrowing.objects.filter(overdue_notified_at__isnull=False).exists())
+
+
+class BorrowingStatusTests(TestCase):
+    """逾期在查询时按 due_date 判断，不依赖 status 列"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('status', password='pass')
+        book = Book.objects.create(title='状态', author='作者', isbn='9786300000001', quantity=3, available=0)
+        now = timezone.now()
+        cls.late = BookBorrowing.objects.create(book=book, borrower=user, due_date=now - timedelta(days=1))
+        cls.current = BookBorrowing.objects.create(book=book, borrower=user, due_date=now + timedelta(days=1))
+        cls.undated = BookBorrowing.objects.create(book=book, borrower=user)
+        cls.returned = BookBorrowing.objects.create(
+            book=book, borrower=user, due_date=now - timedelta(days=5), returned=True, return_date=now,
+        )
+
+    def ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_status_column_only_records_return(self):
+        self.assertEqual(BookBorrowing.objects.get(pk=self.late.pk).status, 'borrowed')
+        self.assertEqual(BookBorrowing.objects.get(pk=self.returned.pk).status, 'returned')
+
+    def test_filters(self):
+        borrowings = BookBorrowing.objects.all()
+        self.assertEqual(self.ids(borrowings.outstanding()), {self.late.pk, self.current.pk, self.undated.pk})
+        self.assertEqual(self.ids(borrowings.overdue()), {self.late.pk})
+        self.assertEqual(self.ids(borrowings.on_loan()), {self.current.pk, self.undated.pk})
+        self.assertEqual(self.ids(borrowings.with_status('overdue')), {self.late.pk})
+        self.assertEqual(self.ids(borrowings.with_status('borrowed')), {self.current.pk, self.undated.pk})
+        self.assertEqual(self.ids(borrowings.with_status('returned')), {self.returned.pk})
+        self.assertFalse(borrowings.with_status('unknown').exists())
+
+    def test_borrowing_falls_due_without_writes(self):
+        later = timezone.now() + timedelta(days=2)
+        self.assertEqual(self.ids(BookBorrowing.objects.overdue(later)), {self.late.pk, self.current.pk})
+        self.assertEqual(self.ids(BookBorrowing.objects.on_loan(later)), {self.undated.pk})
+
+    def test_effective_status(self):
+        statuses = dict(BookBorrowing.objects.with_effective_status().values_list('id', 'effective_status'))
+        self.assertEqual(statuses, {
+            self.late.pk: 'overdue',
+            self.current.pk: 'borrowed',
+            self.undated.pk: 'borrowed',
+            self.returned.pk: 'returned',
+        })
+        # 注解的值与实例上的判断一致
+        for borrowing in BookBorrowing.objects.with_effective_status():
+            self.assertEqual(borrowing.get_effective_status(), BookBorrowing.objects.get(pk=borrowing.pk).get_effective_status())
+        self.assertEqual(BookBorrowing.objects.get(pk=self.late.pk).get_effective_status_display(), '已逾期')
+
+
+class BorrowRollupTests(TestCase):
+    """借还书时增量维护的汇总行与 rebuild 全量重建的结果一致"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='统计分类')
+        cls.books = [
+            Book.objects.create(title=f'统计 {i}', author='作者', isbn=f'97864000000{i:02d}',
+                                category=cls.category if i else None, quantity=2, available=2)
+            for i in range(2)
+        ]
+        cls.users = [User.objects.create_user(f'stat{i}', password='pass') for i in range(2)]
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(model.objects.values_list(*fields))
+            for model, fields in (
+                (DailyBorrowStat, ('date', 'borrow_count', 'return_count')),
+                (BookBorrowStat, ('book_id', 'borrow_count')),
+                (CategoryBorrowStat, ('category_id', 'borrow_count')),
+                (UserBorrowStat, ('user_id', 'borrow_count')),
+            )
+        }
+
+    def test_incremental_matches_rebuild(self):
+        for user in self.users:
+            for book in self.books:
+                circulation.borrow_book(user, book)
+        circulation.return_book(self.users[0], self.books[0])
+        circulation.return_book(self.users[0], self.books[1])
+        circulation.borrow_book(self.users[0], self.books[1])
+
+        today = timezone.localdate()
+        incremental = self.snapshot()
+        self.assertEqual(incremental['DailyBorrowStat'], [(today, 5, 2)])
+        self.assertEqual(incremental['BookBorrowStat'], [(self.books[0].pk, 2), (self.books[1].pk, 3)])
+        self.assertEqual(incremental['CategoryBorrowStat'], [(self.category.pk, 3)])
+        self.assertEqual(incremental['UserBorrowStat'], [(self.users[0].pk, 3), (self.users[1].pk, 2)])
+
+        result = rollups.rebuild()
+        self.assertEqual(result, {'days': 1, 'books': 2, 'categories': 1, 'users': 2})
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_rebuild_repairs_drift(self):
+        circulation.borrow_book(self.users[0], self.books[0])
+        expected = self.snapshot()
+        BookBorrowStat.objects.update(borrow_count=10)
+        DailyBorrowStat.objects.all().delete()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), expected)
+        # 重建后继续增量累加
+        circulation.return_book(self.users[0], self.books[0])
+        self.assertEqual(DailyBorrowStat.objects.get().return_count, 1)
+
+
+class UnreadCounterTests(TestCase):
+    """未读计数随通知创建、标记已读/未读增减，缓存在提交后清除"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'unread{i}', password='pass') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def counter(self, user):
+        return NotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).first()
+
+    def notify(self, user, n=1):
+        for i in range(n):
+            Notification.objects.create(recipient=user, notification_type='system', title=f'通知 {i}', message='内容')
+
+    def test_adjust_only_existing_counters(self):
+        self.notify(self.users[0], 2)
+        self.assertEqual(get_unread_count(self.users[0]), 2)
+        self.notify(self.users[1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.adjust_unread_counts({self.users[0].pk: 3, self.users[1].pk: 1, self.users[2].pk: 0})
+        self.assertEqual(self.counter(self.users[0]), 5)
+        # 没有计数行的用户不建立计数行，读取时按实际数量建立
+        self.assertIsNone(self.counter(self.users[1]))
+        self.assertIsNone(cache.get(notifications.unread_cache_key(self.users[0].pk)))
+        self.assertEqual(get_unread_count(self.users[1]), 1)
+
+    def test_set_read_state(self):
+        for user in self.users[:2]:
+            self.notify(user, 3)
+            get_unread_count(user)
+        queryset = Notification.objects.filter(recipient__in=self.users[:2])
+        first = queryset.filter(recipient=self.users[0]).order_by('id').first()
+        Notification.objects.filter(pk=first.pk).update(is_read=True)
+        NotificationCounter.objects.filter(user=self.users[0]).update(unread_count=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notifications.set_read_state(queryset, True), 5)
+        self.assertEqual((self.counter(self.users[0]), self.counter(self.users[1])), (0, 0))
+        # 已经是已读的不重复计算
+        self.assertEqual(notifications.set_read_state(queryset, True), 0)
+        self.assertEqual(get_unread_count(self.users[0]), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notifications.set_read_state(queryset.filter(recipient=self.users[1]), False), 3)
+        self.assertEqual((self.counter(self.users[0]), self.counter(self.users[1])), (0, 3))
+        self.assertEqual(get_unread_count(self.users[1]), 3)
+
+    def test_notification_before_counter_created_is_counted(self):
+        # 计数行建立前提交的通知：adjust_unread_counts 找不到计数行，由建立计数行时的计数包含
+        get_or_create = NotificationCounter.objects.get_or_create
+
+        def notified_first(*args, **kwargs):
+            create_notification(self.users[0], 'system', '通知', '内容')
+            return get_or_create(*args, **kwargs)
+
+        with mock.patch.object(NotificationCounter.objects, 'get_or_create', side_effect=notified_first):
+            self.assertEqual(get_unread_count(self.users[0]), 1)
+        self.assertEqual(self.counter(self.users[0]), 1)
+
+    def test_adjustment_between_read_and_cache_fill(self):
+        get_unread_count(self.users[0])
+        cache.clear()
+        read_counter = notifications.read_counter
+
+        def adjusted_after_read(user_id):
+            count = read_counter(user_id)
+            mocked.side_effect = read_counter
+            # 其他请求的新通知在读取计数行之后提交，提交后的清除缓存早于本次回填
+            with self.captureOnCommitCallbacks(execute=True):
+                create_notification(self.users[0], 'system', '通知', '内容')
+            return count
+
+        with mock.patch.object(notifications, 'read_counter', side_effect=adjusted_after_read) as mocked:
+            self.assertEqual(get_unread_count(self.users[0]), 1)
+        self.assertIn(cache.get(notifications.unread_cache_key(self.users[0].pk)), (None, 1))
+        self.assertEqual(get_unread_count(self.users[0]), 1)
+
+
+class RequestProfilingTests(TestCase):
+    """请求统计默认关闭，打开后才返回 Server-Timing"""
+
+    def test_disabled_by_default(self):
+        with self.settings(DEBUG=False, REQUEST_PROFILING={}):
+            response = self.client.get(reverse('login'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_enabled(self):
+        with self.settings(DEBUG=False, REQUEST_PROFILING={'ENABLED': True}):
+            response = self.client.get(reverse('login'))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class AdminMessageAccessTests(TestCase):
+    """消息管理的接口与页面一样只对管理员开放"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('viewer', email='viewer@example.com', password='pass')
+        cls.user.user_permissions.add(Permission.objects.get(codename='view_user'))
+        cls.staff = User.objects.create_user('staffer', password='pass', is_staff=True)
+        cls.staff.user_permissions.add(Permission.objects.get(codename='view_user'))
+
+    def test_non_staff_rejected(self):
+        self.client.force_login(self.user)
+        for name in ('admin_message_list', 'admin_user_search', 'admin_broadcast_progress'):
+            response = self.client.get(reverse(name), {'q': 'view'})
+            self.assertRedirects(response, reverse('index'), fetch_redirect_response=False)
+
+    def test_staff_search(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin_user_search'), {'q': 'view'})
+        self.assertEqual([row['username'] for row in response.json()['results']], ['viewer'])
+
+
+class BenchmarkPercentileTests(TestCase):
+    """各基准测试命令共用的分位数"""
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(values, 0.5), 50)
+        self.assertEqual(benchmarks.percentile(values, 0.95), 95)
+        self.assertEqual(benchmarks.percentile(values, 0.99), 99)
+        self.assertEqual(benchmarks.percentile(reversed(values), 1.0), 100)
+
+    def test_small_samples(self):
+        self.assertEqual(benchmarks.percentile([3, 1, 2], 0.95), 3)
+        self.assertEqual(benchmarks.percentile(list(range(1, 21)), 0.95), 19)
+        self.assertEqual(benchmarks.percentile([7], 0.0), 7)
+
+
+class CategoryTreeTests(TestCase):
+    """分类树：移动分类时更新整棵子树的物化路径，其他进程的修改通过数据库中的版本号失效"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shelver', password='pass')
+        cls.science = Category.objects.create(name='科学', code='N')
+        cls.physics = Category.objects.create(name='物理', code='O4', parent=cls.science)
+        cls.optics = Category.objects.create(name='光学', code='O43', parent=cls.physics)
+        cls.arts = Category.objects.create(name='艺术', code='J')
+        cls.books = {
+            category.code: Book.objects.create(
+                title=f'{category.name}导论', author='作者', isbn=f'97865000000{i:02d}',
+                category=category, quantity=1, available=1,
+            )
+            for i, category in enumerate([cls.science, cls.physics, cls.optics, cls.arts])
+        }
+
+    def setUp(self):
+        category_tree.invalidate()
+
+    def listed(self, category):
+        response = self.client.get(reverse('book_list'), {'category': category.pk, 'page_size': 50})
+        self.assertEqual(response.status_code, 200)
+        return {book.pk for book in response.context['books']}
+
+    def test_move_updates_subtree_paths(self):
+        self.assertEqual(Category.objects.get(pk=self.optics.pk).path,
+                         f'/{self.science.pk}/{self.physics.pk}/{self.optics.pk}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.physics.parent = self.arts
+            self.physics.save()
+        optics = Category.objects.get(pk=self.optics.pk)
+        self.assertEqual(optics.path, f'/{self.arts.pk}/{self.physics.pk}/{self.optics.pk}/')
+        self.assertEqual(optics.depth, 2)
+        self.assertEqual(optics.get_full_path(), '艺术 > 物理 > 光学')
+
+        # 不能移动到自己的子树下
+        physics = Category.objects.get(pk=self.physics.pk)
+        physics.parent = optics
+        with self.assertRaises(ValueError), transaction.atomic():
+            physics.save()
+
+    def test_book_list_filters_subtree(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.listed(self.science), {self.books[code].pk for code in ('N', 'O4', 'O43')})
+        self.assertEqual(self.listed(self.physics), {self.books[code].pk for code in ('O4', 'O43')})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.physics.parent = self.arts
+            self.physics.save()
+        self.assertEqual(self.listed(self.science), {self.books['N'].pk})
+        self.assertEqual(self.listed(self.arts), {self.books[code].pk for code in ('J', 'O4', 'O43')})
+
+    def test_change_in_other_process_invalidates_tree(self):
+        tree = category_tree.get_tree()
+        self.assertEqual(tree.full_path(self.optics.pk), '科学 > 物理 > 光学')
+
+        # 其他进程改名并提交：不经过本进程的信号，只更新了数据库中的版本号
+        Category.objects.filter(pk=self.physics.pk).update(name='物理学')
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.touch(Category)
+        # 间隔内不重复读版本号
+        with self.assertNumQueries(0):
+            self.assertIs(category_tree.get_tree(), tree)
+        with mock.patch.object(category_tree, 'VERSION_CHECK_INTERVAL', 0):
+            self.assertEqual(category_tree.get_tree().full_path(self.optics.pk), '科学 > 物理学 > 光学')
+            self.assertIn((self.optics.pk, '科学 > 物理学 > 光学'), category_tree.category_choices())
+
+
+class SearchTests(TestCase):
+    """倒排索引检索"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [
+            Book.objects.create(title=f'Python 编程 {i}', author='作者', isbn=f'97866000000{i:02d}', quantity=1, available=1)
+            for i in range(12)
+        ]
+
+    def test_tokenize(self):
+        # 中文建索引时产出单字和双字，查询时只用双字
+        self.assertEqual(search.tokenize('数据库'), {'数', '据', '库', '数据', '据库'})
+        self.assertEqual(search.tokenize('数据库', for_query=True), {'数据', '据库'})
+        self.assertEqual(search.tokenize('书', for_query=True), {'书'})
+        # 单词建索引时产出全部前缀，ISBN 中的连字符去掉
+        self.assertEqual(search.tokenize('Django'), {'dj', 'dja', 'djan', 'djang', 'django'})
+        self.assertEqual(search.tokenize('978-7-111', for_query=True), {'9787111'})
+        self.assertEqual(search.tokenize('Python 入门', for_query=True), {'python', '入门'})
+        self.assertEqual(search.tokenize('!!!', for_query=True), set())
+        self.assertEqual(len(max(search.tokenize('a' * 40), key=len)), search.MAX_TERM_LENGTH)
+
+    def test_prefix_and_isbn_match(self):
+        self.assertEqual(search.search_books('pyth').count(), 12)
+        self.assertEqual(list(search.search_books('9786600000003')), [self.books[3]])
+        self.assertEqual(search.search_books('978-6600').count(), 12)
+        # 所有检索词都要命中
+        self.assertFalse(search.search_books('python 数据').exists())
+
+    def test_ranking_by_field_weight(self):
+        in_title = Book.objects.create(title='算法导论', author='某人', isbn='9786610000001', quantity=1, available=1)
+        in_author = Book.objects.create(title='随笔', author='算法爱好者', isbn='9786610000002', quantity=1, available=1)
+        results = list(search.search_books('算法'))
+        self.assertEqual(results, [in_title, in_author])
+        self.assertGreater(results[0].search_score, results[1].search_score)
+
+    def test_reindex_on_save_and_delete(self):
+        book = self.books[0]
+        book.title = '机器学习'
+        book.save()
+        self.assertIn(book, search.search_books('机器学习'))
+        self.assertNotIn(book, search.search_books('python'))
+        # 只改库存时不重建索引
+        with mock.patch.object(search, 'index_book') as index_book:
+            book.available = 0
+            book.save(update_fields=['available'])
+        index_book.assert_not_called()
+
+        book.delete()
+        self.assertFalse(BookSearchTerm.objects.filter(book_id=self.books[0].pk).exists())
+        self.assertFalse(search.search_books('机器学习').exists())
+
+    def test_migration_backfills_existing_books(self):
+        from importlib import import_module
+        from django.apps import apps
+        backfill = import_module('books.migrations.0020_backfill_search_terms').backfill_search_terms
+
+        expected = set(BookSearchTerm.objects.values_list('book_id', 'term', 'weight'))
+        BookSearchTerm.objects.filter(book__in=self.books[:5]).delete()
+        self.assertEqual(search.search_books('python').count(), 7)
+        backfill(apps, None)
+        self.assertEqual(set(BookSearchTerm.objects.values_list('book_id', 'term', 'weight')), expected)
+
+    def test_broad_term_keeps_all_matches(self):
+        # 倒排链长度超过估算上限时也返回全部匹配
+        with mock.patch.object(search, 'MAX_CANDIDATES', 5):
+            self.assertEqual(search.search_books('python').count(), 12)
+            self.assertEqual(search.search_books('python 编程').count(), 12)
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class RunBenchmarksTests(TransactionTestCase):
+    """run_benchmarks 的请求逐个提交，on_commit 回调照常执行"""
+
+    def setUp(self):
+        self.books = [
+            Book.objects.create(title=f'基准 {i}', author='作者', isbn=f'97867000000{i:02d}', quantity=2, available=2)
+            for i in range(6)
+        ]
+        # 借还书视图需要 books.borrow_book 等权限
+        self.heavy = User.objects.create_superuser('heavy', password='pass')
+        recent = User.objects.create_user('recent', password='pass')
+        for book in self.books[:2]:
+            circulation.borrow_book(self.heavy, book)
+        circulation.borrow_book(recent, self.books[2])
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('run_benchmarks', '--iterations', '2', '--warmup', '0', *args, stdout=out, stderr=io.StringIO())
+        return json.loads(out.getvalue())
+
+    def test_picks_reader_with_most_borrowings(self):
+        from books.management.commands.run_benchmarks import Command
+        self.assertEqual(Command().pick_user(None), self.heavy)
+
+    def test_write_scenarios(self):
+        self.assertEqual(self.run_command('--scenario', 'borrow_book')['scenarios'], {})
+
+        stock = dict(Book.objects.values_list('id', 'available'))
+        versions = caching.get_versions([Book])
+        report = self.run_command('--scenario', 'borrow_book', '--scenario', 'profile', '--allow-writes')
+        self.assertEqual(report['scenarios']['borrow_book']['status_codes'], {'302': 2})
+        # 借书在请求中提交，缓存版本号随之更新
+        self.assertGreater(caching.get_versions([Book]), versions)
+        # 没有被还书场景归还的图书在结束时归还
+        self.assertEqual(dict(Book.objects.values_list('id', 'available')), stock)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['localhost'], DATABASE_REPLICATION={'REPLICAS': ['replica'], 'STICKY_SECONDS': 15},
+    # 会话存在 Cookie 中，命令里登录后不必再把会话复制到副本
+    SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+)
+class CheckQueryPlansTests(TransactionTestCase):
+    """check_query_plans 不包外层事务，只读视图的查询在副本上 EXPLAIN"""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        replicas.health.reset()
+        category = Category.objects.create(name='计划')
+        self.book = Book.objects.create(
+            title='执行计划', author='作者', isbn='9786800000001', quantity=2, available=2, category=category,
+        )
+        self.user = User.objects.create_superuser('planner', password='pass')
+        for obj in (category, self.book, self.user):
+            obj.save(using='replica')
+
+    def run_command(self, *args):
+        out = io.StringIO()
+        call_command('check_query_plans', '--username', 'planner', *args, stdout=out)
+        return out.getvalue()
+
+    def test_reports_index_per_query(self):
+        output = self.run_command()
+        self.assertIn('没有发现大表的全表扫描', output)
+        # 只读视图的查询在副本上执行，也在副本上 EXPLAIN，并列出使用的索引
+        self.assertIn('[book_detail@replica] books_book: PRIMARY KEY', output)
+        self.assertIn('[api_books@replica] books_book: book_created_id_idx', output)
+        self.assertIn('[my_borrowings@default] books_bookborrowing: borrowing_borrower_date_idx', output)
+        # 默认不运行会写数据库的场景
+        self.assertNotIn('[borrow_book@', output)
+        self.assertFalse(BookBorrowing.objects.exists())
+
+    def test_write_scenarios(self):
+        output = self.run_command('--allow-writes')
+        self.assertIn('[borrow_book@default]', output)
+        self.assertIn('[return_book@default]', output)
+        # 借书和还书都已提交，库存恢复原样
+        self.assertTrue(BookBorrowing.objects.filter(book=self.book, returned=True).exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available, 2)
+
+
+class ImportBooksTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.category = Category.objects.create(name='文学', code='LIT')
+        self.existing = Book.objects.create(
+            title='旧书', author='作者', isbn='9787100000001', quantity=2, available=1,
+        )
+
+    def write(self, name, content):
+        path = f'{self.tmpdir}/{name}'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_command(self, path, *args):
+        out = io.StringIO()
+        call_command('import_books', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_upsert_by_isbn(self):
+        path = self.write('books.csv', (
+            'isbn,title,author,category,quantity\n'
+            '978-7100000001,,,,3\n'
+            '9787100000002,新书,新作者,LIT,2\n'
+            '9787100000002,,,,1\n'
+        ))
+        output = self.run_command(path)
+        self.assertIn('读取 3 行：新增 1，更新 1，拒绝 0', output)
+
+        # 已有图书在原数量上增加，借出的册数不变
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.quantity, self.existing.available), (5, 4))
+        # 同一批中重复的 ISBN 合并，数量相加
+        book = Book.objects.get(isbn='9787100000002')
+        self.assertEqual((book.title, book.category, book.quantity, book.available), ('新书', self.category, 3, 3))
+
+        path = self.write('set.csv', 'isbn,quantity\n9787100000001,4\n')
+        self.run_command(path, '--quantity-mode', 'set')
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.quantity, self.existing.available), (4, 3))
+
+    def test_rejects(self):
+        path = self.write('books.csv', (
+            'isbn,title,author,category,quantity\n'
+            ',无 ISBN,作者,,1\n'
+            '9787100000003,书名,作者,,两本\n'
+            '9787100000004,书名,作者,NONE,1\n'
+            '9787100000005,只有书名,,,1\n'
+            '9787100000006,可以导入,作者,,1\n'
+        ))
+        output = self.run_command(path)
+        self.assertIn('新增 1，更新 0，拒绝 4', output)
+        self.assertEqual(Book.objects.filter(isbn='9787100000006').count(), 1)
+
+        with open(f'{path}.rejects.csv', encoding='utf-8') as f:
+            errors = {row['isbn']: row['_error'] for row in csv.DictReader(f)}
+        self.assertEqual(errors, {
+            '': '缺少 ISBN',
+            '9787100000003': '数量不是整数：两本',
+            '9787100000004': '分类编码不存在：NONE',
+            '9787100000005': '新图书缺少书名或作者',
+        })
+
+        path = self.write('books.jsonl', '{"isbn": "9787100000007", "title": "书", "author": "作者"}\nnot json\n[1]\n')
+        output = self.run_command(path)
+        self.assertIn('新增 1，更新 0，拒绝 2', output)
+        with open(f'{path}.rejects.jsonl', encoding='utf-8') as f:
+            rejects = [json.loads(line) for line in f]
+        self.assertEqual([row['_raw'] for row in rejects], ['not json', '[1]'])
+
+    def test_indexes_each_batch(self):
+        path = self.write('books.csv', 'isbn,title,author\n' + ''.join(
+            f'97871000001{i:02d},检索{i},作者\n' for i in range(3)
+        ))
+        with mock.patch.object(search, 'index_books', wraps=search.index_books) as index_books:
+            output = self.run_command(path, '--batch-size', '2')
+        # 每批在自己的事务中建立索引
+        self.assertEqual([len(call.args[0]) for call in index_books.call_args_list], [2, 1])
+        self.assertIn('其中检索索引：3 本图书', output)
+        self.assertEqual(search.search_books('检索').count(), 3)
+
+        path = self.write('more.csv', 'isbn,title,author\n9787100000200,不建索引,作者\n')
+        output = self.run_command(path, '--no-index')
+        self.assertNotIn('其中检索索引', output)
+        self.assertFalse(BookSearchTerm.objects.filter(book__isbn='9787100000200').exists())
+
+    def test_reports_rate(self):
+        path = self.write('books.csv', 'isbn,quantity\n' + ''.join(f'97871000000{i:02d},1\n' for i in range(1, 5)))
+        timer = 'books.management.commands.import_books.time.perf_counter'
+        with mock.patch(timer, side_effect=[10.0, 12.0]):
+            output = self.run_command(path, '--no-index')
+        self.assertIn('读取 4 行', output)
+        self.assertIn('导入耗时 2.00 秒，2 行/秒', output)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='文学', code='LIT')
+        self.books = [
+            Book.objects.create(
+                title=f'导出 {i}', author='作者', isbn=f'97872000000{i:02d}', quantity=2, available=2,
+                category=self.category if i == 0 else None,
+            )
+            for i in range(3)
+        ]
+        self.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        self.reader = User.objects.create_user('reader', password='pass')
+        now = timezone.now()
+        self.borrowings = []
+        for book, (day, due, returned) in zip(self.books, [
+            (5, now + timedelta(days=7), False),
+            (10, now - timedelta(days=1), False),
+            (20, now - timedelta(days=1), True),
+        ]):
+            borrowing = BookBorrowing.objects.create(
+                book=book, borrower=self.reader, due_date=due, returned=returned,
+                status='returned' if returned else 'borrowed',
+            )
+            # borrowed_date 为 auto_now_add，创建后再改
+            BookBorrowing.objects.filter(pk=borrowing.pk).update(
+                borrowed_date=timezone.make_aware(datetime(2026, 1, day, 10))
+            )
+            self.borrowings.append(borrowing)
+        self.client.force_login(self.staff)
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_catalog_csv(self):
+        response = self.client.get(reverse('export_catalog'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="catalog-', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(self.content(response).decode('utf-8'))))
+        self.assertEqual(rows[0], [field.replace('__', '_') for field in exports.CATALOG_FIELDS])
+        self.assertEqual([row[1] for row in rows[1:]], [book.isbn for book in self.books])
+        self.assertEqual(rows[1][4:6], ['LIT', '文学'])
+        # 没有分类的图书输出空值，创建时间为 ISO 8601
+        self.assertEqual(rows[2][4:6], ['', ''])
+        self.assertEqual(rows[1][8], self.books[0].created_at.isoformat())
+
+    def test_borrowings_jsonl_with_filters(self):
+        def export(**params):
+            response = self.client.get(reverse('export_borrowings'), {'format': 'jsonl', **params})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+            return [json.loads(line) for line in self.content(response).decode('utf-8').splitlines()]
+
+        rows = export()
+        self.assertEqual([row['id'] for row in rows], [borrowing.pk for borrowing in self.borrowings])
+        self.assertEqual(rows[0]['book_title'], '导出 0')
+        self.assertEqual(rows[0]['borrower_username'], 'reader')
+        self.assertEqual([row['effective_status'] for row in rows], ['borrowed', 'overdue', 'returned'])
+
+        # 日期包含首尾两天
+        ids = [row['id'] for row in export(date_from='2026-01-05', date_to='2026-01-10')]
+        self.assertEqual(ids, [self.borrowings[0].pk, self.borrowings[1].pk])
+        ids = [row['id'] for row in export(date_from='2026-01-06')]
+        self.assertEqual(ids, [self.borrowings[1].pk, self.borrowings[2].pk])
+        # 逾期按应还时间判断
+        self.assertEqual([row['id'] for row in export(status='overdue')], [self.borrowings[1].pk])
+        self.assertEqual([row['id'] for row in export(status='borrowed')], [self.borrowings[0].pk])
+
+        response = self.client.get(reverse('export_borrowings'), {'date_from': '2026-02-01', 'date_to': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip(self):
+        plain = self.content(self.client.get(reverse('export_borrowings')))
+        response = self.client.get(reverse('export_borrowings'), {'gzip': 'on'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.csv.gz"'))
+        self.assertEqual(gzip.decompress(self.content(response)), plain)
+
+    def test_stream_in_chunks(self):
+        # 每批之后从上一批最后一行的 (borrowed_date, id) 之后继续，结果与一次读完相同
+        queryset = exports.borrowing_queryset()
+        fields = exports.BORROWING_FIELDS
+        expected = b''.join(exports.stream(queryset, fields, exports.BORROWING_ORDER))
+        with self.assertNumQueries(3):
+            chunked = b''.join(exports.stream(queryset, fields, exports.BORROWING_ORDER, chunk_size=2))
+        self.assertEqual(chunked, expected)
+
+    def test_staff_only(self):
+        self.client.force_login(self.reader)
+        for name in ('export_borrowings', 'export_catalog'):
+            self.assertRedirects(self.client.get(reverse(name)), reverse('index'), fetch_redirect_response=False)
+
+        self.client.logout()
+        response = self.client.get(reverse('export_catalog'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+
+
+def fresh_module(name):
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def async_urlconf():
+    """按 ASYNC_VIEWS=True 重新执行一遍 URL 配置，得到使用异步视图的 LibMange.urls
+
+    include('books.urls') 从 sys.modules 中取模块，books.urls 也要重新执行。
+    """
+    with override_settings(ASYNC_VIEWS=True):
+        with mock.patch.dict(sys.modules, {'books.urls': fresh_module('books.urls')}):
+            return fresh_module('LibMange.urls')
+
+
+class AsyncViewTests(TestCase):
+    """异步视图与 books.views 中的同名同步视图输出相同"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.async_urls = async_urlconf()
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='文学')
+        self.books = [
+            Book.objects.create(
+                title=f'异步 {i}', author='作者', isbn=f'97873000000{i:02d}', quantity=1, available=1,
+                category=self.category,
+            )
+            for i in range(3)
+        ]
+        self.user = User.objects.create_user('reader', password='pass')
+        circulation.borrow_book(self.user, self.books[0])
+        BookReservation.objects.create(book=self.books[0], reservationer=self.user, position=1)
+        create_notification(self.user, 'system', '通知', '内容')
+
+    def normalize(self, value):
+        if isinstance(value, (list, tuple)) or hasattr(value, 'object_list'):
+            return [self.normalize(item) for item in value]
+        return getattr(value, 'pk', value)
+
+    async def compare(self, url, keys, **params):
+        """同一个请求分别交给同步和异步视图，比较状态码、跳转地址和上下文"""
+        sync_response = await sync_to_async(self.client.get)(url, params)
+        await sync_to_async(cache.clear)()
+        with override_settings(ROOT_URLCONF=self.async_urls):
+            self.async_client.cookies = self.client.cookies
+            async_response = await self.async_client.get(url, params)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.get('Location'), sync_response.get('Location'))
+        for key in keys:
+            self.assertEqual(
+                self.normalize(async_response.context[key]), self.normalize(sync_response.context[key]), key
+            )
+        return async_response
+
+    def test_async_urlconf(self):
+        with override_settings(ROOT_URLCONF=self.async_urls):
+            self.assertIs(resolve(reverse('book_list')).func, async_views.book_list)
+            self.assertIs(resolve(reverse('index')).func, async_views.index)
+        self.assertIsNot(resolve(reverse('book_list')).func, async_views.book_list)
+
+    async def test_same_context(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        await self.compare(reverse('index'), ['total_books', 'total_categories', 'recent_books', 'popular_categories'])
+        await self.compare(reverse('book_list'), ['books', 'category_version'])
+        await self.compare(reverse('book_list'), ['books'], search_query='异步')
+        await self.compare(reverse('book_list'), ['books'], category=self.category.pk)
+        await self.compare(reverse('book_detail', args=[self.books[1].pk]), ['book', 'related_books'])
+        # 没有可借副本时带上预约队列
+        await self.compare(
+            reverse('book_detail', args=[self.books[0].pk]), ['book', 'related_books', 'reservation', 'queue_length']
+        )
+        await self.compare(reverse('my_borrowings'), ['borrowings'])
+        await self.compare(reverse('notification_list'), ['notifications', 'unread_count'])
+
+    async def test_same_status_codes(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await self.compare(reverse('book_detail', args=[0]), [])
+        self.assertEqual(response.status_code, 404)
+        response = await self.compare(reverse('book_list'), [], cursor='invalid')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_login_redirect(self):
+        for name in ('book_list', 'my_borrowings', 'notification_list'):
+            response = await self.compare(reverse(name), [])
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+        response = await self.compare(reverse('book_detail', args=[self.books[0].pk]), [])
+        self.assertEqual(response.status_code, 302)
+        # 首页不需要登录
+        await self.compare(reverse('index'), ['total_books'])
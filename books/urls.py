@@ -1,12 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# 读多写少的页面在 ASGI 下使用异步实现
+read_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.book_list, name='book_list'),
-    path('book/<int:pk>/', views.book_detail, name='book_detail'),
+    path('', read_views.book_list, name='book_list'),
+    path('book/<int:pk>/', read_views.book_detail, name='book_detail'),
     path('book/<int:pk>/borrow/', views.borrow_book, name='borrow_book'),
     path('book/<int:pk>/return/', views.return_book, name='return_book'),
-    path('my-borrowings/', views.my_borrowings, name='my_borrowings'),
+    path('book/<int:pk>/reserve/', views.reserve_book, name='reserve_book'),
+    path('reservations/<int:pk>/cancel/', views.cancel_reservation, name='cancel_reservation'),
+    path('my-borrowings/', read_views.my_borrowings, name='my_borrowings'),
     path('statistics/', views.statistics_view, name='statistics'),
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
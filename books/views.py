@@ -3,50 +3,89 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth import login
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.utils import timezone
-from .models import Book, BookBorrowing, Category, BookReservation, Notification
-from .forms import BookSearchForm, RegisterForm, BorrowingForm, UserProfileForm
-from django.db.models import Count, F, Q
+from .models import (
+    Book, BookBorrowing, Category, BookReservation, Notification,
+    DailyBorrowStat, BookBorrowStat, CategoryBorrowStat, UserBorrowStat,
+    BroadcastMessage, UserProfile,
+)
+from .forms import BookSearchForm, RegisterForm, BorrowingForm, UserProfileForm, BroadcastForm, ExportForm
+from . import search, circulation, category_tree, broadcasts, caching, middleware, exports, reservations, live, dashboard, replicas, avatars, recommendations
+from .notifications import get_unread_count, refresh_unread_count, set_read_state
+from .pagination import paginate, wants_json, load_more_response
+from django.db.models import Count, F, Q, Sum
 from datetime import timedelta
 
 
 
-@login_required
-def book_list(request):
-    """图书列表视图"""
+# 图书卡片用到的列：不读取 description 等大字段，分类只 JOIN 出名称
+BOOK_CARD_FIELDS = ('id', 'title', 'author', 'quantity', 'available', 'created_at', 'update_at')
+
+
+def card_queryset(books):
+    """图书列表卡片的窄投影，卡片 HTML 的缓存见 templatetags.book_cards"""
+    return books.only(*BOOK_CARD_FIELDS).annotate(category_name=F('category__name'))
+
+
+def filter_books(form):
+    """按搜索表单过滤图书，返回 (查询集, 排序字段)"""
     books = Book.objects.all()
-    form = BookSearchForm(request.GET)
-    
+    ordering = ('-created_at', '-id')
     if form.is_valid():
         search_query = form.cleaned_data.get('search_query')
         category = form.cleaned_data.get('category')
         available_only = form.cleaned_data.get('available_only')
         
-        if search_query:
-            books = books.filter(
-                Q(title__icontains=search_query) |
-                Q(author__icontains=search_query) |
-                Q(isbn__icontains=search_query)
-            )
-        
         if category:
-            books = books.filter(category=category)
+            # 包含子分类中的图书：按物化路径范围查询
+            path = category_tree.get_tree().path(category)
+            if path:
+                books = books.filter(**category_tree.subtree_lookup(path, 'category__path'))
+            else:
+                books = books.none()
             
         if available_only:
             books = books.filter(available__gt=0)
-    
+
+        if search_query:
+            # 使用倒排索引检索，结果按相关度排序
+            books = search.search_books(search_query, books)
+            ordering = ('-search_score', '-id')
+    return books, ordering
+
+@replicas.read_replica
+@login_required
+def book_list(request):
+    """图书列表视图"""
+    form = BookSearchForm(request.GET)
+    books, ordering = filter_books(form)
+    page = paginate(request, card_queryset(books), ordering)
     context = {
-        'books': books,
+        'books': page,
+        'page': page,
         'form': form,
+        'category_version': category_tree.get_tree().version,
     }
+    if wants_json(request):
+        return load_more_response(request, page, 'books/_book_cards.html', context)
     return render(request, 'books/book_list.html', context)
 
+@replicas.read_replica
 @login_required
 def book_detail(request, pk):
     book = get_object_or_404(Book, pk=pk)
     context = {
         'book': book,
+        'related_books': list(recommendations.related_books(book)),
     }
+    if request.user.is_authenticated and book.available == 0:
+        # 没有可借副本时显示预约队列
+        context['reservation'] = BookReservation.objects.filter(
+            book=book, reservationer=request.user, status__in=BookReservation.ACTIVE_STATUSES
+        ).first()
+        context['queue_length'] = reservations.queue_length(book)
     return render(request, 'books/book_detail.html', context)
 
 @login_required
@@ -56,29 +95,13 @@ def borrow_book(request, pk):
     book = get_object_or_404(Book, pk=pk)
     if request.method == 'POST':
         form = BorrowingForm(request.POST)
-        if form.is_valid() and book.available > 0:
-            borrowing = form.save(commit=False)
-            borrowing.book = book
-            borrowing.borrower = request.user
-            
-            # 设置到期时间和状态
-            due_date = timezone.now() + timezone.timedelta(days=30)  # 默认借期30天
-            borrowing.due_date = due_date
-            borrowing.status = 'borrowed'
-            borrowing.save()
-            
-            book.available -= 1
-            book.save()
-            
-            # 创建借阅通知
-            create_notification(
-                user=request.user,
-                notification_type='borrow',
-                title=f'成功借阅《{book.title}》',
-                message=f'您已成功借阅《{book.title}》，请在 {due_date.strftime("%Y-%m-%d")} 前归还。',
-                related_book=book
-            )
-            
+        if form.is_valid():
+            try:
+                circulation.borrow_book(request.user, book)
+            except circulation.BookUnavailable:
+                messages.error(request, f'《{book.title}》暂无可借副本')
+                return redirect('book_detail', pk=pk)
+
             messages.success(request, f'成功借阅《{book.title}》')
             return redirect('book_detail', pk=pk)
     else:
@@ -94,47 +117,51 @@ def borrow_book(request, pk):
 @permission_required('books.return_book', raise_exception=True)
 def return_book(request, pk):
     """还书视图"""
-    borrowing = get_object_or_404(
-        BookBorrowing,
-        book_id=pk,
-        borrower=request.user,
-        returned=False
-    )
-    
-    # 检查是否逾期
-    if borrowing.due_date and borrowing.due_date < timezone.now():
-        create_notification(
-            user=request.user,
-            notification_type='overdue',
-            title='图书逾期提醒',
-            message=f'您归还的《{borrowing.book.title}》已逾期，请注意按时还书。',
-            related_book=borrowing.book
-        )
-    else:
-        create_notification(
-            user=request.user,
-            notification_type='return',
-            title='图书归还成功',
-            message=f'您已成功归还《{borrowing.book.title}》，欢迎下次借阅。',
-            related_book=borrowing.book
-        )
-    
-    borrowing.returned = True
-    borrowing.return_date = timezone.now()
-    borrowing.status = 'returned'
-    borrowing.save()
-
-    book = borrowing.book
-    book.available += 1
-    book.save()
+    book = get_object_or_404(Book, pk=pk)
+    try:
+        circulation.return_book(request.user, book)
+    except circulation.NotBorrowed:
+        raise Http404('没有找到该图书的借阅记录')
 
     messages.success(request, f'您已成功归还《{book.title}》')
     return redirect('book_detail', pk=pk)
 
+@login_required
+@permission_required('books.reserve_book', raise_exception=True)
+def reserve_book(request, pk):
+    """预约视图：加入图书的排队队列"""
+    book = get_object_or_404(Book, pk=pk)
+    if request.method == 'POST':
+        try:
+            reservation = reservations.reserve(request.user, book)
+        except reservations.NotReservable as e:
+            messages.error(request, str(e))
+        except reservations.AlreadyReserved:
+            messages.error(request, f'您已预约《{book.title}》')
+        else:
+            messages.success(request, f'预约成功，您排在第 {reservation.queue_position()} 位')
+    return redirect('book_detail', pk=pk)
+
+@login_required
+def cancel_reservation(request, pk):
+    """取消预约"""
+    if request.method == 'POST':
+        try:
+            reservation = reservations.cancel(request.user, pk)
+        except reservations.NoReservation:
+            raise Http404('没有找到该预约')
+        messages.success(request, f'已取消对《{reservation.book.title}》的预约')
+        return redirect('book_detail', pk=reservation.book_id)
+    return redirect('profile')
+
 @login_required
 def my_borrowings(request):
-    borrowings = BookBorrowing.objects.filter(borrower=request.user).order_by('-borrowed_date')
-    return render(request, 'accounts/my_borrowings.html', {'borrowings':borrowings})
+    borrowings = BookBorrowing.objects.filter(borrower=request.user).select_related('book')
+    page = paginate(request, borrowings, ('-borrowed_date', '-id'))
+    context = {'borrowings': page, 'page': page}
+    if wants_json(request):
+        return load_more_response(request, page, 'accounts/_borrowing_rows.html', context)
+    return render(request, 'accounts/my_borrowings.html', context)
 
 def register(request):
     if request.method == 'POST':
@@ -151,28 +178,34 @@ def register(request):
         form = RegisterForm()
     return render(request, 'accounts/register.html', {'form': form})
 
-def index(request):
-    #get some datas
-    total_books = Book.objects.count() #int
-    total_categories = Category.objects.count() #int
-    recent_books = Book.objects.order_by('-id')[:6] # recent added six books
-    popular_categories = Category.objects.annotate(
-        book_count=Count('book')
-    ).order_by('-book_count')[:5] # most popular five categories
+# 首页和馆藏统计依赖的模型，任何一个变化都会使缓存失效
+SUMMARY_MODELS = (Book, Category, BookBorrowing)
 
-    context = {
-        'total_books': total_books,
-        'total_categories': total_categories,
-        'recent_books': recent_books,
-        'popular_categories': popular_categories,
+
+def index_data():
+    #get some datas
+    return {
+        'total_books': Book.objects.count(), #int
+        'total_categories': Category.objects.count(), #int
+        'recent_books': list(Book.objects.select_related('category').order_by('-id')[:6]), # recent added six books
+        'popular_categories': list(Category.objects.annotate(
+            book_count=Count('book')
+        ).order_by('-book_count')[:5]), # most popular five categories
     }
+
+@replicas.read_replica
+@caching.cached_view('index', SUMMARY_MODELS)
+def index(request):
+    context = caching.cached_data('index', SUMMARY_MODELS, index_data)
     return render(request, 'index.html', context)
 
-def library_status(request):
-    #获取图书统计信息
-    total_books = Book.objects.count()
-    available_books = Book.objects.filter(available__gt=0).count()
-    borrow_books = Book.objects.filter(available__lt=F('quantity')).count()
+def library_status_data():
+    #获取图书统计信息：一次聚合查询
+    book_counts = Book.objects.aggregate(
+        total_books=Count('id'),
+        available_books=Count('id', filter=Q(available__gt=0)),
+        borrowed_books=Count('id', filter=Q(available__lt=F('quantity'))),
+    )
 
     #获取各分类图书数量
     categories = Category.objects.annotate(
@@ -181,25 +214,45 @@ def library_status(request):
     ).order_by('-book_count')
 
     #获取借阅量最多的图书
-    popular_books = Book.objects.annotate(
-        borrow_count=Count('bookborrowing')
+    popular_books = BookBorrowStat.objects.select_related(
+        'book__category'
     ).order_by('-borrow_count')[:5]
 
-    #获取借阅统计信息
-    borrow_stats = BookBorrowing.objects.values('book_id').annotate(
-        borrow_count=Count('id')
-    ).order_by('-borrow_count')
+    #获取借阅统计信息（读取汇总表）
+    borrow_stats = BookBorrowStat.objects.values(
+        'book_id', 'borrow_count'
+    ).order_by('-borrow_count')[:20]
 
-    context = {
-        'total_books': total_books,
-        'available_books': available_books,
-        'borrow_books': borrow_books,
-        'categories': categories,
-        'popular_books': popular_books,
-        'borrow_stats': borrow_stats,
+    return {
+        **book_counts,
+        'categories': list(categories),
+        'popular_books': list(popular_books),
+        'borrow_stats': list(borrow_stats),
     }
+
+@replicas.read_replica
+@caching.cached_view('library_status', SUMMARY_MODELS)
+def library_status(request):
+    context = caching.cached_data('library_status', SUMMARY_MODELS, library_status_data)
     return render(request, 'books/library_stats.html', context)
+
+@login_required
+def cache_stats(request):
+    """视图缓存命中情况"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+    return JsonResponse(caching.get_stats(['index', 'library_status']))
+
+@login_required
+def request_stats(request):
+    """本进程内各视图的查询数和耗时统计"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+    return JsonResponse(middleware.request_stats.snapshot())
     
+@replicas.read_replica
 @login_required
 def statistics_view(request):
     """统计视图"""
@@ -207,38 +260,43 @@ def statistics_view(request):
     today = timezone.now().date()
     last_30_days = today - timedelta(days=30)
     
-    # 图书统计
+    # 图书统计：一次聚合查询
+    book_counts = Book.objects.aggregate(
+        total_books=Count('id'),
+        available_books=Count('id', filter=Q(available__gt=0)),
+        borrowed_books=Count('id', filter=Q(available__lt=F('quantity'))),
+    )
     book_stats = {
-        'total_books': Book.objects.count(),
+        'total_books': book_counts['total_books'],
         'total_categories': Category.objects.count(),
-        'available_books': Book.objects.filter(available__gt=0).count(),
-        'borrowed_books': Book.objects.filter(available__lt=F('quantity')).count(),
+        'available_books': book_counts['available_books'],
+        'borrowed_books': book_counts['borrowed_books'],
     }
     
-    # 借阅统计
+    # 借阅统计：读取每日汇总行
+    totals = DailyBorrowStat.objects.aggregate(
+        borrowed=Sum('borrow_count'),
+        returned=Sum('return_count'),
+        monthly=Sum('borrow_count', filter=Q(date__gte=last_30_days)),
+    )
+    total_borrowings = totals['borrowed'] or 0
+    outstanding = total_borrowings - (totals['returned'] or 0)
+    overdue_borrowings = BookBorrowing.objects.overdue().count()
     borrow_stats = {
-        'total_borrowings': BookBorrowing.objects.count(),
-        'active_borrowings': BookBorrowing.objects.filter(status='borrowed').count(),
-        'overdue_borrowings': BookBorrowing.objects.filter(status='overdue').count(),
-        'monthly_borrowings': BookBorrowing.objects.filter(
-            borrowed_date__date__gte=last_30_days
-        ).count(),
+        'total_borrowings': total_borrowings,
+        'active_borrowings': max(outstanding - overdue_borrowings, 0),
+        'overdue_borrowings': overdue_borrowings,
+        'monthly_borrowings': totals['monthly'] or 0,
     }
     
     # 分类借阅排行
-    category_stats = Category.objects.annotate(
-        borrow_count=Count('book__bookborrowing')
-    ).order_by('-borrow_count')[:5]
+    category_stats = CategoryBorrowStat.objects.select_related('category').order_by('-borrow_count')[:5]
     
     # 热门图书排行
-    popular_books = Book.objects.annotate(
-        borrow_count=Count('bookborrowing')
-    ).order_by('-borrow_count')[:5]
+    popular_books = BookBorrowStat.objects.select_related('book').order_by('-borrow_count')[:5]
     
     # 活跃读者排行
-    active_readers = User.objects.annotate(
-        borrow_count=Count('bookborrowing')
-    ).order_by('-borrow_count')[:5]
+    active_readers = UserBorrowStat.objects.select_related('user').order_by('-borrow_count')[:5]
 
     context = {
         'book_stats': book_stats,
@@ -251,44 +309,8 @@ def statistics_view(request):
 
 @login_required
 def profile_view(request):
-    """个人中心视图"""
-    # 获取用户借阅统计
-    user_stats = {
-        'total_borrowed': BookBorrowing.objects.filter(borrower=request.user).count(),
-        'current_borrowed': BookBorrowing.objects.filter(
-            borrower=request.user,
-            status='borrowed'
-        ).count(),
-        'overdue_books': BookBorrowing.objects.filter(
-            borrower=request.user,
-            status='overdue'
-        ).count()
-    }
-    
-    # 获取当前借阅
-    current_borrowings = BookBorrowing.objects.filter(
-        borrower=request.user,
-        status='borrowed'
-    ).order_by('due_date')
-    
-    # 获取借阅历史
-    borrow_history = BookBorrowing.objects.filter(
-        borrower=request.user,
-        status='returned'
-    ).order_by('-return_date')[:5]
-    
-    # 获取预约记录 - 修正字段名
-    reservations = BookReservation.objects.filter(
-        reservationer=request.user  
-    ).order_by('-reservation_date')[:5]
-
-    context = {
-        'user_stats': user_stats,
-        'current_borrowings': current_borrowings,
-        'borrow_history': borrow_history,
-        'reservations': reservations,
-    }
-    return render(request, 'accounts/profile.html', context)
+    """个人中心视图：借阅统计和列表按用户缓存，见 books.dashboard"""
+    return render(request, 'accounts/profile.html', dashboard.get_dashboard(request.user))
 
 @login_required
 def edit_profile(request):
@@ -297,55 +319,79 @@ def edit_profile(request):
         messages.error(request, '请先登录')
         return redirect('login')
 
+    profile = UserProfile.objects.filter(user=request.user).first() or UserProfile(
+        user=request.user, email=request.user.email,
+    )
     if request.method == 'POST':
-        form = UserProfileForm(request.POST, request.FILES, instance=request.user)
+        form = UserProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
             form.save()
+            dashboard.invalidate(request.user.pk)
             messages.success(request, '个人信息更新成功！')
             return redirect('profile')
     else:
-        form = UserProfileForm(instance=request.user)
+        form = UserProfileForm(instance=profile)
     
-    return render(request, 'accounts/edit_profile.html', {'form': form})
+    return render(request, 'accounts/edit_profile.html', {'form': form, 'profile': profile})
+
+def avatar(request, digest, name):
+    """头像缩略图；文件名包含内容哈希，内容不会变化，可以永久缓存"""
+    size, _, extension = name.partition('.')
+    if extension not in avatars.FORMATS or not size.isdigit() or int(size) not in avatars.SIZES:
+        raise Http404
+    try:
+        f = default_storage.open(avatars.variant_name(digest, int(size), extension), 'rb')
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(f, content_type=avatars.FORMATS[extension][1])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @login_required
 def notification_list(request):
     """通知列表视图"""
-    notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
-    unread_count = notifications.filter(is_read=False).count()
-    
+    notifications = Notification.objects.filter(recipient=request.user)
+    page = paginate(request, notifications, ('-created_at', '-id'))
     context = {
-        'notifications': notifications,
-        'unread_count': unread_count,
+        'notifications': page,
+        'page': page,
     }
+    if wants_json(request):
+        return load_more_response(request, page, 'notifications/_notification_items.html', context)
+
+    context['unread_count'] = get_unread_count(request.user)
     return render(request, 'notifications/notification_list.html', context)
 
+@login_required
+def notification_stream(request):
+    """实时推送新通知和未读数（Server-Sent Events），断线重连时按 Last-Event-ID 续传"""
+    stream = live.NotificationStream(request.user, request.headers.get('Last-Event-ID'))
+    return live.event_stream_response(request, stream)
+
+@login_required
+def unread_notification_count(request):
+    """WSGI 下页面轮询的未读数，读计数行而不是本进程的缓存"""
+    response = JsonResponse({'count': refresh_unread_count(request.user)})
+    response['Cache-Control'] = 'no-store'
+    return response
+
 @login_required
 def mark_notification_read(request, pk):
     """标记单个通知为已读"""
-    notification = get_object_or_404(Notification, pk=pk, recipient=request.user)
-    notification.is_read = True
-    notification.save()
+    notifications = Notification.objects.filter(pk=pk, recipient=request.user)
+    if not notifications.exists():
+        raise Http404('通知不存在')
+    set_read_state(notifications, is_read=True)
     return redirect('notification_list')
 
 @login_required
 def mark_all_notifications_read(request):
     """标记所有通知为已读"""
     if request.method == 'POST':
-        Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        set_read_state(Notification.objects.filter(recipient=request.user), is_read=True)
         messages.success(request, '所有通知已标记为已读')
     return redirect('notification_list')
 
-def create_notification(user, notification_type, title, message, related_book=None):
-    """创建通知的辅助函数"""
-    Notification.objects.create(
-        recipient=user,
-        notification_type=notification_type,
-        title=title,
-        message=message,
-        related_book=related_book
-    )
-
 @login_required
 @permission_required('books.manage_books', raise_exception=True)
 def manage_books(request):
@@ -401,35 +447,128 @@ def admin_notification_list(request):
 @login_required
 @permission_required('auth.view_user', raise_exception=True)
 def admin_message_list(request):
-    """消息管理视图"""
+    """消息管理视图
+
+    提交后只保存一条群发记录，send_broadcasts 命令在后台分批把通知写入发件箱，
+    再由 run_notification_worker 投递。
+    """
     if not request.user.is_staff:
         messages.error(request, '您没有权限访问此页面')
         return redirect('index')
-        
-    system_messages = Notification.objects.filter(notification_type='system').order_by('-created_at')
-    
+
     if request.method == 'POST':
-        title = request.POST.get('title')
-        message = request.POST.get('message')
-        recipients = request.POST.getlist('recipients')
-        
-        for user_id in recipients:
-            user = User.objects.get(id=user_id)
-            create_notification(
-                user=user,
-                notification_type='system',
-                title=title,
-                message=message
-            )
-        messages.success(request, '消息发送成功！')
-        return redirect('admin_message_list')
-    
+        form = BroadcastForm(request.POST)
+        if form.is_valid():
+            broadcast = form.save(commit=False)
+            broadcast.sender = request.user
+            broadcast.save()
+            form.save_m2m()
+            messages.success(request, '消息已提交，正在后台发送')
+            return redirect('admin_message_list')
+    else:
+        form = BroadcastForm()
+
+    recent_broadcasts = list(
+        BroadcastMessage.objects.select_related('group', 'sender')[:20]
+    )
+    read_counts = broadcasts.read_counts(recent_broadcasts)
+    for broadcast in recent_broadcasts:
+        broadcast.read_count = read_counts.get(broadcast.pk, 0)
+
     context = {
-        'system_messages': system_messages,
-        'users': User.objects.all(),
+        'form': form,
+        'broadcasts': recent_broadcasts,
+        'groups': Group.objects.order_by('name'),
         'section': 'messages',
         'title': '消息管理',  # 添加标题
         'site_title': '图书管理系统',  # 添加站点标题
         'site_header': '图书管理系统后台',  # 添加站点头部
     }
     return render(request, 'admin/message_list.html', context)
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def admin_user_search(request):
+    """按用户名或邮箱前缀搜索用户，供消息接收者选择框异步加载"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        users = (
+            User.objects.filter(is_active=True)
+            .filter(Q(username__istartswith=query) | Q(email__istartswith=query))
+            .order_by('username')
+            .values('id', 'username', 'email')[:20]
+        )
+        results = list(users)
+    return JsonResponse({'results': results})
+
+@login_required
+@permission_required('auth.view_user', raise_exception=True)
+def admin_broadcast_progress(request):
+    """群发进度，消息管理页面定时轮询"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+
+    ids = [int(pk) for pk in request.GET.getlist('id') if pk.isdigit()]
+    return JsonResponse({
+        'broadcasts': [
+            {
+                'id': broadcast.pk,
+                'status': broadcast.status,
+                'status_display': broadcast.get_status_display(),
+                'sent_count': broadcast.sent_count,
+                'total_recipients': broadcast.total_recipients,
+                'progress': broadcast.progress,
+            }
+            for broadcast in BroadcastMessage.objects.filter(pk__in=ids)
+        ]
+    })
+
+def export_response(request, name, queryset, fields, order_by, form):
+    file_format = form.cleaned_data.get('format') or 'csv'
+    compress = form.cleaned_data.get('gzip')
+    filename = f'{name}-{timezone.localdate():%Y%m%d}.{file_format}'
+    if compress:
+        filename += '.gz'
+    response = StreamingHttpResponse(
+        exports.stream(queryset, fields, order_by, file_format, compress),
+        content_type='application/gzip' if compress else f'{exports.FORMATS[file_format]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def export_borrowings(request):
+    """流式导出借阅记录，支持按借阅日期和状态过滤"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    queryset = exports.borrowing_queryset(
+        date_from=form.cleaned_data.get('date_from'),
+        date_to=form.cleaned_data.get('date_to'),
+        status=form.cleaned_data.get('status'),
+    )
+    return export_response(
+        request, 'borrowings', queryset, exports.BORROWING_FIELDS, exports.BORROWING_ORDER, form
+    )
+
+@login_required
+def export_catalog(request):
+    """流式导出馆藏目录"""
+    if not request.user.is_staff:
+        messages.error(request, '您没有权限访问此页面')
+        return redirect('index')
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+    return export_response(
+        request, 'catalog', exports.catalog_queryset(), exports.CATALOG_FIELDS, exports.CATALOG_ORDER, form
+    )